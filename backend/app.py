@@ -12,55 +12,19 @@ from ai_tools import ai_bp
 import os
 import csv
 import pymysql
-from import_data import import_csv_to_mysql
+from import_data import sync_csv_directory, sync_fish_data_from_csv
 from dotenv import load_dotenv
-import pandas as pd
+from schema_migrations import upgrade_schema
+from water_rollups import ensure_rollups
+from water_anomalies import ensure_anomalies
+from water_parquet import ensure_mirror
+from water_sites import ensure_site_index
+from static_assets import static_assets
+import geo_tiers
+from water_analytics import analytics_bp
+from db_pool import init_pool_metrics, metrics_bp
 load_dotenv()
 
-from models import FishData  # 假设你的 FishData 类在 models.py 中
-
-def import_fish_data_from_csv(csv_file):
-    try:
-        # 使用 pandas 读取 CSV 文件
-        df = pd.read_csv(csv_file)
-
-        # 打印列名以检查是否有问题
-        print("CSV 列名:", df.columns)
-
-        # 去除列名中的空格和单位
-        df.columns = df.columns.str.replace(r'\(.*\)', '', regex=True).str.strip()
-
-        # 打印清理后的列名，确认修改效果
-        print("清理后的列名:", df.columns)
-
-        # 遍历每一行数据，并创建 FishData 实例
-        fish_data_list = []
-        for index, row in df.iterrows():
-            fish_data = FishData(
-                species=row['Species'],
-                weight=row['Weight'],
-                length1=row['Length1'],
-                length2=row['Length2'],
-                length3=row['Length3'],
-                height=row['Height'],
-                width=row['Width']
-            )
-            fish_data_list.append(fish_data)
-
-        # 将所有数据一次性添加到数据库中
-        db.session.bulk_save_objects(fish_data_list)  # 使用 bulk_save_objects 提高效率
-        db.session.commit()
-
-        print("鱼类数据已成功导入数据库！")
-
-    except Exception as e:
-        db.session.rollback()
-        print(f"导入数据时发生错误: {e}")
-
-
-
-
-
 # 创建Flask应用
 app = Flask(__name__)
 app.config.from_object(config)
@@ -68,20 +32,24 @@ CORS(app)
 
 # 初始化数据库
 db.init_app(app)
+init_pool_metrics(app)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # 创建一个初始化数据库并导入数据的函数
-# 创建一个初始化数据库并导入数据的函数
+# 表结构只在缺失时创建，数据按导入清单增量同步，不再每次启动都清空重导
 def init_db_and_import_data():
     with app.app_context():
         # 确保数据库表已经创建
         print("正在初始化数据库表...")
-        db.drop_all()  # 这会删除所有现有的表
-        db.create_all()  # 重新创建所有表
-
-        print("开始导入CSV数据...")
+        db.create_all()  # 只创建缺失的表，不影响已有数据
         # 使用 f-string 格式化路径，确保正确解析 BASE_DIR
         CSV_ROOT_DIRECTORY = f'{BASE_DIR}/data/WaterQualitybyDate'  # 替换为你实际的路径
+        upgrade_schema(db.engine, csv_root=CSV_ROOT_DIRECTORY)  # 在已有表上补齐新增的列和索引
+        ensure_rollups(db.engine)  # 汇总表为空时由已有数据重建一次
+        ensure_anomalies(db.engine)  # 异常检测状态为空时由已有数据计算一次
+        ensure_mirror(db.engine)  # 首次启用时生成 Parquet 镜像
+
+        print("开始导入CSV数据...")
         DB_CONFIG = {
             'host': 'localhost',
             'user': 'root',
@@ -91,8 +59,16 @@ def init_db_and_import_data():
         }
 
         # 调用导入CSV数据的函数
-        import_csv_to_mysql(CSV_ROOT_DIRECTORY, DB_CONFIG)
-        import_fish_data_from_csv(f'{BASE_DIR}/data/Fish.csv')  # 使用 f-string 格式化路径
+        sync_csv_directory(
+            CSV_ROOT_DIRECTORY, DB_CONFIG,
+            workers=config.IMPORT_WORKERS,
+            queue_size=config.IMPORT_QUEUE_SIZE,
+            batch_size=config.IMPORT_BATCH_SIZE
+        )
+        sync_fish_data_from_csv(f'{BASE_DIR}/data/Fish.csv')  # 使用 f-string 格式化路径
+        ensure_site_index(db.engine)  # 导入完成后建立断面层级和名称搜索索引
+        print(f"已生成 {geo_tiers.build_all()} 个简化地图文件")  # /data/china.json?detail=low 等
+        print(f"已预压缩 {static_assets.precompress_all()} 个静态文件")  # 地图等 /data 文件按 Accept-Encoding 发送压缩版本
 
 # 注册蓝图
 app.register_blueprint(auth_bp)
@@ -102,6 +78,8 @@ app.register_blueprint(weather_bp)
 app.register_blueprint(video_bp)
 app.register_blueprint(market_bp)
 app.register_blueprint(ai_bp)
+app.register_blueprint(analytics_bp)
+app.register_blueprint(metrics_bp)
 
 # 在启动Flask应用之前初始化数据库并导入数据
 if __name__ == '__main__':
@@ -10,6 +10,22 @@ from io import StringIO
 import shutil
 from models import WaterQualityData
 from models import FishData
+import codecs
+import time
+from datetime import datetime
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, NeedData, File, Field, Data, Epilogue
+import config
+import import_data
+from water_dims import dims, normalized_storage
+import water_rollups
+import water_parquet
+import db_pool
+import query_cache
+import water_classify
+import water_anomalies
+import water_snapshots
+from water_sites import site_index
 temp_dir = './temp'
 if not os.path.exists(temp_dir):
     os.makedirs(temp_dir)
@@ -145,58 +161,113 @@ def change_password():
 import csv
 from io import StringIO
 
-from time import sleep
 @auth_bp.route("/api/exportusers", methods=["GET"])
 def export_users():
     try:
-        # 从数据库获取所有用户
+        # 从数据库获取所有用户，在内存中生成 CSV 直接发送，不写临时文件
         users = User.query.all()
-        
-        # 创建 CSV 内容并存储在临时文件中
-        temp_file_path = './temp/users.csv'
-        with open(temp_file_path, 'w', newline='', encoding='utf-8') as output:
-            writer = csv.writer(output)
-            writer.writerow(['ID', '用户名', '角色'])  # 写入表头
-            for user in users:
-                writer.writerow([user.id, user.username, user.role])  # 写入用户数据
-
-        # 返回生成的 CSV 文件
-        return send_file(
-            temp_file_path,
-            as_attachment=True,
-            download_name="users.csv",
-            mimetype="text/csv"
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['ID', '用户名', '角色'])  # 写入表头
+        for user in users:
+            writer.writerow([user.id, user.username, user.role])  # 写入用户数据
+
+        return Response(
+            output.getvalue().encode('utf-8'),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=users.csv"}
         )
 
     except Exception as e:
         print(f"Error occurred while exporting users: {e}")
         return jsonify({"ok": False, "message": str(e)}), 500
 
-    finally:
-        # 等待下载完成后删除文件
-        try:
-            # 等待 1 秒，确保文件已被下载
-            sleep(20)
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-        except PermissionError:
-            print(f"PermissionError: Could not delete the file {temp_file_path}")
 
 
 
 
 
+def _dimension_fields(province, river_basin, section_name, category, status):
+    """
+    返回写入 WaterQualityData 的名称列和维度 id；规范化存储时名称列留空。
+    """
+    site_id, category_id, status_id = dims.encode_values(
+        db_pool.raw_connection, province, river_basin, section_name, category, status
+    )
+    keep_names = not normalized_storage()
+    return {
+        "province": province if keep_names else None,
+        "river_basin": river_basin if keep_names else None,
+        "section_name": section_name if keep_names else None,
+        "water_quality_category": category if keep_names else None,
+        "site_status": status if keep_names else None,
+        "site_id": site_id,
+        "category_id": category_id,
+        "status_id": status_id,
+    }
+
+
+def _rollup_key(item):
+    return (item.site_id, item.monitoring_at)
+
+
+def _refresh_rollups(*pairs):
+    """
+    在当前事务中重新计算 (site_id, 监测时间) 所在日期的日/月汇总，调用方负责提交。
+    返回汇总键，提交后交给 _after_commit。
+    """
+    db.session.flush()
+    keys = water_rollups.rollup_keys(pairs)
+    water_rollups.refresh_rollups(db.session.connection().connection.cursor(), keys)
+    return keys
+
+
+def _after_commit(keys, site_ids=()):
+    """
+    水质数据写入提交后更新 Parquet 镜像和按日快照，把新断面加入断面索引，并使涉及的断面的查询缓存失效。
+    site_ids 补充没有监测时间（不在汇总键中）的行所属的断面。
+    """
+    site_ids = {site_id for site_id, _ in keys} | set(site_ids)
+    water_parquet.sync_partitions(db_pool.raw_connection, keys)
+    water_snapshots.sync_snapshots(db_pool.raw_connection, keys)
+    site_index.add_sites(site_ids)
+    query_cache.invalidate_sites(site_ids)
+
+
+def _item_names(item, cursor):
+    """
+    取一条水质数据的省份/流域/断面/类别/站点情况名称；有维度 id 时从缓存转换，否则用名称列。
+    """
+    if item.site_id is None and item.category_id is None and item.status_id is None:
+        return {
+            "province": item.province,
+            "river_basin": item.river_basin,
+            "section_name": item.section_name,
+            "water_quality_category": item.water_quality_category,
+            "site_status": item.site_status,
+        }
+    return dims.decode(cursor, item.site_id, item.category_id, item.status_id)
+
 
 @auth_bp.route("/api/addwaterqualitydata", methods=["POST"])
 def add_water_quality_data():
     data = request.get_json()
     try:
+        # 没有给出水质类别时（例如传感器数据）按 GB3838-2002 评价
+        category = data.get("water_quality_category")
+        if not category:
+            classes, _ = water_classify.classify({name: [data.get(name)] for name in water_classify.EVALUATED_INDICATORS})
+            category = water_classify.labels(classes)[0]
         new_data = WaterQualityData(
-            province=data.get("province"),
-            river_basin=data.get("river_basin"),
-            section_name=data.get("section_name"),
+            **_dimension_fields(
+                data.get("province"),
+                data.get("river_basin"),
+                data.get("section_name"),
+                category,
+                data.get("site_status")
+            ),
             monitoring_time=data.get("monitoring_time"),
-            water_quality_category=data.get("water_quality_category"),
+            monitoring_at=import_data.parse_monitoring_time(data.get("monitoring_time")),
             temperature=data.get("temperature"),
             ph=data.get("ph"),
             dissolved_oxygen=data.get("dissolved_oxygen"),
@@ -207,18 +278,111 @@ def add_water_quality_data():
             total_phosphorus=data.get("total_phosphorus"),
             total_nitrogen=data.get("total_nitrogen"),
             chlorophyll_a=data.get("chlorophyll_a"),
-            algae_density=data.get("algae_density"),
-            site_status=data.get("site_status")
+            algae_density=data.get("algae_density")
         )
         db.session.add(new_data)
+        keys = _refresh_rollups(_rollup_key(new_data))
+        water_anomalies.observe_items(db.session.connection().connection.cursor(), [new_data])
         db.session.commit()
+        _after_commit(keys, [new_data.site_id])
         return jsonify({"ok": True, "message": "水质数据已添加"}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"ok": False, "message": str(e)}), 500
 
 
+# 上传请求体每次读取的字节数
+UPLOAD_READ_SIZE = 64 * 1024
+
+
+def _iter_multipart_csv_lines(stream, boundary, field_name="file"):
+    """
+    从 multipart 请求体中逐块读取名为 field_name 的文件字段，按行产出文本。
+    整个过程只保留当前数据块和未结束的半行，不会把上传文件缓存到内存或临时文件。
+    """
+    decoder = MultipartDecoder(boundary)
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    in_file = False
+    pending = ''
+    finished = False
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            if finished:
+                raise ValueError("上传数据不完整")
+            chunk = stream.read(UPLOAD_READ_SIZE)
+            finished = not chunk
+            decoder.receive_data(chunk or None)
+        elif isinstance(event, File):
+            in_file = event.name == field_name
+        elif isinstance(event, Field):
+            in_file = False
+        elif isinstance(event, Data) and in_file:
+            pending += text_decoder.decode(event.data, final=not event.more_data)
+            lines = pending.split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+            if not event.more_data:
+                if pending:
+                    yield pending
+                return
+        elif isinstance(event, Epilogue):
+            return
+
+
+@auth_bp.route("/api/uploadwaterqualitydata", methods=["POST"])
+def upload_water_quality_data():
+    """
+    以 multipart/form-data 上传水质CSV（file 字段，与导入脚本相同的17列格式），
+    边读取边转换，按批写入数据库，整个文件在一个事务中提交。
+    """
+    mimetype, options = parse_options_header(request.headers.get("Content-Type", ""))
+    boundary = options.get("boundary")
+    if mimetype != "multipart/form-data" or not boundary:
+        return jsonify({"ok": False, "message": "请使用 multipart/form-data 上传CSV文件"}), 400
+
+    source = f"upload:{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    stats = import_data.new_import_stats(source)
+    insert_failed = 0
+    keys = set()
+    start = time.perf_counter()
+    try:
+        lines = _iter_multipart_csv_lines(request.stream, boundary.encode())
+        cursor = db.session.connection().connection.cursor()
+        for batch in import_data.parse_csv_lines(lines, source, config.IMPORT_BATCH_SIZE, stats, source):
+            inserted, rejected = import_data.insert_batch(cursor, batch, db_pool.raw_connection, keys)
+            stats["rows"] += inserted
+            insert_failed += rejected
+        if stats["empty"]:
+            db.session.rollback()
+            return jsonify({"ok": False, "message": "上传的文件为空或缺少 file 字段"}), 400
+        water_rollups.refresh_rollups(cursor, keys)
+        water_anomalies.observe_source(cursor, source)
+        db.session.commit()
+        _after_commit(keys)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"ok": False, "message": str(e)}), 500
+
+    elapsed = time.perf_counter() - start
+    return jsonify({
+        "ok": True,
+        "message": "水质数据已上传",
+        "source": source,
+        "inserted": stats["rows"],
+        "rejected": {
+            "column_mismatch": stats["rejected"],
+            "insert_failed": insert_failed
+        },
+        "conversion_failures": stats["conversion_failures"],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(stats["rows"] / elapsed, 1) if elapsed > 0 else None
+    }), 201
+
+
 @auth_bp.route("/api/getwaterqualitydata", methods=["GET"])
+@query_cache.cached(lambda args: [query_cache.TABLE_TAG])
 def get_water_quality_data():
     try:
         # 获取分页参数，默认为第1页，每页20条数据
@@ -232,14 +396,12 @@ def get_water_quality_data():
         # 查询并分页
         data = WaterQualityData.query.paginate(page=page, per_page=per_page, error_out=False)
         
-        # 数据转换
+        # 数据转换，名称通过维度缓存还原
+        cursor = db.session.connection().connection.cursor()
         data_list = [{
             "id": item.id,
-            "province": item.province,
-            "river_basin": item.river_basin,
-            "section_name": item.section_name,
+            **_item_names(item, cursor),
             "monitoring_time": item.monitoring_time,
-            "water_quality_category": item.water_quality_category,
             "temperature": item.temperature,
             "ph": item.ph,
             "dissolved_oxygen": item.dissolved_oxygen,
@@ -250,10 +412,18 @@ def get_water_quality_data():
             "total_phosphorus": item.total_phosphorus,
             "total_nitrogen": item.total_nitrogen,
             "chlorophyll_a": item.chlorophyll_a,
-            "algae_density": item.algae_density,
-            "site_status": item.site_status
+            "algae_density": item.algae_density
         } for item in data.items]
 
+        # 按 GB3838-2002 评价的类别和限制指标，供与监测站给出的类别对照
+        evaluated = water_classify.classify({
+            name: [getattr(item, name) for item in data.items] for name in water_classify.EVALUATED_INDICATORS
+        })
+        for row, label, limiting in zip(data_list, water_classify.labels(evaluated[0]),
+                                        water_classify.limiting_names(evaluated[1])):
+            row["evaluated_category"] = label
+            row["limiting_indicator"] = limiting
+
         # 返回分页数据及总条数
         return jsonify({
             "data": data_list,
@@ -277,27 +447,62 @@ def update_water_quality_data(data_id):
         if not water_data:
             return jsonify({"ok": False, "message": "数据不存在"}), 404
 
-        water_data.province = data.get("province", water_data.province)
-        water_data.river_basin = data.get("river_basin", water_data.river_basin)
-        water_data.section_name = data.get("section_name", water_data.section_name)
+        # 修改前的断面和日期也需要重新汇总
+        old_key = _rollup_key(water_data)
+        names = _item_names(water_data, db.session.connection().connection.cursor())
+        fields = _dimension_fields(
+            data.get("province", names["province"]),
+            data.get("river_basin", names["river_basin"]),
+            data.get("section_name", names["section_name"]),
+            data.get("water_quality_category", names["water_quality_category"]),
+            names["site_status"]
+        )
+        for field, value in fields.items():
+            setattr(water_data, field, value)
         water_data.monitoring_time = data.get("monitoring_time", water_data.monitoring_time)
-        water_data.water_quality_category = data.get("water_quality_category", water_data.water_quality_category)
+        water_data.monitoring_at = import_data.parse_monitoring_time(
+            water_data.monitoring_time, import_data.year_hint(water_data.source_file)
+        )
         # Update other fields similarly...
 
+        keys = _refresh_rollups(old_key, _rollup_key(water_data))
+        cursor = db.session.connection().connection.cursor()
+        water_anomalies.forget_reading(cursor, *old_key)
+        water_anomalies.observe_items(cursor, [water_data])
         db.session.commit()
+        _after_commit(keys, [old_key[0], water_data.site_id])
         return jsonify({"ok": True, "message": "水质数据已更新"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"ok": False, "message": str(e)}), 500
 
 
+@auth_bp.route("/api/reclassifywaterqualitydata", methods=["POST"])
+def reclassify_water_quality_data():
+    """
+    按 GB3838-2002 重新评价已有数据的水质类别。请求体 {"overwrite": true} 时覆盖已有类别，默认只补全缺失的类别。
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        stats, keys, site_ids = water_classify.reclassify(db_pool.raw_connection, overwrite=bool(data.get("overwrite")))
+        # 汇总和异常状态不包含类别（见 water_classify.reclassify），不需要 _refresh_rollups
+        if stats["updated"]:
+            _after_commit(keys, site_ids)
+        return jsonify({"ok": True, "message": "水质类别已重新评价", **stats}), 200
+    except Exception as e:
+        return jsonify({"ok": False, "message": str(e)}), 500
+
+
 @auth_bp.route("/api/deletewaterqualitydata/<int:data_id>", methods=["DELETE"])
 def delete_water_quality_data(data_id):
     try:
         water_data = WaterQualityData.query.get(data_id)
         if water_data:
             db.session.delete(water_data)
+            keys = _refresh_rollups(_rollup_key(water_data))
+            water_anomalies.forget_reading(db.session.connection().connection.cursor(), *_rollup_key(water_data))
             db.session.commit()
+            _after_commit(keys, [water_data.site_id])
             return jsonify({"ok": True, "message": "水质数据已删除"}), 200
         else:
             return jsonify({"ok": False, "message": "数据不存在"}), 404
@@ -0,0 +1,322 @@
+"""
+导入性能基准测试。
+
+生成指定规模的合成 WaterQualitybyDate 目录（省份 × 流域 × 断面 × 天数）和 Fish 风格的CSV，
+分别用 import_csv_to_mysql、import_csv_parallel 和 import_fish_data_from_csv 导入到本地数据库，
+记录每个阶段的耗时、行数、行/秒和峰值内存（RSS，含子进程），结果写入 JSON 报告。
+
+默认使用临时目录中的 SQLite 文件作为数据库替身，也可以用 --mysql-url 指向一个专用的 MySQL 数据库。
+基准测试会删除并重建该库中的所有表，不能指向应用使用的数据库（config.SQLALCHEMY_DATABASE_URI），否则拒绝运行：
+
+    python bench_ingest.py --provinces 4 --basins 3 --sections 5 --days 60 --fish-rows 200000
+    python bench_ingest.py --mysql-url mysql+pymysql://root:密码@127.0.0.1:3306/flask_bench --output bench_report.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import psutil
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+import config
+from models import db
+import import_data
+from water_dims import dims
+
+WATER_HEADER = [
+    "省份", "流域", "断面名称", "监测时间", "水质类别", "水温(℃)", "pH(无量纲)",
+    "溶解氧(mg/L)", "电导率(μS/cm)", "浊度(NTU)", "高锰酸盐指数(mg/L)",
+    "氨氮(mg/L)", "总磷(mg/L)", "总氮(mg/L)", "叶绿素α(mg/L)",
+    "藻密度(cells/L)", "站点情况"
+]
+
+# 每个数值指标的 (均值, 标准差, 小数位)
+WATER_INDICATORS = [
+    (18.0, 6.0, 1), (7.6, 0.5, 2), (8.0, 1.5, 2), (400.0, 120.0, 1), (15.0, 10.0, 1),
+    (3.0, 1.2, 2), (0.3, 0.2, 3), (0.08, 0.05, 3), (1.8, 0.8, 2), (0.01, 0.008, 3),
+    (2.0e6, 1.0e6, 0),
+]
+WATER_CATEGORIES = ["I", "II", "III", "IV", "V", "劣V"]
+
+FISH_HEADER = ["Species", "Weight(g)", "Length1(cm)", "Length2(cm)", "Length3(cm)", "Height(cm)", "Width(cm)"]
+FISH_SPECIES = ["Bream", "Roach", "Whitefish", "Parkki", "Perch", "Pike", "Smelt"]
+
+
+class RssSampler:
+    """
+    后台线程定期采样当前进程及其子进程的 RSS，记录阶段内的峰值。
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak = max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def run_phase(report, name, func, rows=None):
+    """
+    执行一个阶段并把耗时、行数和峰值内存追加到报告；rows 为从返回值中取行数的函数。
+    """
+    print(f"[bench] {name} ...")
+    start = time.perf_counter()
+    with RssSampler() as sampler:
+        result = func()
+    elapsed = time.perf_counter() - start
+    row_count = rows(result) if rows else None
+    phase = {
+        "name": name,
+        "seconds": round(elapsed, 4),
+        "rows": row_count,
+        "rows_per_second": round(row_count / elapsed, 1) if row_count and elapsed > 0 else None,
+        "peak_rss_mb": round(sampler.peak / 1024 / 1024, 1),
+    }
+    report["phases"].append(phase)
+    print(f"[bench] {name}: {phase}")
+    return result
+
+
+def generate_water_tree(root_dir, provinces, basins, sections, days, readings_per_day, seed=0):
+    """
+    生成 省份/流域/断面/YYYY-MM/断面.csv 结构的合成水质数据，返回总行数。
+    约 1% 的数值为 '*'，每个文件带一行列数不对的脏数据，用于覆盖拒绝路径。
+    """
+    rng = np.random.default_rng(seed)
+    start_day = datetime(2021, 1, 1)
+    step = timedelta(hours=24 / readings_per_day)
+    total = 0
+    for p in range(provinces):
+        province = f"省份{p + 1}"
+        for b in range(basins):
+            basin = f"流域{b + 1}"
+            for s in range(sections):
+                section = f"{province}断面{b + 1}-{s + 1}"
+                times = [start_day + step * i for i in range(days * readings_per_day)]
+                values = [
+                    np.round(np.abs(rng.normal(mean, std, len(times))), digits)
+                    for mean, std, digits in WATER_INDICATORS
+                ]
+                missing = rng.random((len(WATER_INDICATORS), len(times))) < 0.01
+                categories = rng.choice(WATER_CATEGORIES, len(times))
+
+                by_month = {}
+                for i, moment in enumerate(times):
+                    row = [province, basin, section, moment.strftime("%Y-%m-%d %H:%M"), categories[i]]
+                    for k, column in enumerate(values):
+                        row.append("*" if missing[k, i] else f"{column[i]:g}")
+                    row.append("正常")
+                    by_month.setdefault(moment.strftime("%Y-%m"), []).append(row)
+
+                for month, rows in by_month.items():
+                    folder = os.path.join(root_dir, province, basin, section, month)
+                    os.makedirs(folder, exist_ok=True)
+                    with open(os.path.join(folder, f"{section}.csv"), "w", newline="", encoding="utf-8") as f:
+                        writer = csv.writer(f)
+                        writer.writerow(WATER_HEADER)
+                        writer.writerows(rows)
+                        writer.writerow([province, basin, section])
+                    total += len(rows)
+    return total
+
+
+def generate_fish_csv(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    length1 = np.round(rng.uniform(8, 60, rows), 1)
+    frame_columns = [
+        rng.choice(FISH_SPECIES, rows),
+        np.round(length1 ** 3 * rng.uniform(0.008, 0.015, rows), 1),
+        length1,
+        np.round(length1 * 1.08, 1),
+        np.round(length1 * 1.15, 1),
+        np.round(length1 * rng.uniform(0.15, 0.4, rows), 4),
+        np.round(length1 * rng.uniform(0.1, 0.18, rows), 4),
+    ]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(FISH_HEADER)
+        writer.writerows(zip(*frame_columns))
+    return rows
+
+
+def reset_tables(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+# 鱼类数据和用户表以外的所有表（水质导入写入的数据和导入清单），每个导入阶段之前清空
+KEEP_TABLES = ("user", "fish_data")
+
+
+def clear_water_tables(app):
+    """
+    清空水质导入写入的所有表（按外键依赖逆序），并重新加载维度缓存，使下一阶段从相同的空库开始。
+    """
+    with app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name not in KEEP_TABLES:
+                db.session.execute(table.delete())
+        db.session.commit()
+        conn = db.engine.raw_connection()
+        try:
+            dims.reload(conn.cursor())
+        finally:
+            conn.close()
+
+
+def _server(url):
+    host = url.host or "localhost"
+    return ("localhost" if host in ("localhost", "127.0.0.1", "::1") else host), url.port or 3306
+
+
+def mysql_options(url):
+    """
+    --mysql-url 对应的 pymysql 连接参数。与应用使用的数据库相同（同一主机、端口和库名）时抛出 ValueError。
+    """
+    url = make_url(url)
+    app_url = make_url(config.SQLALCHEMY_DATABASE_URI)
+    if not url.database:
+        raise ValueError("--mysql-url 必须指定数据库名")
+    if _server(url) == _server(app_url) and url.database == app_url.database:
+        raise ValueError(f"--mysql-url 指向应用数据库 {app_url.database}，基准测试会删除其中所有表，请使用单独的数据库")
+    return {
+        "host": url.host or "localhost",
+        "port": url.port or 3306,
+        "user": url.username,
+        "password": url.password,
+        "db": url.database,
+        "charset": "utf8mb4",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="水质/鱼类数据导入基准测试")
+    parser.add_argument("--provinces", type=int, default=2)
+    parser.add_argument("--basins", type=int, default=2)
+    parser.add_argument("--sections", type=int, default=3)
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--readings-per-day", type=int, default=6)
+    parser.add_argument("--fish-rows", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=config.IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="并行导入的工作进程数，默认全部CPU核心")
+    parser.add_argument("--queue-size", type=int, default=config.IMPORT_QUEUE_SIZE)
+    parser.add_argument("--fish-chunksize", type=int, default=config.FISH_IMPORT_CHUNKSIZE)
+    parser.add_argument("--mysql-url", default=None,
+                        help="专用于基准测试的 MySQL 数据库（SQLAlchemy URL），会删除并重建其中所有表；不能是应用数据库")
+    parser.add_argument("--workdir", default=None, help="合成数据目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--output", default="bench_report.json")
+    args = parser.parse_args(argv)
+    if args.mysql_url:
+        try:
+            db_config = mysql_options(args.mysql_url)
+        except ValueError as e:
+            parser.error(str(e))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_ingest_")
+    water_root = os.path.join(workdir, "WaterQualitybyDate")
+    fish_csv = os.path.join(workdir, "Fish.csv")
+    # Parquet 镜像写到工作目录，不影响 data/ 下的正式镜像
+    config.WATER_PARQUET_DIR = os.path.join(workdir, "parquet")
+
+    app = Flask(__name__)
+    if args.mysql_url:
+        app.config["SQLALCHEMY_DATABASE_URI"] = args.mysql_url
+    else:
+        sqlite_path = os.path.join(workdir, "bench.sqlite3")
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{sqlite_path}"
+        db_config = {"sqlite": sqlite_path}
+    db.init_app(app)
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "database": "mysql" if args.mysql_url else "sqlite",
+        "params": dict(vars(args), mysql_url=args.mysql_url and make_url(args.mysql_url).render_as_string(hide_password=True)),
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "phases": [],
+    }
+    try:
+        run_phase(report, "generate_water", lambda: generate_water_tree(
+            water_root, args.provinces, args.basins, args.sections, args.days, args.readings_per_day
+        ), rows=lambda n: n)
+        run_phase(report, "generate_fish", lambda: generate_fish_csv(fish_csv, args.fish_rows), rows=lambda n: n)
+        run_phase(report, "create_schema", lambda: reset_tables(app))
+
+        serial = run_phase(report, "import_water_serial", lambda: import_data.import_csv_to_mysql(
+            water_root, db_config, batch_size=args.batch_size
+        ), rows=lambda s: s["rows"])
+        clear_water_tables(app)
+
+        # SQLite 同一时间只允许一个写事务，并行写入者会互相等待，因此只用一个工作进程
+        workers = args.workers if args.mysql_url else 1
+        parallel = run_phase(report, "import_water_parallel", lambda: import_data.import_csv_parallel(
+            water_root, db_config, workers=workers, queue_size=args.queue_size, batch_size=args.batch_size
+        ), rows=lambda s: s["rows"])
+
+        def import_fish():
+            with app.app_context():
+                return import_data.import_fish_data_from_csv(fish_csv, chunksize=args.fish_chunksize)
+
+        run_phase(report, "import_fish", import_fish, rows=lambda n: n or 0)
+
+        report["water"] = {
+            "files": len(serial["files"]),
+            "rejected": serial["rejected"],
+            "conversion_failures": serial.get("conversion_failures", 0),
+            "parallel_workers": parallel.get("workers"),
+            "slowest_files": sorted(
+                ({"file": os.path.relpath(item["file"], water_root), "seconds": round(item["seconds"], 4)}
+                 for item in serial["files"]),
+                key=lambda item: item["seconds"], reverse=True
+            )[:5],
+        }
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[bench] 报告已写入 {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
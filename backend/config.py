@@ -10,3 +10,79 @@ PASSWORD = os.getenv("DB_PASSWORD")
 
 SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{USERNAME}:{PASSWORD}@{HOSTNAME}:{PORT}/{DATABASE}"
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# 数据库连接池，ORM 和 water_data 等原生 SQL 接口共用（见 db_pool.py）
+DB_POOL_SIZE = 10  # 常驻连接数
+DB_POOL_MAX_OVERFLOW = 10  # 高峰期允许额外创建的连接数，连接总数不超过两者之和
+DB_POOL_TIMEOUT = 10  # 连接池耗尽时等待的秒数，超时返回 503
+DB_POOL_RECYCLE = 1800  # 连接使用超过该秒数后重建，避免被 MySQL wait_timeout 断开
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_POOL_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": True,  # 借出前检查连接是否可用
+}
+
+# 水质CSV批量导入时每批写入的行数
+IMPORT_BATCH_SIZE = 5000
+# 并行导入的工作进程数（None 表示使用全部CPU核心）和批次队列深度
+IMPORT_WORKERS = None
+IMPORT_QUEUE_SIZE = 64
+# 并行导入时主进程等待队列消息的秒数，超时后检查解析进程是否意外退出
+IMPORT_QUEUE_TIMEOUT = 30
+# 鱼类CSV分块读取的行数
+FISH_IMPORT_CHUNKSIZE = 50000
+# 水质数据规范化存储：为 True 时 water_quality_data 只保存断面/类别/站点情况的 id，名称列留空
+WATER_NORMALIZED_STORAGE = False
+# 汇总趋势接口自动选择粒度时允许的最大点数（超过则使用月汇总）
+ROLLUP_MAX_POINTS = 400
+# 水质数据 Parquet 镜像目录（按省份/月份分区，供 water_analytics.py 分析查询），设为 None 时不维护镜像
+WATER_PARQUET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'parquet', 'water_quality')
+# /api/waterdata_by_name 分页：只给 cursor 时的默认每页行数，以及 limit 的上限
+WATER_PAGE_DEFAULT_LIMIT = 1000
+WATER_PAGE_MAX_LIMIT = 5000
+# 水质数据读接口的查询结果缓存（见 query_cache.py）：进程内缓存的总字节数（设为 0 时关闭缓存）和单个响应的上限
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+QUERY_CACHE_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+# 多进程部署时共享缓存的 SQLite 文件路径，例如 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'query_cache.sqlite3')；None 表示只用进程内缓存
+QUERY_CACHE_SHARED_PATH = None
+# 全国按日快照（/api/TimeWaterData，见 water_snapshots.py）：为 True 时过去日期的快照保存在 water_snapshot 表中，
+# 写入后重新生成受影响的日期；为 False 时每次请求都实时查询
+WATER_SNAPSHOT_STORE = True
+# 断面层级和名称搜索的进程内索引（见 water_sites.py）重新加载的间隔秒数，用于看到其他进程新增的断面；None 表示只在启动时加载
+SITE_INDEX_RELOAD_SECONDS = 300
+# /data/<path> 静态文件（见 static_assets.py）：预压缩结果目录（None 表示不压缩）、需要预压缩的文件后缀和大小范围
+STATIC_PRECOMPRESSED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'precompressed')
+STATIC_PRECOMPRESS_SUFFIXES = (".json", ".geojson", ".md", ".txt", ".svg")
+STATIC_PRECOMPRESS_MIN_BYTES = 1024
+STATIC_PRECOMPRESS_MAX_BYTES = 256 * 1024 * 1024
+# 静态文件的 Cache-Control max-age（秒），过期后用 ETag 重新验证
+STATIC_CACHE_MAX_AGE = 7 * 24 * 3600
+# 地图 GeoJSON 的简化级别（见 geo_tiers.py）：detail 参数 -> (Douglas–Peucker 容差（度）, 坐标小数位数)
+GEO_DETAIL_TIERS = {
+    "low": (0.05, 2),  # 全国视图（约 1000 像素宽时一个像素约 0.06 度）
+    "medium": (0.01, 3),  # 省级视图
+    "high": (0.003, 4),
+}
+# 简化结果的缓存目录，以及启动时预先生成各级别的文件（data 目录下的相对路径）
+GEO_TIERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'geo_tiers')
+GEO_TIER_FILES = ("china.json",)
+# 水质异常检测（见 water_anomalies.py）：EWMA 平滑系数、z 值阈值、开始判断前至少需要的读数个数
+ANOMALY_EWMA_ALPHA = 0.1
+ANOMALY_Z_THRESHOLD = 4.0
+ANOMALY_WARMUP = 30
+# 各指标的硬阈值 (下限, 上限)，超出即标记为异常，None 表示不限制
+ANOMALY_LIMITS = {
+    "temperature": (-1, 40),
+    "ph": (4, 11),
+    "dissolved_oxygen": (0, 20),
+    "conductivity": (0, 5000),
+    "turbidity": (0, 1000),
+    "permanganate_index": (0, 50),
+    "ammonia_nitrogen": (0, 20),
+    "total_phosphorus": (0, 5),
+    "total_nitrogen": (0, 50),
+    "chlorophyll_a": (0, 1),
+    "algae_density": (0, None),
+}
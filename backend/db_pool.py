@@ -0,0 +1,109 @@
+"""
+共享数据库连接池的原生连接和监控指标。
+
+water_data 等直接写 SQL 的接口不再每次请求 pymysql.connect()，而是通过 raw_connection()
+从 SQLAlchemy 引擎的连接池（与 ORM 共用，参数见 config.SQLALCHEMY_ENGINE_OPTIONS）借出 DB-API 连接，
+close() 时归还连接池。连接池有上限，借出前做健康检查（pool_pre_ping），超过 pool_recycle 的连接会重建。
+
+监控指标：连接池事件统计所有借出（包括 ORM）、新建和失效的连接；
+通过 raw_connection() 借出的连接额外记录等待中的请求数和借出耗时。
+GET /api/metrics/db_pool 返回当前指标。
+"""
+import threading
+import time
+from collections import deque
+
+from flask import Blueprint, jsonify
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from models import db
+
+metrics_bp = Blueprint("metrics", __name__)
+
+# 计算借出耗时分位数时保留的最近样本数
+LATENCY_SAMPLES = 1000
+
+_lock = threading.Lock()
+_counters = {
+    "checkouts": 0,       # 所有借出次数（事件统计，包括 ORM）
+    "connects": 0,        # 新建的物理连接数
+    "invalidations": 0,   # 健康检查失败或出错后被丢弃的连接数
+    "timeouts": 0,        # 等待超过 pool_timeout 的次数
+    "waiting": 0,         # 正在等待借出连接的请求数
+    "max_waiting": 0,
+}
+_latencies = deque(maxlen=LATENCY_SAMPLES)
+_instrumented = set()
+
+
+def _increment(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+        if name == "waiting":
+            _counters["max_waiting"] = max(_counters["max_waiting"], _counters["waiting"])
+
+
+def init_pool_metrics(app):
+    """
+    在应用的引擎上注册连接池事件，每个引擎只注册一次。在 db.init_app(app) 之后调用。
+    """
+    with app.app_context():
+        engine = db.engine
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+    event.listen(engine, "connect", lambda *args: _increment("connects"))
+    event.listen(engine, "checkout", lambda *args: _increment("checkouts"))
+    event.listen(engine, "invalidate", lambda *args: _increment("invalidations"))
+
+
+def raw_connection():
+    """
+    从连接池借出一个 DB-API 连接（调用方负责 close() 归还），记录等待数和借出耗时。
+    连接池耗尽并等待超过 pool_timeout 时抛出 sqlalchemy.exc.TimeoutError。
+    """
+    _increment("waiting")
+    start = time.perf_counter()
+    try:
+        conn = db.engine.raw_connection()
+    except PoolTimeoutError:
+        _increment("timeouts")
+        raise
+    finally:
+        _increment("waiting", -1)
+    with _lock:
+        _latencies.append(time.perf_counter() - start)
+    return conn
+
+
+def pool_metrics():
+    pool = db.engine.pool
+    with _lock:
+        counters = dict(_counters)
+        latencies = sorted(_latencies)
+
+    def percentile(q):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+
+    status = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            status[name] = getattr(pool, name)()
+    status["in_use"] = status.get("checkedout")
+    status.update(counters)
+    status["checkout_ms"] = {
+        "samples": len(latencies),
+        "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+    return status
+
+
+@metrics_bp.route("/api/metrics/db_pool", methods=["GET"])
+def get_pool_metrics():
+    return jsonify(pool_metrics()), 200
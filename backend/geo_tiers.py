@@ -0,0 +1,236 @@
+"""
+地图 GeoJSON（例如 data/china.json）的多级简化版本，通过 /data/<文件>.json?detail=low|medium|high 获取。
+
+原图是全精度坐标，全国视图下远超屏幕能显示的细节。每个级别在 config.GEO_DETAIL_TIERS 中配置
+(Douglas–Peucker 容差（度）, 坐标保留的小数位数)；不带 detail 或 detail=full 时发送原文件。
+
+简化保持拓扑（与 TopoJSON 的做法相同）：先把所有环在“连接点”（相邻关系发生变化的点，即三个及以上区域的交汇处）
+切分成弧段，相邻省份的公共边界是同一条弧段，只简化一次，两侧使用完全相同的结果，不会出现缝隙或重叠。
+没有连接点的环（海岛、飞地）整体作为一条闭合弧段。简化后再按小数位数量化坐标并去掉重复点；
+环简化后不足 4 个点时保留原始的环，小岛屿（以及南海诸岛等）不会在低精度级别中消失。
+
+结果缓存在 config.GEO_TIERS_DIR 中，源文件修改后的第一次请求重新生成；启动时为 GEO_TIER_FILES 预先生成，
+也可以运行 python geo_tiers.py。发送时经过 static_assets，同样有预压缩、强 ETag 和 304。
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+import config
+import static_assets
+
+DETAIL_FULL = "full"
+
+_lock = threading.Lock()
+
+
+def tiers():
+    return getattr(config, "GEO_DETAIL_TIERS", {})
+
+
+def _douglas_peucker(points, tolerance):
+    """
+    points 为 (n, 2) 数组，返回保留点的布尔掩码（首尾两点总是保留）。用栈代替递归，每段的距离一次向量化计算。
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        inner = points[first + 1:last]
+        dx, dy = end - start
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(inner[:, 0] - start[0], inner[:, 1] - start[1])
+        else:
+            distances = np.abs(dx * (inner[:, 1] - start[1]) - dy * (inner[:, 0] - start[0])) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = first + 1 + index
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+    return keep
+
+
+def _simplify_arc(arc, tolerance, closed):
+    points = np.asarray(arc, dtype=float)
+    if closed:
+        # 闭合弧段首尾是同一点，从离起点最远的点分成两段分别简化
+        far = int(np.argmax(np.hypot(points[:, 0] - points[0, 0], points[:, 1] - points[0, 1])))
+        if far == 0:
+            return list(arc)
+        keep = np.concatenate((_douglas_peucker(points[:far + 1], tolerance)[:-1],
+                               _douglas_peucker(points[far:], tolerance)))
+    else:
+        keep = _douglas_peucker(points, tolerance)
+    return [arc[i] for i in np.flatnonzero(keep)]
+
+
+def _dedupe(ring):
+    out = [ring[0]]
+    for point in ring[1:]:
+        if point != out[-1]:
+            out.append(point)
+    return out
+
+
+def _rings(collection):
+    """
+    逐个返回 (几何对象, 多边形下标, 环下标, 去掉连续重复点的闭合环)，环中的点为元组。
+    """
+    for feature in collection.get("features", []):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            continue
+        for p, polygon in enumerate(polygons):
+            for r, ring in enumerate(polygon):
+                ring = _dedupe([tuple(point[:2]) for point in ring])
+                if ring[0] != ring[-1]:
+                    ring.append(ring[0])
+                yield geometry, p, r, ring
+
+
+def _junctions(rings):
+    """
+    在不同出现位置有不同相邻点对的点，即弧段的切分点。
+    """
+    neighbours = {}
+    for ring in rings:
+        cycle = ring[:-1]
+        for i, point in enumerate(cycle):
+            pair = frozenset((cycle[i - 1], cycle[(i + 1) % len(cycle)]))
+            neighbours.setdefault(point, set()).add(pair)
+    return {point for point, pairs in neighbours.items() if len(pairs) > 1}
+
+
+def _split(ring, junctions):
+    """
+    把闭合环切分为弧段，返回 [(弧段点列表, 是否闭合), ...]，相邻弧段首尾相接。
+    """
+    cycle = ring[:-1]
+    cuts = [i for i, point in enumerate(cycle) if point in junctions]
+    if not cuts:
+        # 规范化起点和方向，两个多边形共用的整个环（飞地与外围的洞）得到同一条弧段
+        start = cycle.index(min(cycle))
+        cycle = cycle[start:] + cycle[:start]
+        if len(cycle) > 2 and cycle[-1] < cycle[1]:
+            cycle = [cycle[0]] + cycle[:0:-1]
+            return [(cycle + [cycle[0]], True, True)]
+        return [(cycle + [cycle[0]], True, False)]
+    cycle = cycle[cuts[0]:] + cycle[:cuts[0]]
+    cuts = [i - cuts[0] for i in cuts] + [len(cycle)]
+    cycle = cycle + [cycle[0]]
+    return [(cycle[a:b + 1], False, False) for a, b in zip(cuts[:-1], cuts[1:])]
+
+
+def _quantize(ring, decimals):
+    return _dedupe([(round(x, decimals), round(y, decimals)) for x, y in ring])
+
+
+def simplify_collection(collection, tolerance, decimals):
+    """
+    返回简化后的 FeatureCollection（新对象，属性不变）。
+    """
+    collection = json.loads(json.dumps(collection))
+    entries = list(_rings(collection))
+    junctions = _junctions([ring for _, _, _, ring in entries])
+    simplified = {}
+
+    for geometry, p, r, ring in entries:
+        out = []
+        for arc, closed, flipped in _split(ring, junctions):
+            key = min(tuple(arc), tuple(arc[::-1]))
+            if key not in simplified:
+                simplified[key] = _simplify_arc(list(key), tolerance, closed)
+            part = simplified[key] if key == tuple(arc) else simplified[key][::-1]
+            out.extend(part if not out else part[1:])
+        if flipped:
+            out = out[::-1]
+        result = _quantize(out, decimals)
+        if len(result) < 4:
+            result = _quantize(ring, decimals)
+            if len(result) < 4:
+                result = ring
+        coordinates = [list(point) for point in result]
+        if geometry["type"] == "Polygon":
+            geometry["coordinates"][r] = coordinates
+        else:
+            geometry["coordinates"][p][r] = coordinates
+    return collection
+
+
+def tier_path(relpath, detail):
+    tolerance, decimals = tiers()[detail]
+    return os.path.join(config.GEO_TIERS_DIR, f"{relpath}.{detail}-{tolerance:g}-{decimals}.json")
+
+
+def ensure_tier(relpath, source, detail):
+    """
+    返回某个级别的缓存文件路径，不存在或比源文件旧时重新生成（先写临时文件再替换）。
+    """
+    target = tier_path(relpath, detail)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+        return target
+    with _lock:
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+            return target
+        try:
+            with open(source, "r", encoding="utf-8") as f:
+                collection = json.load(f)
+        except ValueError:
+            collection = None
+        if not isinstance(collection, dict) or collection.get("type") != "FeatureCollection":
+            raise ValueError(f"{relpath} 不是 GeoJSON FeatureCollection")
+        simplified = simplify_collection(collection, *tiers()[detail])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(simplified, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, target)
+    return target
+
+
+def _asset_key(target):
+    # 在预压缩目录中的相对路径，例如 geo_tiers/china.json.low-0.02-3.json
+    return os.path.relpath(target, os.path.dirname(config.GEO_TIERS_DIR)).replace(os.sep, "/")
+
+
+def send_tier(filename, detail):
+    """
+    发送 data 目录下 GeoJSON 文件的某个简化级别。
+    """
+    source = static_assets.data_path(filename)
+    if detail == DETAIL_FULL:
+        return static_assets.send_data_file(filename)
+    target = ensure_tier(filename, source, detail)
+    return static_assets.send_asset(_asset_key(target), target)
+
+
+def build_all():
+    """
+    为 config.GEO_TIER_FILES 中的每个文件生成所有级别并预压缩，返回生成的文件数。
+    """
+    count = 0
+    for relpath in getattr(config, "GEO_TIER_FILES", ()):
+        source = os.path.join(static_assets.DATA_ROOT, relpath)
+        if not os.path.isfile(source):
+            continue
+        for detail in tiers():
+            target = ensure_tier(relpath, source, detail)
+            static_assets.static_assets.get(_asset_key(target), target, os.stat(target))
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    print(f"已生成 {build_all()} 个简化地图文件")
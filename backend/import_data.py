@@ -1,81 +1,758 @@
 import os
+import re
 import csv
+import time
+import hashlib
+from datetime import datetime
+import multiprocessing
+from queue import Empty
+import numpy as np
+import pandas as pd
+import psutil
 import pymysql
+import sqlite3
+import config
+from models import db, FishData, ImportManifest
+from water_dims import dims
+import water_rollups
+import water_parquet
+import water_snapshots
+from water_sites import site_index
+import query_cache
+import water_classify
+import water_anomalies
 
-def import_csv_to_mysql(root_dir, db_config):
+# 数值字段索引（水温 ~ 藻密度）
+NUMERIC_INDICES = frozenset(range(5, 16))
+# 监测时间字段索引
+TIME_INDEX = 3
+# 水质类别字段索引，以及评价类别用到的指标字段索引（见 water_classify.EVALUATED_INDICATORS）
+CATEGORY_INDEX = 4
+CLASSIFY_INDICES = {"ph": 6, "dissolved_oxygen": 7, "permanganate_index": 10, "ammonia_nitrogen": 11, "total_phosphorus": 12}
+# 目录中的 YYYY-MM 月份文件夹，用于补全不带年份的监测时间（如 "04-01 08:00"）
+MONTH_DIR_RE = re.compile(r'(?:^|[\\/])(\d{4})-\d{2}(?:[\\/]|$)')
+
+# 插入行（见 INSERT_SQL）中 monitoring_at 和 site_id 的位置
+MONITORING_AT_INDEX = 18
+SITE_ID_INDEX = 19
+
+INSERT_SQL = """
+INSERT INTO water_quality_data (
+    province, river_basin, section_name, monitoring_time, water_quality_category,
+    temperature, ph, dissolved_oxygen, conductivity, turbidity,
+    permanganate_index, ammonia_nitrogen, total_phosphorus, total_nitrogen,
+    chlorophyll_a, algae_density, site_status, source_file, monitoring_at,
+    site_id, category_id, status_id
+) VALUES (
+    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+)
+"""
+
+# 每批发送给数据库的行数默认取 config.IMPORT_BATCH_SIZE，pymysql 的 executemany 会把 INSERT ... VALUES 改写为多行插入
+
+
+class _SQLiteCursor:
+    """
+    把 pymysql 风格的 %s 占位符转换为 sqlite3 的 ?，其余属性直接透传。
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, args=()):
+        # sqlite3 只在 INSERT/UPDATE/DELETE 前自动开始事务；在事务外建立保存点时先显式 BEGIN，
+        # 否则释放这个最外层的保存点就等于提交
+        if sql.startswith("SAVEPOINT") and not self._cursor.connection.in_transaction:
+            self._cursor.execute("BEGIN")
+        return self._cursor.execute(sql.replace('%s', '?'), args or ())
+
+    def executemany(self, sql, seq_of_args):
+        return self._cursor.executemany(sql.replace('%s', '?'), seq_of_args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=60)
+
+    def cursor(self, *args):
+        return _SQLiteCursor(self._conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def connect_db(db_config):
+    """
+    建立导入用的数据库连接。db_config 含 "sqlite" 键（数据库文件路径）时连接本地 SQLite，
+    供测试和基准测试等没有 MySQL 的场景使用；否则把 db_config 作为 pymysql.connect 的参数。
+    """
+    if "sqlite" in db_config:
+        return _SQLiteConnection(db_config["sqlite"])
+    return pymysql.connect(**db_config)
+
+
+def year_hint(path):
+    """
+    从 .../2021-04/... 这样的路径中取出年份，找不到时返回 None。
+    """
+    match = MONTH_DIR_RE.search(path) if isinstance(path, str) else None
+    return int(match.group(1)) if match else None
+
+
+def parse_monitoring_times(values, year=None):
+    """
+    把一列监测时间字符串批量解析为 datetime，无法解析或为空的返回 None。
+    支持 ISO 格式（"2021-04-01 08:00"）；不带年份的 "04-01 08:00" 用 year 补全，
+    year 可以是单个年份，也可以是与 values 等长的年份序列。
+    """
+    series = pd.Series(values, dtype=object)
+    parsed = pd.to_datetime(series, errors='coerce', format='ISO8601')
+    pending = parsed.isna() & series.notna() & (series != '')
+    if year is not None and pending.any():
+        years = pd.Series(year, index=series.index) if np.isscalar(year) else pd.Series(list(year), index=series.index)
+        pending &= years.notna()
+        prefixed = years[pending].astype(int).astype(str) + '-' + series[pending].astype(str)
+        parsed[pending] = pd.to_datetime(prefixed, errors='coerce', format='%Y-%m-%d %H:%M')
+    return np.where(parsed.isna().to_numpy(), None, np.asarray(parsed.dt.to_pydatetime(), dtype=object))
+
+
+def parse_monitoring_time(value, year=None):
+    """
+    parse_monitoring_times 的单值版本，供按条新增/修改数据的接口使用。
+    """
+    return parse_monitoring_times([value], year)[0]
+
+
+def convert_rows(rows, failures=None, year=None):
+    """
+    按列批量转换一组17列的CSV行（行尾可附加来源等额外列），返回插入用的元组列表。
+    数值字段整列用 pandas 解析为浮点数，'*' 或空串转为NULL；无法转换的值也设为NULL，
+    并按列号累计到 failures（{列号: [次数, 示例值]}），不再逐个打印。
+    没有水质类别的行按 GB3838-2002 评价补全（见 water_classify）。
+    每个元组末尾追加由监测时间解析出的 monitoring_at，year 用于补全不带年份的时间。
+    """
+    if not rows:
+        return []
+    block = np.array(rows, dtype=object)
+    columns = []
+    numeric = {}
+    for j in range(block.shape[1]):
+        raw = block[:, j]
+        if j in NUMERIC_INDICES:
+            missing = np.isin(raw, ('*', ''))
+            values = pd.to_numeric(pd.Series(np.where(missing, None, raw)), errors='coerce').to_numpy(dtype=float)
+            invalid = np.isnan(values)
+            bad = invalid & ~missing
+            if failures is not None and bad.any():
+                entry = failures.setdefault(j, [0, raw[bad][0]])
+                entry[0] += int(bad.sum())
+            numeric[j] = values
+            columns.append(np.where(invalid, None, values))
+        else:
+            columns.append(np.where(raw == '', None, raw))
+
+    missing = pd.isna(columns[CATEGORY_INDEX])
+    if missing.any():
+        classes, _ = water_classify.classify({name: numeric[j] for name, j in CLASSIFY_INDICES.items()})
+        columns[CATEGORY_INDEX] = np.where(missing, water_classify.labels(classes), columns[CATEGORY_INDEX])
+
+    times = parse_monitoring_times(block[:, TIME_INDEX], year)
+    bad = pd.isna(times) & ~np.isin(block[:, TIME_INDEX], ('', None))
+    if failures is not None and bad.any():
+        entry = failures.setdefault(TIME_INDEX, [0, block[:, TIME_INDEX][bad][0]])
+        entry[0] += int(bad.sum())
+    columns.append(times)
+    return list(zip(*columns))
+
+
+def _report_failures(filepath, header, failures):
+    if not failures:
+        return
+    total = sum(count for count, _ in failures.values())
+    details = "，".join(
+        f"{header[j] if j < len(header) else j} {count} 个(如 '{sample}')"
+        for j, (count, sample) in sorted(failures.items())
+    )
+    print(f"警告: 文件 {filepath} 中有 {total} 个值无法转换，已设置为NULL: {details}")
+
+
+def insert_batch(cursor, batch, connect, keys=None, encoded=False):
+    """
+    批量插入一批数据，返回 (成功行数, 失败行数)。
+    插入前通过维度缓存追加断面/类别/站点情况 id，新出现的维度值用 connect() 打开的连接写入
+    （encoded 为 True 时调用方已经用 dims.encode_rows 追加过）。
+    keys 为集合时把这批数据涉及的汇总键 (site_id, 日期) 加入其中，提交前交给 water_rollups.refresh_rollups。
+    executemany 不是原子的：pymysql 按 max_stmt_length 把一批拆成多条 INSERT，SQLite 逐行执行，
+    出错时前面的部分已经写入。因此先建立保存点，失败时回滚到保存点再逐行重试，只跳过真正出错的行。
+    """
+    if not batch:
+        return 0, 0
+    if not encoded:
+        batch = dims.encode_rows(batch, connect)
+    if keys is not None:
+        keys.update(water_rollups.rollup_keys((row[SITE_ID_INDEX], row[MONITORING_AT_INDEX]) for row in batch))
+    cursor.execute("SAVEPOINT batch")
+    try:
+        cursor.executemany(INSERT_SQL, batch)
+        inserted, rejected = len(batch), 0
+    except Exception:
+        cursor.execute("ROLLBACK TO SAVEPOINT batch")
+        inserted = 0
+        rejected = 0
+        for row in batch:
+            try:
+                cursor.execute(INSERT_SQL, row)
+                inserted += 1
+            except Exception as e:
+                print(f"插入数据时发生错误: {e}")
+                rejected += 1
+    cursor.execute("RELEASE SAVEPOINT batch")
+    return inserted, rejected
+
+
+def parse_csv_lines(lines, label, batch_size, stats, source):
+    """
+    解析CSV文本行（文件对象或任意按行产出文本的迭代器），按 batch_size 行一批产出转换好的数据，
+    每行末尾附加来源 source。第一行为标题行；列数不匹配的行计入 stats["rejected"]；
+    没有任何内容时不产出批次并将 stats["empty"] 置为 True。label 用于日志中标识数据来源。
+    """
+    failures = {}
+    year = year_hint(source) or year_hint(label)
+    reader = csv.reader(lines)
+    # 跳过CSV文件的标题行
+    try:
+        header = next(reader)
+        print(f"CSV文件标题行: {header}")
+    except StopIteration:
+        print(f"警告: 文件 {label} 为空，跳过。")
+        stats["empty"] = True
+        return
+
+    chunk = []
+    for i, row in enumerate(reader):
+        if not row:
+            continue
+
+        # 确保行数据与数据库字段数量匹配 (期望17列)
+        if len(row) != 17:
+            print(f"警告: 文件 {label} 中第 {i+2} 行数据列数不匹配 (期望17列，实际{len(row)}列)，跳过。行内容: {row}")
+            stats["rejected"] += 1
+            continue
+
+        row.append(source)
+        chunk.append(row)
+        if len(chunk) >= batch_size:
+            yield convert_rows(chunk, failures, year)
+            chunk = []
+
+    if chunk:
+        yield convert_rows(chunk, failures, year)
+
+    stats["conversion_failures"] = sum(count for count, _ in failures.values())
+    _report_failures(label, header, failures)
+
+
+def _parse_file(filepath, batch_size, stats, source):
+    """
+    解析单个CSV文件，见 parse_csv_lines。
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        yield from parse_csv_lines(f, filepath, batch_size, stats, source)
+
+
+def new_import_stats(label):
+    return {"file": label, "rows": 0, "rejected": 0, "conversion_failures": 0, "seconds": 0.0, "empty": False}
+
+
+def _import_file(conn, cursor, filepath, batch_size, source, connect, import_keys):
+    """
+    导入单个CSV文件并提交，返回该文件的统计信息；文件为空时返回 None。
+    文件涉及的汇总键加入 import_keys，整次导入结束后统一更新 Parquet 镜像。
+    """
+    stats = new_import_stats(filepath)
+    start = time.perf_counter()
+    keys = set()
+    for batch in _parse_file(filepath, batch_size, stats, source):
+        inserted, rejected = insert_batch(cursor, batch, connect, keys)
+        stats["rows"] += inserted
+        stats["rejected"] += rejected
+    if stats["empty"]:
+        return None
+    water_rollups.refresh_rollups(cursor, keys)
+    water_anomalies.observe_source(cursor, source)
+    conn.commit()
+    import_keys |= keys
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def _add_file_stats(summary, stats):
+    summary["files"].append(stats)
+    summary["rows"] += stats["rows"]
+    summary["rejected"] += stats["rejected"]
+    summary["conversion_failures"] = summary.get("conversion_failures", 0) + stats["conversion_failures"]
+
+
+def _list_csv_files(root_dir):
+    """
+    返回目录下所有CSV文件的 (绝对路径, 相对 root_dir 的来源路径) 列表。
+    """
+    files = []
+    for dirpath, _, filenames in os.walk(root_dir):
+        for filename in filenames:
+            if filename.endswith('.csv'):
+                filepath = os.path.join(dirpath, filename)
+                files.append((filepath, source_path(root_dir, filepath)))
+    return files
+
+
+def source_path(root_dir, filepath):
+    """
+    文件相对数据目录的路径（统一使用 / 分隔），用作 source_file 和导入清单的键。
+    """
+    return os.path.relpath(filepath, root_dir).replace(os.sep, '/')
+
+
+# ---------------- 导入清单 ----------------
+# import_manifest 表记录每个源文件导入时的大小、修改时间和内容哈希，
+# 启动时只重新导入新增或发生变化的文件；已导入数据通过 water_quality_data.source_file 关联到文件。
+# 鱼类数据文件的记录也在这张表中，键加上 FISH_MANIFEST_PREFIX，水质目录的同步不会把它当作已删除的源文件。
+
+FISH_MANIFEST_PREFIX = "fish:"
+
+
+def file_hash(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_file_changed(filepath, path, old):
+    """
+    比较文件与清单中的旧记录 old=(size, mtime_ns, content_hash)。
+    返回 (状态, 新记录)，状态为 "unchanged"（大小和修改时间都没变，不计算哈希）、
+    "touched"（只是修改时间变了，内容相同）或 "changed"（新增或内容变化）。
+    """
+    st = os.stat(filepath)
+    info = {"path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "content_hash": None}
+    if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+        info["content_hash"] = old[2]
+        return "unchanged", info
+    info["content_hash"] = file_hash(filepath)
+    if old and old[2] == info["content_hash"]:
+        return "touched", info
+    return "changed", info
+
+
+def _load_manifest(cursor):
+    """
+    水质源文件的清单记录 {路径: (size, mtime_ns, content_hash)}，不包含鱼类数据文件的记录。
+    """
+    cursor.execute(
+        "SELECT path, size, mtime_ns, content_hash FROM import_manifest WHERE path NOT LIKE %s",
+        (FISH_MANIFEST_PREFIX + "%",)
+    )
+    manifest = {}
+    for row in cursor.fetchall():
+        if isinstance(row, dict):
+            row = (row["path"], row["size"], row["mtime_ns"], row["content_hash"])
+        manifest[row[0]] = (row[1], row[2], row[3])
+    return manifest
+
+
+def _save_manifest(cursor, info, row_count):
+    cursor.execute("DELETE FROM import_manifest WHERE path = %s", (info["path"],))
+    cursor.execute(
+        "INSERT INTO import_manifest (path, size, mtime_ns, content_hash, row_count, imported_at) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        (info["path"], info["size"], info["mtime_ns"], info["content_hash"], row_count, datetime.now())
+    )
+
+
+def _touch_manifest(cursor, info):
+    cursor.execute(
+        "UPDATE import_manifest SET size = %s, mtime_ns = %s WHERE path = %s",
+        (info["size"], info["mtime_ns"], info["path"])
+    )
+
+
+def _delete_file_rows(cursor, source):
+    """
+    删除某个源文件导入的数据，返回被删除数据涉及的汇总键。
+    """
+    keys = water_rollups.keys_for_source(cursor, source)
+    cursor.execute("DELETE FROM water_quality_data WHERE source_file = %s", (source,))
+    water_anomalies.forget_source(cursor, source)
+    return keys
+
+
+def _after_import(db_config, keys, changed):
+    """
+    导入提交后更新 Parquet 镜像和按日快照，把新断面加入断面索引（在应用进程中导入时），
+    并使涉及的断面的查询缓存失效（changed 为 False 时没有写入，不做失效）。
+    """
+    water_parquet.sync_partitions(lambda: connect_db(db_config), keys)
+    water_snapshots.sync_snapshots(lambda: connect_db(db_config), keys)
+    if changed:
+        site_ids = {site_id for site_id, _ in keys}
+        site_index.add_sites(site_ids)
+        query_cache.invalidate_sites(site_ids)
+
+
+def _print_summary(summary):
+    elapsed = summary["seconds"]
+    rate = summary["rows"] / elapsed if elapsed > 0 else 0.0
+    print(f"导入统计: 文件 {len(summary['files'])} 个，成功 {summary['rows']} 行，"
+          f"拒绝 {summary['rejected']} 行，无法转换的数值 {summary.get('conversion_failures', 0)} 个，耗时 {elapsed:.2f}s，速度 {rate:.0f} 行/秒")
+    for item in summary["files"]:
+        print(f"  {item['file']}: {item['rows']} 行，拒绝 {item['rejected']} 行，{item['seconds']:.3f}s")
+
+
+def import_csv_to_mysql(root_dir, db_config, batch_size=None):
     """
     遍历指定目录下的所有CSV文件，并将其内容导入MySQL数据库。
+    数据按 batch_size 行一批写入，每个文件单独提交一次事务。
+    返回导入统计：总行数、拒绝行数、总耗时以及每个文件的耗时。
     """
+    batch_size = max(1, int(batch_size or config.IMPORT_BATCH_SIZE))
+    summary = {"rows": 0, "rejected": 0, "seconds": 0.0, "files": []}
+    import_keys = set()
+    start = time.perf_counter()
     conn = None
     try:
-        conn = pymysql.connect(**db_config)
+        conn = connect_db(db_config)
         cursor = conn.cursor()
 
-        sql = """
-        INSERT INTO water_quality_data (
-            province, river_basin, section_name, monitoring_time, water_quality_category,
-            temperature, ph, dissolved_oxygen, conductivity, turbidity,
-            permanganate_index, ammonia_nitrogen, total_phosphorus, total_nitrogen,
-            chlorophyll_a, algae_density, site_status
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
+        for filepath, source in _list_csv_files(root_dir):
+            print(f"正在处理文件: {filepath}")
+            stats = _import_file(conn, cursor, filepath, batch_size, source,
+                                 lambda: connect_db(db_config), import_keys)
+            if stats is None:
+                continue
+            _add_file_stats(summary, stats)
+            print(f"文件 {filepath} 处理完成。")
+        print("所有CSV文件导入完成。")
+    except pymysql.Error as e:
+        print(f"数据库错误: {e}")
+        if conn:
+            conn.rollback()
+    except Exception as e:
+        print(f"发生其他错误: {e}")
+    finally:
+        if conn:
+            conn.close()
+    _after_import(db_config, import_keys, bool(summary["files"]))
+    summary["seconds"] = time.perf_counter() - start
+    _print_summary(summary)
+    return summary
+
+
+# ---------------- 多进程并行导入 ----------------
+# 工作进程负责解析和转换CSV，通过有界队列把待插入的批次交给主进程中唯一的写入者。
+# 写入者先在内存中缓存每个文件的批次（同时处理中的文件数不超过工作进程数，单个文件只有几百行），
+# 收到文件的完成消息后在一个短事务中删除旧数据、插入、记录清单并提交，出错时丢弃缓存，
+# 因此仍然保持"一个文件一个事务"的语义。同一时刻只有一个写事务：如果每个文件各开一个事务，
+# MySQL 在 REPEATABLE READ 下按 source_file 删除时加的间隙锁会挡住其他文件的插入，
+# 而这些事务都由同一个写入者推进，会互相等待直到锁超时。
+
+_worker_queue = None
+_worker_batch_size = config.IMPORT_BATCH_SIZE
+
+
+def _init_parse_worker(queue, batch_size):
+    global _worker_queue, _worker_batch_size
+    _worker_queue = queue
+    _worker_batch_size = batch_size
+
+
+def _parse_worker(task):
+    """
+    工作进程入口：解析一个文件并把批次放入队列，最后发送 done/error 消息。
+    """
+    filepath, source = task
+    stats = new_import_stats(filepath)
+    start = time.perf_counter()
+    try:
+        for batch in _parse_file(filepath, _worker_batch_size, stats, source):
+            _worker_queue.put(("batch", filepath, batch))
+    except Exception as e:
+        _worker_queue.put(("error", filepath, str(e)))
+        return
+    stats["seconds"] = time.perf_counter() - start
+    _worker_queue.put(("done", filepath, stats))
+
+
+def _child_pids():
+    return {child.pid for child in psutil.Process().children()}
+
+
+def _check_parse_workers(tasks, worker_pids):
+    """
+    等待队列超时时调用：有解析进程已经退出（被 OOM 杀死或 C 扩展崩溃，来不及发送 done/error，
+    进程池会换上新进程，但它正在处理的文件不会再有消息），或者所有解析任务都已结束但仍有文件没有完成消息时，
+    抛出 RuntimeError 中止导入，避免一直等待。
+    """
+    for pid in worker_pids:
+        try:
+            alive = psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            alive = False
+        if not alive:
+            raise RuntimeError(f"解析进程 {pid} 意外退出，中止导入")
+    if tasks.ready():
+        tasks.get()  # 任务本身抛出的异常在这里重新抛出
+        raise RuntimeError("解析任务已全部结束，但部分文件没有收到完成消息")
+
+
+def import_csv_parallel(root_dir, db_config, workers=None, queue_size=None, batch_size=None, manifest=None):
+    """
+    多进程版本的 import_csv_to_mysql：workers 个进程并行解析文件，
+    队列最多缓存 queue_size 个批次，主进程负责写入数据库。
+    manifest 为 {文件路径: 清单记录} 时只导入这些文件，并按清单替换每个文件的旧数据。
+    返回与 import_csv_to_mysql 相同结构的统计信息，并额外包含 workers 和 failed。
+    """
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or config.IMPORT_QUEUE_SIZE
+    batch_size = max(1, int(batch_size or config.IMPORT_BATCH_SIZE))
+    if manifest is None:
+        files = _list_csv_files(root_dir)
+    else:
+        files = [(filepath, info["path"]) for filepath, info in manifest.items()]
+    sources = dict(files)
+    summary = {"rows": 0, "rejected": 0, "seconds": 0.0, "files": [], "failed": [], "workers": workers}
+    start = time.perf_counter()
+    if not files:
+        print("没有找到需要导入的CSV文件。")
+        return summary
+
+    queue = multiprocessing.Queue(maxsize=max(1, int(queue_size)))
+    existing_children = _child_pids()
+    pool = multiprocessing.Pool(workers, initializer=_init_parse_worker, initargs=(queue, batch_size))
+    # 进程池的工作进程（不设 maxtasksperchild，正常情况下导入结束前不会退出）
+    worker_pids = _child_pids() - existing_children
+    pending = {}  # 正在解析的文件 -> 已编码、等待写入的批次
+    import_keys = set()  # 已提交文件的汇总键，导入结束后用于更新 Parquet 镜像
+    finished = 0
+    conn = None
+
+    def write_file(filepath, batches, stats):
+        """
+        在一个事务中写入文件的全部批次并提交，统计计入 stats。
         """
+        write_start = time.perf_counter()
+        print(f"正在处理文件: {filepath}")
+        cursor = conn.cursor()
+        keys = set()
+        if manifest is not None:
+            keys |= _delete_file_rows(cursor, manifest[filepath]["path"])
+        for batch in batches:
+            inserted, rejected = insert_batch(cursor, batch, connect, keys, encoded=True)
+            stats["rows"] += inserted
+            stats["rejected"] += rejected
+        if manifest is not None:
+            # 清单模式下空文件也要清除旧数据并记录清单
+            _save_manifest(cursor, manifest[filepath], stats["rows"])
+        water_rollups.refresh_rollups(cursor, keys)
+        water_anomalies.observe_source(cursor, sources[filepath])
+        conn.commit()
+        import_keys.update(keys)
+        stats["seconds"] = max(stats["seconds"], time.perf_counter() - write_start)
+
+    def connect():
+        return connect_db(db_config)
+
+    try:
+        conn = connect()
+        tasks = pool.map_async(_parse_worker, files, chunksize=1)
+        while finished < len(files):
+            try:
+                kind, filepath, payload = queue.get(timeout=config.IMPORT_QUEUE_TIMEOUT)
+            except Empty:
+                _check_parse_workers(tasks, worker_pids)
+                continue
 
-        for dirpath, _, filenames in os.walk(root_dir):
-            for filename in filenames:
-                if filename.endswith('.csv'):
-                    filepath = os.path.join(dirpath, filename)
-                    print(f"正在处理文件: {filepath}")
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        reader = csv.reader(f)
-                        # 跳过CSV文件的标题行
-                        try:
-                            header = next(reader)
-                            print(f"CSV文件标题行: {header}")
-                        except StopIteration:
-                            print(f"警告: 文件 {filepath} 为空，跳过。")
-                            continue
-
-                        for i, row in enumerate(reader):
-                            if not row:
-                                continue
-                            
-                            # 确保行数据与数据库字段数量匹配 (期望17列)
-                            if len(row) != 17:
-                                print(f"警告: 文件 {filepath} 中第 {i+2} 行数据列数不匹配 (期望17列，实际{len(row)}列)，跳过。行内容: {row}")
-                                continue
-
-                            try:
-                                processed_row = []
-                                for j, value in enumerate(row):
-                                    # 数值字段索引
-                                    numeric_indices = [5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
-                                    if j in numeric_indices:
-                                        if value == '*' or value == '':
-                                            processed_row.append(None)
-                                        else:
-                                            try:
-                                                processed_row.append(float(value))
-                                            except ValueError:
-                                                print(f"警告: 无法转换 '{value}' 为浮动数，设置为NULL")
-                                                processed_row.append(None)
-                                    else:
-                                        processed_row.append(value if value else None)
-
-                                cursor.execute(sql, tuple(processed_row))
-                            except Exception as e:
-                                print(f"插入数据时发生错误: {e}")
-                                continue
-                        conn.commit()
-                    print(f"文件 {filepath} 处理完成。")
+            if kind == "batch":
+                # 维度值在写事务之外编码：新出现的值由另一个连接写入并立即提交
+                pending.setdefault(filepath, []).append(dims.encode_rows(payload, connect))
+                continue
+
+            finished += 1
+            batches = pending.pop(filepath, [])
+            if kind == "error":
+                print(f"文件 {filepath} 解析失败，已丢弃: {payload}")
+                summary["failed"].append(filepath)
+            elif batches or manifest is not None:
+                write_file(filepath, batches, payload)
+                payload["empty"] = False
+            if kind == "done" and not payload["empty"]:
+                _add_file_stats(summary, payload)
+                print(f"文件 {filepath} 处理完成。")
+
+            if finished % 50 == 0 or finished == len(files):
+                elapsed = time.perf_counter() - start
+                rate = summary["rows"] / elapsed if elapsed > 0 else 0.0
+                print(f"进度: {finished}/{len(files)} 个文件，已导入 {summary['rows']} 行，{rate:.0f} 行/秒")
         print("所有CSV文件导入完成。")
     except pymysql.Error as e:
         print(f"数据库错误: {e}")
+    except Exception as e:
+        print(f"发生其他错误: {e}")
+    finally:
+        pool.terminate()
+        pool.join()
         if conn:
             conn.rollback()
-    except Exception as e: 
-        print(f"发生其他错误: {e}")
+            conn.close()
+    _after_import(db_config, import_keys, bool(summary["files"]))
+    summary["seconds"] = time.perf_counter() - start
+    print(f"并行导入: {workers} 个工作进程，队列深度 {queue_size}，失败文件 {len(summary['failed'])} 个")
+    _print_summary(summary)
+    return summary
+
+
+def sync_csv_directory(root_dir, db_config, workers=None, queue_size=None, batch_size=None):
+    """
+    按导入清单增量同步目录：只导入新增或内容变化的文件（先删除该文件的旧数据再插入），
+    删除已不存在的文件对应的数据，未变化的文件直接跳过。
+    返回导入统计，并额外包含 new/changed/unchanged/removed 文件数。
+    """
+    start = time.perf_counter()
+    counts = {"new": 0, "changed": 0, "unchanged": 0, "removed": 0}
+    pending = {}
+    removed_keys = set()
+    conn = None
+    try:
+        conn = connect_db(db_config)
+        cursor = conn.cursor()
+        manifest = _load_manifest(cursor)
+
+        for filepath, path in _list_csv_files(root_dir):
+            old = manifest.pop(path, None)
+            state, info = check_file_changed(filepath, path, old)
+            if state == "unchanged":
+                counts["unchanged"] += 1
+            elif state == "touched":
+                _touch_manifest(cursor, info)
+                counts["unchanged"] += 1
+            else:
+                counts["changed" if old else "new"] += 1
+                pending[filepath] = info
+
+        # 清单中剩下的是已被删除的源文件
+        for path in manifest:
+            print(f"源文件已删除，清除其数据: {path}")
+            removed_keys |= _delete_file_rows(cursor, path)
+            cursor.execute("DELETE FROM import_manifest WHERE path = %s", (path,))
+            counts["removed"] += 1
+        water_rollups.refresh_rollups(cursor, removed_keys)
+        conn.commit()
+    except pymysql.Error as e:
+        print(f"数据库错误: {e}")
+        if conn:
+            conn.rollback()
+        pending = {}
+        removed_keys = set()
     finally:
         if conn:
             conn.close()
+    _after_import(db_config, removed_keys, counts["removed"])
+
+    print(f"导入清单: 新增 {counts['new']} 个，变化 {counts['changed']} 个，"
+          f"未变化 {counts['unchanged']} 个，已删除 {counts['removed']} 个，"
+          f"检查耗时 {time.perf_counter() - start:.2f}s")
+    if not pending:
+        summary = {"rows": 0, "rejected": 0, "seconds": time.perf_counter() - start, "files": []}
+    else:
+        summary = import_csv_parallel(root_dir, db_config, workers=workers, queue_size=queue_size,
+                                      batch_size=batch_size, manifest=pending)
+    summary.update(counts)
+    return summary
+
+
+# ---------------- 鱼类数据 ----------------
+
+# Fish.csv 清理单位后的列名 -> fish_data 表字段
+FISH_COLUMNS = {
+    'Species': 'species',
+    'Weight': 'weight',
+    'Length1': 'length1',
+    'Length2': 'length2',
+    'Length3': 'length3',
+    'Height': 'height',
+    'Width': 'width',
+}
+
+
+def import_fish_data_from_csv(csv_file, chunksize=None, commit=True):
+    """
+    分块读取鱼类CSV并直接用 Core 层的批量 INSERT 写入 fish_data，不再逐行创建 ORM 对象。
+    所有分块在同一个事务中提交，返回导入行数；失败时回滚并返回 None。
+    commit 为 False 时不提交，由调用方把其他改动放进同一个事务后再提交。
+    """
+    chunksize = chunksize or config.FISH_IMPORT_CHUNKSIZE
+    try:
+        row_count = 0
+        # 使用 pandas 分块读取 CSV 文件，内存占用与文件大小无关
+        for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+            # 去除列名中的空格和单位
+            chunk.columns = chunk.columns.str.replace(r'\(.*\)', '', regex=True).str.strip()
+            if row_count == 0:
+                # 打印清理后的列名，确认修改效果
+                print("清理后的列名:", chunk.columns)
+
+            frame = chunk[list(FISH_COLUMNS)].rename(columns=FISH_COLUMNS)
+            frame = frame.astype(object).where(frame.notna(), None)
+            db.session.execute(FishData.__table__.insert(), frame.to_dict('records'))
+            row_count += len(frame)
+
+        if commit:
+            db.session.commit()
+
+        print(f"鱼类数据已成功导入数据库！共 {row_count} 行")
+        return row_count
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"导入数据时发生错误: {e}")
+        return None
+
+
+def sync_fish_data_from_csv(csv_file):
+    """
+    根据导入清单判断 Fish.csv 是否变化，只有新增或内容变化时才整表替换鱼类数据。
+    """
+    path = FISH_MANIFEST_PREFIX + os.path.basename(csv_file)
+    entry = ImportManifest.query.filter_by(path=path).first()
+    old = (entry.size, entry.mtime_ns, entry.content_hash) if entry else None
+    state, info = check_file_changed(csv_file, path, old)
+    if state != "changed":
+        if state == "touched":
+            entry.size = info["size"]
+            entry.mtime_ns = info["mtime_ns"]
+            db.session.commit()
+        print(f"{path} 未变化，跳过导入。")
+        return
+
+    # 删除、导入和清单更新在同一个事务中提交，任何一步失败时旧数据和旧清单随之回滚
+    FishData.query.delete()
+    row_count = import_fish_data_from_csv(csv_file, commit=False)
+    if row_count is None:
+        return
+    try:
+        if entry is None:
+            entry = ImportManifest(path=path)
+            db.session.add(entry)
+        entry.size = info["size"]
+        entry.mtime_ns = info["mtime_ns"]
+        entry.content_hash = info["content_hash"]
+        entry.row_count = row_count
+        entry.imported_at = datetime.now()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"更新鱼类数据导入清单时发生错误: {e}")
@@ -16,14 +16,47 @@ class User(db.Model):
 
 
 
+# 维度表：断面层级、水质类别、站点情况。water_quality_data 通过整数 id 引用，名称转换见 water_dims.py
+class WaterSite(db.Model):
+    __tablename__ = 'water_site'
+    __table_args__ = (
+        db.UniqueConstraint('province', 'river_basin', 'section_name', name='uq_water_site'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    province = db.Column(db.String(255))
+    river_basin = db.Column(db.String(255))
+    section_name = db.Column(db.String(255))
+
+
+class WaterCategory(db.Model):
+    __tablename__ = 'water_category'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(255), nullable=False, unique=True)
+
+
+class WaterSiteStatus(db.Model):
+    __tablename__ = 'water_site_status'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(255), nullable=False, unique=True)
+
+
 # Water Quality Data Model
 class WaterQualityData(db.Model):
     __tablename__ = 'water_quality_data'
+    __table_args__ = (
+        # 按省份/流域/断面过滤并按时间排序的查询走这个复合索引
+        db.Index('ix_water_site_time', 'province', 'river_basin', 'section_name', 'monitoring_at'),
+        # 规范化存储时按断面 id 过滤并按时间排序
+        db.Index('ix_water_site_id_time', 'site_id', 'monitoring_at'),
+        # 按日期取全国所有断面（/api/TimeWaterData）
+        db.Index('ix_water_time', 'monitoring_at'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     province = db.Column(db.String(255))
     river_basin = db.Column(db.String(255))
     section_name = db.Column(db.String(255))
-    monitoring_time = db.Column(db.String(255))
+    monitoring_time = db.Column(db.String(255))  # 原始监测时间字符串，接口原样返回
+    monitoring_at = db.Column(db.DateTime)  # 解析后的监测时间，用于排序和时间范围过滤
     water_quality_category = db.Column(db.String(255))
     temperature = db.Column(db.Numeric(10, 2))
     ph = db.Column(db.Numeric(10, 2))
@@ -37,6 +70,92 @@ class WaterQualityData(db.Model):
     chlorophyll_a = db.Column(db.Numeric(10, 3))
     algae_density = db.Column(db.BigInteger)
     site_status = db.Column(db.String(255))
+    source_file = db.Column(db.String(512), index=True)  # 导入来源文件（相对路径），手动添加的数据为空
+    site_id = db.Column(db.Integer, db.ForeignKey('water_site.id'))
+    category_id = db.Column(db.Integer, db.ForeignKey('water_category.id'))
+    status_id = db.Column(db.Integer, db.ForeignKey('water_site_status.id'))
+
+
+# 水质指标的日/月汇总（长表，每个断面、周期、指标一行），由 water_rollups.py 增量维护
+class WaterRollupDaily(db.Model):
+    __tablename__ = 'water_rollup_daily'
+    __table_args__ = (
+        db.UniqueConstraint('site_id', 'period_start', 'indicator', name='uq_water_rollup_daily'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    site_id = db.Column(db.Integer, db.ForeignKey('water_site.id'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)  # 当天日期
+    indicator = db.Column(db.String(32), nullable=False)  # water_quality_data 的数值列名
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    sum_value = db.Column(db.Float)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class WaterRollupMonthly(db.Model):
+    __tablename__ = 'water_rollup_monthly'
+    __table_args__ = (
+        db.UniqueConstraint('site_id', 'period_start', 'indicator', name='uq_water_rollup_monthly'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    site_id = db.Column(db.Integer, db.ForeignKey('water_site.id'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)  # 当月第一天
+    indicator = db.Column(db.String(32), nullable=False)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    sum_value = db.Column(db.Float)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# 异常检测（见 water_anomalies.py）：每个断面每个指标的滚动统计状态，以及被标记的读数
+class WaterAnomalyState(db.Model):
+    __tablename__ = 'water_anomaly_state'
+    site_id = db.Column(db.Integer, db.ForeignKey('water_site.id'), primary_key=True)
+    indicator = db.Column(db.String(32), primary_key=True)
+    value_count = db.Column(db.Integer, nullable=False, default=0)  # 参与统计的读数个数
+    ewma_mean = db.Column(db.Float)
+    ewma_variance = db.Column(db.Float)
+    last_at = db.Column(db.DateTime)  # 已参与统计的最新监测时间
+
+
+class WaterAnomaly(db.Model):
+    __tablename__ = 'water_anomaly'
+    __table_args__ = (
+        db.Index('ix_water_anomaly_site_time', 'site_id', 'monitoring_at'),
+        db.Index('ix_water_anomaly_time', 'monitoring_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    site_id = db.Column(db.Integer, db.ForeignKey('water_site.id'), nullable=False)
+    monitoring_at = db.Column(db.DateTime, nullable=False)
+    indicator = db.Column(db.String(32), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    method = db.Column(db.String(16), nullable=False)  # limit（超出硬阈值）或 zscore（偏离滚动均值）
+    score = db.Column(db.Float)  # zscore 方法的 z 值
+    expected = db.Column(db.Float)  # 读数到达前的滚动均值
+    source_file = db.Column(db.String(512), index=True)  # 来源，删除或重新导入源文件时一并清除
+
+
+# 全国按日快照（/api/TimeWaterData 的响应体），由 water_snapshots.py 预先生成并在写入后更新
+class WaterSnapshot(db.Model):
+    __tablename__ = 'water_snapshot'
+    snapshot_date = db.Column(db.Date, primary_key=True)
+    body = db.Column(db.LargeBinary(length=2 ** 32 - 1), nullable=False)  # 紧凑 JSON（UTF-8）
+    etag = db.Column(db.String(64), nullable=False)  # 响应体的 SHA-256
+    site_count = db.Column(db.Integer, nullable=False, default=0)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    built_at = db.Column(db.DateTime)
+
+
+# 导入清单：记录每个源文件上次导入时的大小、修改时间和内容哈希，用于启动时增量导入
+class ImportManifest(db.Model):
+    __tablename__ = 'import_manifest'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    path = db.Column(db.String(512), nullable=False, unique=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    imported_at = db.Column(db.DateTime)
 
 
 class FishData(db.Model):
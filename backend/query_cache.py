@@ -0,0 +1,323 @@
+"""
+水质数据读接口的查询结果缓存（/api/waterdata_by_name、/api/waterdata_rollup、/api/getwaterqualitydata）。
+
+缓存的是完整的响应体，按 路径 + 查询参数 区分，进程内按最近最少使用（LRU）淘汰，
+总字节数不超过 config.QUERY_CACHE_MAX_BYTES，单个响应超过 QUERY_CACHE_MAX_ENTRY_BYTES 时不缓存。
+
+失效是按标签进行的：每个条目记录它依赖的标签（省份、断面或整张表）在查询前的版本号，
+写入提交后调用 invalidate_sites 增加受影响断面所在标签的版本号，版本号变化的条目在下次读取时丢弃。
+因此修改一个断面的数据只会使该断面、所在省份以及整表分页的结果失效，其他省份的缓存不受影响。
+
+缓存的响应带强 ETag（响应体的 SHA-256）和 Cache-Control: no-cache，
+浏览器再次请求时带上 If-None-Match，内容未变化则返回 304。
+
+config.QUERY_CACHE_SHARED_PATH 设为文件路径时，标签版本号和缓存条目另外保存在该 SQLite 文件中，
+同一台机器上的多个工作进程（以及单独运行的导入脚本）共享缓存，任一进程的写入都会使其他进程中相关的条目失效。
+"""
+from collections import OrderedDict
+from contextlib import closing
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode
+
+from flask import Response, make_response, request
+
+import config
+from water_dims import dims
+
+# 所有条目都依赖的标签，无法确定受影响的断面时增加它的版本号，使全部缓存失效
+ALL_TAG = "*"
+# 整张 water_quality_data 表（/api/getwaterqualitydata 按 id 分页），任何写入都会使它失效
+TABLE_TAG = "table"
+
+
+def province_tag(province):
+    return f"province:{province}"
+
+
+def site_tag(province, river_basin, section_name):
+    return f"site:{province}/{river_basin}/{section_name}"
+
+
+def etag_for(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+class _SharedStore:
+    """
+    多进程共享的 SQLite 存储：tag_versions 保存标签版本号，entries 保存缓存条目（按 accessed 淘汰）。
+    每次操作使用新的连接，可以在任意线程中调用。
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS tag_versions (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT NOT NULL, "
+                "mimetype TEXT NOT NULL, versions TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def versions(self, tags):
+        tags = list(tags)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT tag, version FROM tag_versions WHERE tag IN ({', '.join(['?'] * len(tags))})", tags
+            ).fetchall()
+        current = dict(rows)
+        return {tag: current.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO tag_versions (tag, version) VALUES (?, 1) "
+                "ON CONFLICT(tag) DO UPDATE SET version = version + 1",
+                [(tag,) for tag in tags]
+            )
+
+    def get(self, key, now):
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT body, etag, mimetype, versions FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        body, etag, mimetype, versions = row
+        return {"body": bytes(body), "etag": etag, "mimetype": mimetype, "versions": json.loads(versions)}
+
+    def put(self, key, entry, now):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, body, etag, mimetype, versions, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, entry["body"], entry["etag"], entry["mimetype"], json.dumps(entry["versions"]),
+                 len(entry["body"]), now)
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evict = []
+            for old_key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                if total <= self.max_bytes:
+                    break
+                evict.append((old_key,))
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", evict)
+
+    def delete(self, key):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+
+class QueryCache:
+    """
+    进程内 LRU 缓存，可选地以 _SharedStore 作为第二级。
+    条目为 {"body", "etag", "mimetype", "versions"}，versions 是 {标签: 查询前的版本号}。
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes, shared_path=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.store = _SharedStore(shared_path, max_bytes) if shared_path else None
+        self._entries = OrderedDict()
+        self._size = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def versions(self, tags):
+        tags = list(dict.fromkeys(list(tags) + [ALL_TAG]))
+        if self.store:
+            return self.store.versions(tags)
+        with self._lock:
+            return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def _remember(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old["body"])
+            self._entries[key] = entry
+            self._size += len(entry["body"])
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted["body"])
+
+    def _forget(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old["body"])
+
+    def get(self, key):
+        """
+        返回仍然有效的条目，没有或已失效时返回 None（失效的条目同时删除）。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.store:
+            entry = self.store.get(key, time.time())
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is not None and self.versions(entry["versions"]) != entry["versions"]:
+            self._forget(key)
+            if self.store:
+                self.store.delete(key)
+            entry = None
+        return entry
+
+    def put(self, key, body, mimetype, versions):
+        """
+        保存响应体并返回它的 ETag；超过单条上限的响应只计算 ETag，不缓存。
+        """
+        entry = {"body": body, "etag": etag_for(body), "mimetype": mimetype, "versions": versions}
+        if len(body) <= self.max_entry_bytes:
+            self._remember(key, entry)
+            if self.store:
+                self.store.put(key, entry, time.time())
+        return entry["etag"]
+
+    def invalidate(self, tags):
+        """
+        增加这些标签的版本号；共享存储失败时清空本进程的缓存，并且继续抛出异常。
+        """
+        tags = set(tags)
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+        if self.store:
+            try:
+                self.store.bump(tags)
+            except Exception:
+                with self._lock:
+                    self._entries.clear()
+                    self._size = 0
+                raise
+
+    def clear(self):
+        self.invalidate([ALL_TAG])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(config, "QUERY_CACHE_MAX_BYTES", 0) > 0
+
+
+def get_cache():
+    """
+    按 config 创建进程内的缓存实例（第一次使用时创建）。
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache(
+                config.QUERY_CACHE_MAX_BYTES,
+                getattr(config, "QUERY_CACHE_MAX_ENTRY_BYTES", config.QUERY_CACHE_MAX_BYTES),
+                getattr(config, "QUERY_CACHE_SHARED_PATH", None),
+            )
+        return _cache
+
+
+def invalidate_sites(site_ids):
+    """
+    写入提交后调用：使涉及这些断面（site_id）的缓存结果失效，整表分页的结果总是失效。
+    断面 id 不在维度缓存中时无法确定名称，使全部缓存失效。失败时只打印错误，不影响调用方。
+    """
+    if not enabled():
+        return
+    tags = {TABLE_TAG}
+    for site_id in site_ids:
+        if site_id is None:
+            continue
+        names = dims.sites.by_id.get(site_id)
+        if names is None:
+            tags.add(ALL_TAG)
+        else:
+            tags.add(province_tag(names[0]))
+            tags.add(site_tag(*names))
+    try:
+        get_cache().invalidate(tags)
+    except Exception as e:
+        print(f"查询缓存失效失败，已清空本进程缓存: {e}")
+
+
+def _request_key():
+    return request.path + "?" + urlencode(sorted(request.args.items(multi=True)))
+
+
+def _conditional(response, etag, status):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Cache"] = status
+    return response.make_conditional(request)
+
+
+def _tee(cache, chunks, key, mimetype, versions, charset="utf-8"):
+    """
+    原样转发流式响应的数据块，同时收集完整的响应体；完整发送且不超过单条上限时存入缓存。
+    客户端中途断开时不缓存。
+    """
+    parts, size = [], 0
+    try:
+        for chunk in chunks:
+            if parts is not None:
+                data = chunk.encode(charset) if isinstance(chunk, str) else chunk
+                size += len(data)
+                if size > cache.max_entry_bytes:
+                    parts = None
+                else:
+                    parts.append(data)
+            yield chunk
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    if parts is not None:
+        cache.put(key, b"".join(parts), mimetype, versions)
+
+
+def cached(tags_for):
+    """
+    视图装饰器：缓存 200 响应。tags_for(request.args) 返回结果依赖的标签列表，
+    返回空值时不使用缓存（例如缺少参数，交给视图函数返回错误）。
+    流式响应第一次发送时不带 ETag，缓存后的响应带 ETag。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            tags = tags_for(request.args) if enabled() else None
+            if not tags:
+                return view(*args, **kwargs)
+            cache = get_cache()
+            key = _request_key()
+            entry = cache.get(key)
+            if entry is not None:
+                return _conditional(Response(entry["body"], mimetype=entry["mimetype"]), entry["etag"], "HIT")
+
+            # 在查询之前记录版本号：查询期间提交的写入会使这次的结果在下次读取时失效
+            versions = cache.versions(tags)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if response.is_streamed:
+                response.response = _tee(cache, response.response, key, response.mimetype, versions)
+                response.headers["X-Cache"] = "MISS"
+                return response
+            etag = cache.put(key, response.get_data(), response.mimetype, versions)
+            return _conditional(response, etag, "MISS")
+        return wrapper
+    return decorator
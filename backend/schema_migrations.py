@@ -0,0 +1,353 @@
+"""
+water_quality_data 表结构升级。
+
+切换规范化存储（见 water_dims.py）：先运行 python schema_migrations.py --normalize，
+再把 config.WATER_NORMALIZED_STORAGE 设为 True；回退时用 --denormalize。
+
+db.create_all() 只会创建缺失的表，不会修改已有表，这里的每个步骤都会先检查当前结构，
+因此可以在已有数据的表上重复执行。启动时由 app.init_db_and_import_data 调用，
+也可以单独运行：python schema_migrations.py
+"""
+import argparse
+import csv
+import os
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+import import_data
+from models import WaterQualityData
+
+TABLE = WaterQualityData.__tablename__
+
+# 回填 monitoring_at 时每个事务处理的行数
+BACKFILL_BATCH_SIZE = 5000
+
+# 维度 id 列及其对应的名称匹配条件（相关子查询），用于回填 id 和还原名称
+DIMENSION_COLUMNS = {
+    "site_id": (
+        "water_site",
+        "d.province = {t}.province AND d.river_basin = {t}.river_basin AND d.section_name = {t}.section_name",
+    ),
+    "category_id": ("water_category", "d.name = {t}.water_quality_category"),
+    "status_id": ("water_site_status", "d.name = {t}.site_status"),
+}
+# 维度 id 列 -> 它所替代的名称列
+DIMENSION_NAMES = {
+    "site_id": ("province", "river_basin", "section_name"),
+    "category_id": ("water_quality_category",),
+    "status_id": ("site_status",),
+}
+
+
+def _columns(engine):
+    return {column["name"] for column in inspect(engine).get_columns(TABLE)}
+
+
+def _indexes(engine):
+    return {index["name"] for index in inspect(engine).get_indexes(TABLE)}
+
+
+def _online(engine, separator):
+    """
+    MySQL 上使用在线 DDL，不锁表也不复制表，升级期间查询和写入照常进行。
+    """
+    if engine.dialect.name == "mysql":
+        return f"{separator}ALGORITHM=INPLACE{separator}LOCK=NONE"
+    return ""
+
+
+# 认领旧数据时每次写入临时表的行数
+LEGACY_KEY_BATCH_SIZE = 5000
+# 旧数据与CSV行的匹配键（旧版导入原样保存这些字段，空串保存为 NULL）
+LEGACY_KEY_COLUMNS = ("province", "river_basin", "section_name", "monitoring_time")
+# 认领旧数据用的临时表。用普通表而不是 TEMPORARY 表：MySQL 不允许在一条语句中两次引用同一个临时表；
+# 它在添加 source_file 列之前创建、认领并清空导入清单之后才删除，存在就表示上次升级没有完成
+LEGACY_KEYS_TABLE = "legacy_source_keys"
+
+
+def _create_legacy_keys(engine):
+    columns = ", ".join(LEGACY_KEY_COLUMNS)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {LEGACY_KEYS_TABLE}"))
+        conn.execute(text(
+            f"CREATE TABLE {LEGACY_KEYS_TABLE} ("
+            "province VARCHAR(255), river_basin VARCHAR(255), section_name VARCHAR(255), "
+            "monitoring_time VARCHAR(255), source_file VARCHAR(512))"
+        ))
+        conn.execute(text(f"CREATE INDEX ix_{LEGACY_KEYS_TABLE} ON {LEGACY_KEYS_TABLE} ({columns})"))
+
+
+def _claim_legacy_rows(engine, csv_root):
+    """
+    把旧表中与 csv_root 下某个CSV文件的行 (省份, 流域, 断面, 监测时间) 相同的数据标记为来自该文件。
+    之后清空的导入清单使所有文件重新导入，导入前按 source_file 删除的正是这些行；
+    匹配不到的行（通过 /api/addwaterqualitydata 手动添加的数据）source_file 保持为空，不会被删除。
+    只更新 source_file 为空的行，中断后可以重复执行。返回标记的行数。
+    """
+    columns = ", ".join(LEGACY_KEY_COLUMNS)
+    placeholders = ", ".join(f":{column}" for column in LEGACY_KEY_COLUMNS)
+    insert = text(f"INSERT INTO {LEGACY_KEYS_TABLE} ({columns}, source_file) VALUES ({placeholders}, :source_file)")
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {LEGACY_KEYS_TABLE}"))
+        for filepath, source in import_data._list_csv_files(csv_root):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                batch = []
+                for row in reader:
+                    if len(row) != 17:
+                        continue
+                    batch.append(dict(zip(LEGACY_KEY_COLUMNS, (value or None for value in row[:4])), source_file=source))
+                    if len(batch) >= LEGACY_KEY_BATCH_SIZE:
+                        conn.execute(insert, batch)
+                        batch = []
+                if batch:
+                    conn.execute(insert, batch)
+
+    if engine.dialect.name == "mysql":
+        # MySQL 用 <=> 做可比较 NULL 的相等判断，UPDATE ... JOIN 只扫描一遍临时表
+        match = " AND ".join(f"k.{column} <=> w.{column}" for column in LEGACY_KEY_COLUMNS)
+        sql = (
+            f"UPDATE {TABLE} w JOIN (SELECT {columns}, MIN(source_file) AS source_file "
+            f"FROM {LEGACY_KEYS_TABLE} GROUP BY {columns}) k ON {match} "
+            "SET w.source_file = k.source_file WHERE w.source_file IS NULL"
+        )
+    else:
+        match = " AND ".join(f"k.{column} IS {TABLE}.{column}" for column in LEGACY_KEY_COLUMNS)
+        sql = (
+            f"UPDATE {TABLE} SET source_file = "
+            f"(SELECT MIN(k.source_file) FROM {LEGACY_KEYS_TABLE} k WHERE {match}) "
+            f"WHERE source_file IS NULL AND EXISTS (SELECT 1 FROM {LEGACY_KEYS_TABLE} k WHERE {match})"
+        )
+    with engine.begin() as conn:
+        return conn.execute(text(sql)).rowcount
+
+
+def add_source_file(engine, csv_root=None):
+    """
+    旧版本创建的 water_quality_data 表没有 source_file 列，无法按文件替换数据。
+    检测到时添加该列（为空表示手动添加的数据），把能与 csv_root 中CSV行对应的旧数据标记为来自该文件，
+    并清空导入清单：随后的增量同步重新导入所有文件，先删除的只有这些已标记的行，手动添加的数据保留。
+    MySQL 的 DDL 会隐式提交，各步骤无法放进一个事务；临时表 LEGACY_KEYS_TABLE 仍然存在时说明上次中断，
+    即使列已经存在也从认领开始重做。
+    """
+    if "source_file" in _columns(engine) and not inspect(engine).has_table(LEGACY_KEYS_TABLE):
+        return False
+    print("检测到旧版 water_quality_data 表，添加 source_file 列...")
+    _create_legacy_keys(engine)
+    if "source_file" not in _columns(engine):
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN source_file VARCHAR(512) NULL{_online(engine, ', ')}"))
+    if f"ix_{TABLE}_source_file" not in _indexes(engine):
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE INDEX ix_{TABLE}_source_file ON {TABLE} (source_file)"))
+    if csv_root and os.path.isdir(csv_root):
+        print(f"已标记 {_claim_legacy_rows(engine, csv_root)} 行旧数据的来源文件")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM import_manifest"))
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {LEGACY_KEYS_TABLE}"))
+    return True
+
+
+def add_monitoring_at(engine):
+    if "monitoring_at" in _columns(engine):
+        return False
+    print("添加 monitoring_at 列...")
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN monitoring_at DATETIME NULL{_online(engine, ', ')}"))
+    return True
+
+
+def backfill_monitoring_at(engine, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    按主键分批把 monitoring_time 解析为 monitoring_at，每批单独提交。
+    不带年份的时间用 source_file 路径中的 YYYY-MM 目录补全；无法解析的行保持 NULL。
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                f"SELECT id, monitoring_time, source_file FROM {TABLE} "
+                "WHERE id > :last_id AND monitoring_at IS NULL AND monitoring_time IS NOT NULL "
+                "ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": batch_size}).fetchall()
+            if not rows:
+                break
+            frame = pd.DataFrame(rows, columns=["id", "monitoring_time", "source_file"])
+            years = frame["source_file"].map(import_data.year_hint)
+            times = import_data.parse_monitoring_times(frame["monitoring_time"], years)
+            params = [
+                {"id": int(row_id), "monitoring_at": moment}
+                for row_id, moment in zip(frame["id"], times) if moment is not None
+            ]
+            if params:
+                conn.execute(text(f"UPDATE {TABLE} SET monitoring_at = :monitoring_at WHERE id = :id"), params)
+            updated += len(params)
+            last_id = int(frame["id"].iloc[-1])
+    if updated:
+        print(f"已回填 monitoring_at {updated} 行")
+    return updated
+
+
+def add_site_time_index(engine):
+    if "ix_water_site_time" in _indexes(engine):
+        return False
+    print("创建索引 ix_water_site_time...")
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX ix_water_site_time ON {TABLE} "
+            f"(province, river_basin, section_name, monitoring_at){_online(engine, ' ')}"
+        ))
+    return True
+
+
+def _update_by_id_range(engine, sql, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    按主键区间分批执行 UPDATE（sql 中用 :lo/:hi 限定 id 范围），每批单独提交，返回影响行数。
+    """
+    with engine.connect() as conn:
+        max_id = conn.execute(text(f"SELECT MAX(id) FROM {TABLE}")).scalar() or 0
+    updated = 0
+    for lo in range(0, max_id, batch_size):
+        with engine.begin() as conn:
+            result = conn.execute(text(sql), {"lo": lo, "hi": lo + batch_size})
+            updated += max(result.rowcount or 0, 0)
+    return updated
+
+
+def add_dimension_columns(engine):
+    existing = _columns(engine)
+    missing = [column for column in DIMENSION_COLUMNS if column not in existing]
+    if not missing:
+        return False
+    print(f"添加维度 id 列: {', '.join(missing)}...")
+    with engine.begin() as conn:
+        for column in missing:
+            conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN {column} INTEGER NULL{_online(engine, ', ')}"))
+    return True
+
+
+def backfill_dimension_ids(engine, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    根据名称列填充维度表，再分批为还没有 id 的行回填 site_id/category_id/status_id。
+    """
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO water_site (province, river_basin, section_name) "
+            f"SELECT DISTINCT w.province, w.river_basin, w.section_name FROM {TABLE} w "
+            "WHERE w.site_id IS NULL AND w.province IS NOT NULL AND NOT EXISTS ("
+            "SELECT 1 FROM water_site d WHERE d.province = w.province "
+            "AND d.river_basin = w.river_basin AND d.section_name = w.section_name)"
+        ))
+        for table, column in (("water_category", "water_quality_category"), ("water_site_status", "site_status")):
+            conn.execute(text(
+                f"INSERT INTO {table} (name) SELECT DISTINCT w.{column} FROM {TABLE} w "
+                f"WHERE w.{column} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {table} d WHERE d.name = w.{column})"
+            ))
+
+    assignments = ", ".join(
+        f"{column} = COALESCE({column}, (SELECT d.id FROM {table} d WHERE {match.format(t=TABLE)}))"
+        for column, (table, match) in DIMENSION_COLUMNS.items()
+    )
+    updated = _update_by_id_range(engine, (
+        f"UPDATE {TABLE} SET {assignments} "
+        "WHERE id > :lo AND id <= :hi AND (site_id IS NULL OR category_id IS NULL OR status_id IS NULL)"
+    ), batch_size)
+    if updated:
+        print(f"已回填维度 id {updated} 行")
+    return updated
+
+
+def add_site_id_index(engine):
+    if "ix_water_site_id_time" in _indexes(engine):
+        return False
+    print("创建索引 ix_water_site_id_time...")
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX ix_water_site_id_time ON {TABLE} (site_id, monitoring_at){_online(engine, ' ')}"
+        ))
+    return True
+
+
+def add_time_index(engine):
+    if "ix_water_time" in _indexes(engine):
+        return False
+    print("创建索引 ix_water_time...")
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX ix_water_time ON {TABLE} (monitoring_at){_online(engine, ' ')}"))
+    return True
+
+
+def normalize_names(engine, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    切换到规范化存储：已有维度 id 的行清空对应的名称列。配合 config.WATER_NORMALIZED_STORAGE = True 使用。
+    """
+    backfill_dimension_ids(engine, batch_size)
+    assignments = ", ".join(
+        f"{name} = CASE WHEN {column} IS NULL THEN {name} ELSE NULL END"
+        for column, names in DIMENSION_NAMES.items() for name in names
+    )
+    updated = _update_by_id_range(engine, f"UPDATE {TABLE} SET {assignments} WHERE id > :lo AND id <= :hi", batch_size)
+    print(f"已清空名称列 {updated} 行")
+    return updated
+
+
+def denormalize_names(engine, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    回到非规范化存储：根据维度 id 把名称写回名称列。
+    """
+    assignments = ", ".join(
+        f"{name} = COALESCE({name}, (SELECT d.{'name' if column != 'site_id' else name} "
+        f"FROM {DIMENSION_COLUMNS[column][0]} d WHERE d.id = {TABLE}.{column}))"
+        for column, names in DIMENSION_NAMES.items() for name in names
+    )
+    updated = _update_by_id_range(engine, f"UPDATE {TABLE} SET {assignments} WHERE id > :lo AND id <= :hi", batch_size)
+    print(f"已还原名称列 {updated} 行")
+    return updated
+
+
+def upgrade_schema(engine, backfill=False, csv_root=None):
+    """
+    按顺序执行所有升级步骤；表不存在时什么也不做（交给 create_all 创建）。
+    csv_root 为水质CSV目录，用于确定旧表中数据的来源文件（见 add_source_file）。
+    回填需要扫描整表，默认只在刚添加 monitoring_at 列时执行；backfill=True 时总是执行，
+    用于补完被中断的回填。
+    """
+    if not inspect(engine).has_table(TABLE):
+        return
+    add_source_file(engine, csv_root)
+    if add_monitoring_at(engine) or backfill:
+        backfill_monitoring_at(engine)
+    add_site_time_index(engine)
+    if add_dimension_columns(engine) or backfill:
+        backfill_dimension_ids(engine)
+    add_site_id_index(engine)
+    add_time_index(engine)
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    import config
+    from models import db
+
+    parser = argparse.ArgumentParser(description="升级 water_quality_data 表结构")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--normalize", action="store_true", help="清空已有维度 id 的名称列（规范化存储）")
+    group.add_argument("--denormalize", action="store_true", help="根据维度 id 写回名称列")
+    parser.add_argument("--csv-root", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "WaterQualitybyDate"),
+                        help="水质CSV目录，升级旧表时用于确定已有数据的来源文件")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade_schema(db.engine, backfill=True, csv_root=args.csv_root)
+        if args.normalize:
+            normalize_names(db.engine)
+        elif args.denormalize:
+            denormalize_names(db.engine)
@@ -0,0 +1,202 @@
+"""
+/data/<path> 静态数据文件（例如约 3.7 MB 的 data/china.json 地图）的预压缩和缓存友好的发送。
+
+STATIC_PRECOMPRESS_SUFFIXES 中的文本类文件预先压缩为 gzip、zstd 和 brotli（安装了 brotli 包时）三种格式，
+压缩结果按 原路径 + 内容哈希 保存在 config.STATIC_PRECOMPRESSED_DIR 中，内容不变时重启不需要重新压缩。
+启动时调用 precompress_all 压缩全部文件，也可以在部署时运行 python static_assets.py；
+启动后新增或修改的文件在第一次请求时压缩（文件大小和修改时间变化即视为修改）。
+
+发送时按 Accept-Encoding 选择客户端接受的格式（优先 br、zstd、gzip），带 Vary: Accept-Encoding、
+强 ETag（原文件内容的 SHA-256，压缩格式加上编码后缀）和 Cache-Control: public, max-age=STATIC_CACHE_MAX_AGE，
+If-None-Match 匹配时返回 304。其他文件（图片、视频等）用 send_file 发送，同样带长期缓存。
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+import zstandard
+
+import config
+
+try:
+    # brotli 是可选依赖，未安装时只提供 gzip 和 zstd
+    import brotli
+except ImportError:
+    brotli = None
+
+DATA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# 编码 -> (文件后缀, 压缩函数)，按服务端的优先顺序排列
+ENCODINGS = {}
+if brotli is not None:
+    ENCODINGS["br"] = (".br", lambda data: brotli.compress(data, quality=11))
+ENCODINGS["zstd"] = (".zst", lambda data: zstandard.ZstdCompressor(level=19).compress(data))
+ENCODINGS["gzip"] = (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))
+
+# 读取文件计算哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def precompressed_dir():
+    return getattr(config, "STATIC_PRECOMPRESSED_DIR", None)
+
+
+def _compressible(relpath, size):
+    suffixes = getattr(config, "STATIC_PRECOMPRESS_SUFFIXES", ())
+    return (
+        precompressed_dir() is not None
+        and relpath.lower().endswith(tuple(suffixes))
+        and getattr(config, "STATIC_PRECOMPRESS_MIN_BYTES", 0) <= size <= config.STATIC_PRECOMPRESS_MAX_BYTES
+    )
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Asset:
+    __slots__ = ("size", "mtime_ns", "etag", "variants")
+
+    def __init__(self, size, mtime_ns, etag, variants):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.etag = etag
+        self.variants = variants  # 编码 -> 压缩文件路径，只包含比原文件小的格式
+
+
+class StaticAssets:
+    def __init__(self):
+        self.assets = {}  # 相对路径 -> _Asset
+        self._lock = threading.Lock()
+
+    def _prepare(self, relpath, path, stat):
+        """
+        计算文件哈希并生成（或复用已有的）各格式的压缩文件，删除同一文件旧内容的压缩文件。
+        """
+        etag = _file_hash(path)
+        base = os.path.join(precompressed_dir(), relpath)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        data = None
+        variants = {}
+        for encoding, (suffix, compress) in ENCODINGS.items():
+            target = f"{base}.{etag[:16]}{suffix}"
+            if not os.path.exists(target):
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                tmp = f"{target}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(compress(data))
+                os.replace(tmp, target)
+            if os.path.getsize(target) < stat.st_size:
+                variants[encoding] = target
+
+        prefix = os.path.basename(base) + "."
+        keep = {os.path.basename(target) for target in variants.values()}
+        for name in os.listdir(os.path.dirname(base)):
+            if name.startswith(prefix) and name not in keep and name[len(prefix):].count(".") == 1:
+                os.remove(os.path.join(os.path.dirname(base), name))
+        return _Asset(stat.st_size, stat.st_mtime_ns, etag, variants)
+
+    def get(self, relpath, path, stat):
+        """
+        返回文件的 _Asset；文件还没有压缩或已被修改时先压缩。不需要压缩的文件返回 None。
+        """
+        if not _compressible(relpath, stat.st_size):
+            return None
+        asset = self.assets.get(relpath)
+        if asset is not None and asset.size == stat.st_size and asset.mtime_ns == stat.st_mtime_ns:
+            return asset
+        with self._lock:
+            asset = self.assets.get(relpath)
+            if asset is None or asset.size != stat.st_size or asset.mtime_ns != stat.st_mtime_ns:
+                asset = self.assets[relpath] = self._prepare(relpath, path, stat)
+        return asset
+
+    def precompress_all(self, root=DATA_ROOT):
+        """
+        压缩 root 下所有符合条件的文件（跳过压缩结果目录和 Parquet 镜像目录），返回文件数。
+        """
+        skip = {os.path.abspath(d) for d in (precompressed_dir(), getattr(config, "WATER_PARQUET_DIR", None)) if d}
+        count = 0
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) not in skip]
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                relpath = os.path.relpath(path, root).replace(os.sep, "/")
+                if self.get(relpath, path, os.stat(path)) is not None:
+                    count += 1
+        return count
+
+
+static_assets = StaticAssets()
+
+
+def _choose_encoding(variants):
+    accepted = [
+        (request.accept_encodings.quality(encoding), -rank, encoding)
+        for rank, encoding in enumerate(ENCODINGS) if encoding in variants
+    ]
+    accepted = [item for item in accepted if item[0] > 0]
+    return max(accepted)[2] if accepted else None
+
+
+def data_path(filename):
+    """
+    data 目录下文件的绝对路径，路径越界或文件不存在时返回 404。
+    """
+    path = safe_join(DATA_ROOT, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return path
+
+
+def send_data_file(filename):
+    """
+    发送 data 目录下的文件：可压缩的文件按 Accept-Encoding 发送预压缩的版本，所有文件都带长期缓存头。
+    """
+    return send_asset(filename, data_path(filename))
+
+
+def send_asset(relpath, path):
+    """
+    发送 path 指向的文件，relpath 为它在预压缩目录中的相对路径（也用于判断是否需要压缩）。
+    """
+    max_age = getattr(config, "STATIC_CACHE_MAX_AGE", 0)
+    try:
+        asset = static_assets.get(relpath, path, os.stat(path))
+    except OSError as e:
+        print(f"压缩静态文件 {relpath} 失败，发送原文件: {e}")
+        asset = None
+    if asset is None:
+        response = send_file(path, max_age=max_age)
+        response.cache_control.public = True
+        return response
+
+    encoding = _choose_encoding(asset.variants)
+    if encoding is None:
+        response = send_file(path, etag=False, conditional=False, max_age=max_age)
+        etag = asset.etag
+    else:
+        # 压缩版本的 MIME 类型与原文件相同
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        response = send_file(asset.variants[encoding], mimetype=mimetype,
+                             etag=False, conditional=False, max_age=max_age)
+        response.headers["Content-Encoding"] = encoding
+        etag = f"{asset.etag}-{encoding}"
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+if __name__ == "__main__":
+    print(f"已预压缩 {static_assets.precompress_all()} 个静态文件")
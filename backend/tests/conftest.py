@@ -0,0 +1,45 @@
+"""
+测试共用的夹具。后端模块是平铺的（import config、import import_data），把 backend 目录加入 sys.path；
+数据库使用临时目录中的 SQLite 文件（import_data.connect_db 支持 {"sqlite": 路径}），不需要 MySQL。
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from flask import Flask  # noqa: E402
+from models import db  # noqa: E402
+from water_dims import dims  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_dims():
+    """
+    维度缓存是进程内的单例，每个测试使用新的数据库，先清空缓存。
+    """
+    for dim in (dims.sites, dims.categories, dims.statuses):
+        dim.by_id = {}
+        dim.by_key = {}
+    dims.loaded = False
+    yield
+
+
+@pytest.fixture
+def sqlite_path(tmp_path, monkeypatch):
+    # Parquet 镜像写到临时目录，不影响 data/ 下的正式镜像
+    monkeypatch.setattr(config, "WATER_PARQUET_DIR", str(tmp_path / "parquet"))
+    return str(tmp_path / "test.sqlite3")
+
+
+@pytest.fixture
+def app(sqlite_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{sqlite_path}"
+    app.config["TESTING"] = True
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
@@ -0,0 +1,21 @@
+from auth import auth_bp
+from models import FishData, db
+
+
+def test_getfishdata_returns_rows_without_water_classification(app):
+    app.register_blueprint(auth_bp)
+    with app.app_context():
+        db.session.add_all([
+            FishData(species="Bream", weight=242.0, length1=23.2, length2=25.4, length3=30.0, height=11.52, width=4.02),
+            FishData(species="Roach", weight=120.0, length1=19.4, length2=21.0, length3=23.7, height=6.11, width=3.41),
+        ])
+        db.session.commit()
+
+    response = app.test_client().get("/api/getfishdata?page=1&per_page=10")
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["totalCount"] == 2
+    assert [row["species"] for row in body["data"]] == ["Bream", "Roach"]
+    assert "evaluated_category" not in body["data"][0]
+
@@ -0,0 +1,24 @@
+import import_data
+
+
+def water_lines(count):
+    yield ",".join(["省份", "流域", "断面名称", "监测时间"] + ["列"] * 13)
+    for i in range(count):
+        yield f"省份1,流域1,断面A,2021-01-01 {i:02d}:00,Ⅱ,12.5,7.6,8.1,400,3,2.5,0.2,0.05,1.2,0.01,1000,正常"
+
+
+def test_failed_batch_is_retried_from_a_savepoint(app, sqlite_path):
+    db_config = {"sqlite": sqlite_path}
+    stats = import_data.new_import_stats("test")
+    batch = next(import_data.parse_csv_lines(water_lines(4), "test", 10, stats, "断面A.csv"))
+    # 第三行无法绑定：executemany 在前两行已经写入之后才失败
+    batch[2] = batch[2][:5] + (object(),) + batch[2][6:]
+    conn = import_data.connect_db(db_config)
+    cursor = conn.cursor()
+
+    assert import_data.insert_batch(cursor, batch, lambda: import_data.connect_db(db_config)) == (3, 1)
+    conn.commit()
+
+    cursor.execute("SELECT monitoring_time FROM water_quality_data ORDER BY id")
+    assert [row[0] for row in cursor.fetchall()] == ["2021-01-01 00:00", "2021-01-01 01:00", "2021-01-01 03:00"]
+    conn.close()
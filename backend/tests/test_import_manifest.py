@@ -0,0 +1,137 @@
+import csv
+import multiprocessing
+import os
+import sqlite3
+
+import import_data
+from models import ImportManifest, db
+
+HEADER = ["省份", "流域", "断面名称", "监测时间", "水质类别", "水温", "pH", "溶解氧", "电导率", "浊度",
+          "高锰酸盐指数", "氨氮", "总磷", "总氮", "叶绿素α", "藻密度", "站点情况"]
+
+
+def write_water_csv(root, section, times):
+    folder = os.path.join(root, "省份1", "流域1", section, "2021-01")
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f"{section}.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for moment in times:
+            writer.writerow(["省份1", "流域1", section, moment, "Ⅱ", "12.5", "7.6", "8.1", "400", "3",
+                             "2.5", "0.2", "0.05", "1.2", "0.01", "1000", "正常"])
+
+
+def write_fish_csv(path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Species", "Weight(g)", "Length1(cm)", "Length2(cm)", "Length3(cm)", "Height(cm)", "Width(cm)"])
+        writer.writerow(["Bream", "242", "23.2", "25.4", "30", "11.52", "4.02"])
+        writer.writerow(["Roach", "120", "19.4", "21", "23.7", "6.11", "3.41"])
+
+
+def ids(sqlite_path, table):
+    with sqlite3.connect(sqlite_path) as conn:
+        return [row[0] for row in conn.execute(f"SELECT id FROM {table} ORDER BY id")]
+
+
+def sync(app, water_root, fish_csv, sqlite_path):
+    with app.app_context():
+        summary = import_data.sync_csv_directory(water_root, {"sqlite": sqlite_path}, workers=1)
+        import_data.sync_fish_data_from_csv(fish_csv)
+    return summary
+
+
+def test_second_sync_skips_unchanged_files(app, sqlite_path, tmp_path):
+    water_root = str(tmp_path / "WaterQualitybyDate")
+    write_water_csv(water_root, "断面A", ["2021-01-01 00:00", "2021-01-01 04:00"])
+    write_water_csv(water_root, "断面B", ["2021-01-01 00:00"])
+    fish_csv = str(tmp_path / "Fish.csv")
+    write_fish_csv(fish_csv)
+
+    first = sync(app, water_root, fish_csv, sqlite_path)
+    assert (first["new"], first["rows"]) == (2, 3)
+    water_ids, fish_ids = ids(sqlite_path, "water_quality_data"), ids(sqlite_path, "fish_data")
+    assert len(water_ids) == 3 and len(fish_ids) == 2
+
+    second = sync(app, water_root, fish_csv, sqlite_path)
+    assert (second["new"], second["changed"], second["removed"], second["unchanged"]) == (0, 0, 0, 2)
+    assert second["rows"] == 0
+    # 没有删除后重新插入，行 id 不变
+    assert ids(sqlite_path, "water_quality_data") == water_ids
+    assert ids(sqlite_path, "fish_data") == fish_ids
+    with app.app_context():
+        assert ImportManifest.query.filter_by(path=import_data.FISH_MANIFEST_PREFIX + "Fish.csv").count() == 1
+
+
+def test_fish_manifest_entry_is_not_a_removed_water_file(app, sqlite_path, tmp_path):
+    water_root = str(tmp_path / "WaterQualitybyDate")
+    write_water_csv(water_root, "断面A", ["2021-01-01 00:00"])
+    path = import_data.FISH_MANIFEST_PREFIX + "Fish.csv"
+    with app.app_context():
+        db.session.add(ImportManifest(path=path, size=1, mtime_ns=1, content_hash="0" * 64))
+        db.session.commit()
+        summary = import_data.sync_csv_directory(water_root, {"sqlite": sqlite_path}, workers=1)
+
+        assert (summary["new"], summary["removed"]) == (1, 0)
+        assert ImportManifest.query.filter_by(path=path).count() == 1
+
+
+def test_sync_replaces_only_changed_file(app, sqlite_path, tmp_path):
+    water_root = str(tmp_path / "WaterQualitybyDate")
+    write_water_csv(water_root, "断面A", ["2021-01-01 00:00"])
+    write_water_csv(water_root, "断面B", ["2021-01-01 00:00"])
+    fish_csv = str(tmp_path / "Fish.csv")
+    write_fish_csv(fish_csv)
+    sync(app, water_root, fish_csv, sqlite_path)
+    with sqlite3.connect(sqlite_path) as conn:
+        kept = conn.execute("SELECT id FROM water_quality_data WHERE source_file LIKE '%断面B%'").fetchall()
+
+    write_water_csv(water_root, "断面A", ["2021-01-01 00:00", "2021-01-02 00:00"])
+    summary = sync(app, water_root, fish_csv, sqlite_path)
+
+    assert (summary["changed"], summary["unchanged"], summary["rows"]) == (1, 1, 2)
+    with sqlite3.connect(sqlite_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM water_quality_data").fetchone()[0] == 3
+        assert conn.execute("SELECT id FROM water_quality_data WHERE source_file LIKE '%断面B%'").fetchall() == kept
+
+
+def test_parallel_sync_with_interleaved_files(app, sqlite_path, tmp_path, monkeypatch):
+    water_root = str(tmp_path / "WaterQualitybyDate")
+    write_water_csv(water_root, "断面A", ["2021-01-01 00:00", "2021-01-01 04:00"])
+    write_water_csv(water_root, "断面B", ["2021-01-01 00:00", "2021-01-01 04:00"])
+    # 两个工作进程都发出第一批之后才继续，写入者会交替收到两个文件的批次
+    barrier = multiprocessing.Barrier(2)
+    parse_file = import_data._parse_file
+
+    def interleaved(*args):
+        batches = parse_file(*args)
+        yield next(batches)
+        barrier.wait(timeout=10)
+        yield from batches
+
+    monkeypatch.setattr(import_data, "_parse_file", interleaved)
+    with app.app_context():
+        summary = import_data.sync_csv_directory(water_root, {"sqlite": sqlite_path}, workers=2, batch_size=1)
+
+    assert (summary["new"], summary["rows"], summary["failed"]) == (2, 4, [])
+    with sqlite3.connect(sqlite_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM water_quality_data").fetchone()[0] == 4
+        assert conn.execute("SELECT COUNT(*) FROM import_manifest").fetchone()[0] == 2
+
+
+def test_fish_sync_commits_rows_and_manifest_together(app, sqlite_path, tmp_path, monkeypatch):
+    fish_csv = str(tmp_path / "Fish.csv")
+    write_fish_csv(fish_csv)
+
+    class BrokenClock:
+        @staticmethod
+        def now():
+            raise RuntimeError("clock")
+
+    monkeypatch.setattr(import_data, "datetime", BrokenClock)
+    with app.app_context():
+        import_data.sync_fish_data_from_csv(fish_csv)
+
+    # 清单没有写入时鱼类数据也不提交，下次启动会重新导入
+    assert ids(sqlite_path, "fish_data") == []
+    assert ids(sqlite_path, "import_manifest") == []
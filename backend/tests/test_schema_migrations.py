@@ -0,0 +1,35 @@
+import sqlite3
+
+from sqlalchemy import inspect
+
+import schema_migrations
+from models import ImportManifest, db
+from test_import_manifest import write_water_csv
+
+
+def legacy_rows(sqlite_path):
+    with sqlite3.connect(sqlite_path) as conn:
+        conn.executemany(
+            "INSERT INTO water_quality_data (province, river_basin, section_name, monitoring_time) VALUES (?, ?, ?, ?)",
+            [("省份1", "流域1", "断面A", "2021-01-01 00:00"), ("省份1", "流域1", "手动", "2021-01-01 00:00")],
+        )
+
+
+def test_interrupted_legacy_upgrade_is_resumed(app, sqlite_path, tmp_path):
+    water_root = str(tmp_path / "WaterQualitybyDate")
+    write_water_csv(water_root, "断面A", ["2021-01-01 00:00"])
+    legacy_rows(sqlite_path)
+    with app.app_context():
+        db.session.add(ImportManifest(path="a.csv", size=1, mtime_ns=1, content_hash="0" * 64))
+        db.session.commit()
+        # 上次升级添加了 source_file 列后中断：临时表还在，旧数据没有认领，清单没有清空
+        schema_migrations._create_legacy_keys(db.engine)
+
+        assert schema_migrations.add_source_file(db.engine, water_root)
+        assert not inspect(db.engine).has_table(schema_migrations.LEGACY_KEYS_TABLE)
+        assert not schema_migrations.add_source_file(db.engine, water_root)
+
+    with sqlite3.connect(sqlite_path) as conn:
+        sources = dict(conn.execute("SELECT section_name, source_file FROM water_quality_data"))
+        assert sources == {"断面A": "省份1/流域1/断面A/2021-01/断面A.csv", "手动": None}
+        assert conn.execute("SELECT COUNT(*) FROM import_manifest").fetchone()[0] == 0
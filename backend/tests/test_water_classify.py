@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import water_anomalies
+import water_classify
+import water_rollups
+
+
+def category(**values):
+    classes, limiting = water_classify.classify({name: [value] for name, value in values.items()})
+    return water_classify.labels(classes)[0], water_classify.limiting_names(limiting)[0]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0.15, "Ⅰ"), (0.151, "Ⅱ"), (0.5, "Ⅱ"), (1.0, "Ⅲ"), (1.5, "Ⅳ"), (2.0, "Ⅴ"), (2.01, "劣Ⅴ"),
+])
+def test_ammonia_nitrogen_limits_are_inclusive(value, expected):
+    assert category(ammonia_nitrogen=value)[0] == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    (7.5, "Ⅰ"), (7.49, "Ⅱ"), (6.0, "Ⅱ"), (5.0, "Ⅲ"), (3.0, "Ⅳ"), (2.0, "Ⅴ"), (1.99, "劣Ⅴ"),
+])
+def test_dissolved_oxygen_limits_are_lower_bounds(value, expected):
+    assert category(dissolved_oxygen=value)[0] == expected
+
+
+@pytest.mark.parametrize("indicator, limits", [
+    ("permanganate_index", (2.0, 4.0, 6.0, 10.0, 15.0)),
+    ("total_phosphorus", (0.02, 0.1, 0.2, 0.3, 0.4)),
+])
+def test_upper_limit_boundaries(indicator, limits):
+    for i, limit in enumerate(limits):
+        assert category(**{indicator: limit})[0] == water_classify.CATEGORY_LABELS[i]
+    assert category(**{indicator: limits[-1] * 1.01})[0] == "劣Ⅴ"
+
+
+@pytest.mark.parametrize("value, expected", [(6.0, "Ⅰ"), (9.0, "Ⅰ"), (5.99, "劣Ⅴ"), (9.01, "劣Ⅴ")])
+def test_ph_range(value, expected):
+    assert category(ph=value)[0] == expected
+
+
+def test_worst_indicator_limits_the_category():
+    assert category(ph=7.5, dissolved_oxygen=8.0, permanganate_index=5.0, ammonia_nitrogen=0.3,
+                    total_phosphorus=0.05) == ("Ⅲ", "permanganate_index")
+    # 并列时取 EVALUATED_INDICATORS 中靠前的指标
+    assert category(permanganate_index=3.0, ammonia_nitrogen=0.3) == ("Ⅱ", "permanganate_index")
+    # Ⅰ类没有限制指标
+    assert category(ph=7.0, ammonia_nitrogen=0.1) == ("Ⅰ", None)
+
+
+def test_missing_values_are_not_evaluated():
+    classes, limiting = water_classify.classify({"ph": [np.nan, 7.0], "ammonia_nitrogen": [None, np.nan]})
+    assert water_classify.labels(classes).tolist() == [None, "Ⅰ"]
+    assert water_classify.limiting_names(limiting).tolist() == [None, None]
+
+
+def test_category_does_not_feed_rollups_or_anomalies():
+    # reclassify 只同步 Parquet 镜像和快照，依赖汇总和异常检测都不使用类别列
+    for columns in (water_rollups.INDICATORS, water_anomalies.FRAME_COLUMNS):
+        assert "water_quality_category" not in columns and "category_id" not in columns
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import water_downsample
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=float) * 3600
+    y = np.cumsum(rng.normal(size=n))
+    return x, y
+
+
+@pytest.mark.parametrize("method", water_downsample.METHODS)
+@pytest.mark.parametrize("max_points", [water_downsample.MIN_POINTS, 5, 100, 999])
+def test_point_budget_is_respected(method, max_points):
+    x, y = series(10000)
+    index = water_downsample._PICKERS[method](x, y, max_points)
+    assert len(index) <= max_points
+    assert index[0] == 0 and index[-1] == len(y) - 1
+    assert np.all(np.diff(index) > 0)
+
+
+@pytest.mark.parametrize("method", water_downsample.METHODS)
+def test_short_series_is_returned_unchanged(method):
+    x, y = series(50)
+    assert water_downsample._PICKERS[method](x, y, 50).tolist() == list(range(50))
+
+
+def test_lttb_uses_full_budget():
+    x, y = series(10000)
+    assert len(water_downsample.lttb(x, y, 500)) == 500
+
+
+def test_minmax_keeps_extremes():
+    x, y = series(10000, seed=1)
+    index = water_downsample.minmax(x, y, 100)
+    assert np.argmax(y) in index
+    assert np.argmin(y) in index
+
+
+def test_downsample_frame_skips_missing_values():
+    times = pd.date_range("2021-01-01", periods=1000, freq="h")
+    values = np.sin(np.arange(1000) / 20.0)
+    values[::7] = np.nan
+    frame = pd.DataFrame({
+        "monitoring_at": times,
+        "monitoring_time": times.strftime("%Y-%m-%d %H:%M"),
+        "ph": values,
+    })
+    result = water_downsample.downsample_frame(frame, "monitoring_at", "monitoring_time", ["ph"], 50)
+    assert len(result["ph"]) <= 50
+    assert all(not np.isnan(value) for _, value in result["ph"])
+    assert result["ph"][0][0] == "2021-01-01 01:00"
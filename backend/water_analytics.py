@@ -0,0 +1,141 @@
+"""
+基于 Parquet 镜像（见 water_parquet.py）的水质数据分析查询。
+
+跨省份、跨年份的聚合和时间范围查询直接用 pyarrow 读取列式镜像：按 省份/月份 分区裁剪，
+只读取用到的列，过滤和分组聚合都在 Arrow 中向量化执行，不占用 MySQL。
+在线的增删改查仍然走 MySQL，镜像在每次写入提交后更新，可能比数据库稍晚几秒。
+"""
+from datetime import date, datetime, time, timedelta
+import os
+
+from flask import Blueprint, request, jsonify
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+import water_parquet
+from water_rollups import INDICATORS
+
+analytics_bp = Blueprint("analytics", __name__)
+
+# 可以用于分组的字段；year 由 month 分区字段截取
+GROUP_FIELDS = ("province", "river_basin", "section_name", "month", "year")
+# 支持的聚合函数（pyarrow 分组聚合的函数名）
+STATS = ("min", "max", "mean", "sum", "count", "stddev")
+
+
+def open_dataset(root=None):
+    """
+    打开镜像目录，目录不存在或还没有任何分区时返回 None。
+    """
+    root = root or water_parquet.mirror_dir()
+    if not root or not os.path.isdir(root) or not os.listdir(root):
+        return None
+    return ds.dataset(
+        root,
+        format="parquet",
+        partitioning=ds.partitioning(water_parquet.PARTITION_SCHEMA, flavor="hive"),
+        exclude_invalid_files=True,
+    )
+
+
+def _filter(province=None, river_basin=None, section_name=None, start=None, end=None):
+    """
+    构造过滤表达式；province 和 month 是分区字段，只会读取符合条件的分区文件。
+    start/end 为 date，包含两端的整天。
+    """
+    conditions = []
+    if province:
+        conditions.append(ds.field("province") == province)
+    if river_basin:
+        conditions.append(ds.field("river_basin") == river_basin)
+    if section_name:
+        conditions.append(ds.field("section_name") == section_name)
+    if start:
+        conditions.append(ds.field("month") >= start.strftime("%Y-%m"))
+        conditions.append(ds.field("monitoring_at") >= pa.scalar(datetime.combine(start, time()), pa.timestamp("s")))
+    if end:
+        conditions.append(ds.field("month") <= end.strftime("%Y-%m"))
+        conditions.append(
+            ds.field("monitoring_at") < pa.scalar(datetime.combine(end + timedelta(days=1), time()), pa.timestamp("s"))
+        )
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def time_range(columns=None, province=None, river_basin=None, section_name=None, start=None, end=None, root=None):
+    """
+    读取时间范围内的监测数据，返回 Arrow 表（按断面和时间排序）。columns 默认全部列。
+    """
+    dataset = open_dataset(root)
+    if dataset is None:
+        return pa.table({})
+    table = dataset.to_table(columns=columns, filter=_filter(province, river_basin, section_name, start, end))
+    keys = [(name, "ascending") for name in ("site_id", "monitoring_at") if name in table.column_names]
+    return table.sort_by(keys) if keys else table
+
+
+def aggregate(indicators, by=(), stats=("mean",), province=None, river_basin=None, section_name=None,
+              start=None, end=None, root=None):
+    """
+    按 by 中的字段分组，对 indicators 计算 stats 中的统计量。
+    返回字典列表，每个字典包含分组字段和 "<指标>_<统计量>" 键，按分组字段排序。
+    """
+    by = list(by)
+    dataset = open_dataset(root)
+    if dataset is None:
+        return []
+    columns = list(dict.fromkeys([name for name in by if name != "year"] + list(indicators)))
+    if "year" in by and "month" not in columns:
+        columns.append("month")
+    table = dataset.to_table(columns=columns, filter=_filter(province, river_basin, section_name, start, end))
+    if table.num_rows == 0:
+        return []
+    if "year" in by:
+        table = table.append_column("year", pc.utf8_slice_codeunits(table["month"], 0, 4))
+
+    result = table.group_by(by).aggregate([(name, stat) for name in indicators for stat in stats])
+    if by:
+        result = result.sort_by([(name, "ascending") for name in by])
+    return result.to_pylist()
+
+
+def _parse_list(value, allowed, default):
+    items = [item for item in (value or "").split(",") if item]
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise ValueError(f"不支持的取值: {', '.join(unknown)}，可选: {', '.join(allowed)}")
+    return items or list(default)
+
+
+@analytics_bp.route("/api/analytics/water_aggregate", methods=["GET"])
+def water_aggregate():
+    """
+    参数: indicators、by（分组字段）、stats（统计量），均为逗号分隔；
+    province、basin、site、start/end（YYYY-MM-DD）用于过滤。
+    例如 /api/analytics/water_aggregate?by=province,year&indicators=ph,ammonia_nitrogen&stats=mean,max
+    """
+    try:
+        indicators = _parse_list(request.args.get("indicators"), INDICATORS, INDICATORS)
+        by = _parse_list(request.args.get("by"), GROUP_FIELDS, ())
+        stats = _parse_list(request.args.get("stats"), STATS, ("mean",))
+        start = date.fromisoformat(request.args["start"]) if request.args.get("start") else None
+        end = date.fromisoformat(request.args["end"]) if request.args.get("end") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        rows = aggregate(
+            indicators, by, stats,
+            province=request.args.get("province"),
+            river_basin=request.args.get("basin"),
+            section_name=request.args.get("site"),
+            start=start,
+            end=end,
+        )
+        return jsonify({"result": 1, "by": by, "total": len(rows), "rows": rows}), 200
+    except Exception as e:
+        print(f"分析查询失败: {e}")
+        return jsonify({"error": "Analytics query failed", "details": str(e)}), 500
@@ -0,0 +1,235 @@
+"""
+水质读数的流式异常检测（data/数据说明.md：异常数据可以自行设置）。
+
+两种规则，阈值都在 config 中配置：
+limit:  超出 ANOMALY_LIMITS 中该指标的硬阈值（仪器量程或物理上不可能的值）；
+zscore: 与该断面该指标的指数加权滚动均值（EWMA，平滑系数 ANOMALY_EWMA_ALPHA）相比，
+        偏离超过 ANOMALY_Z_THRESHOLD 个滚动标准差；参与统计的读数少于 ANOMALY_WARMUP 个时不判断。
+
+每个 (断面, 指标) 的滚动状态（读数个数、EWMA 均值和方差、最新监测时间）保存在 water_anomaly_state，
+导入、上传和新增数据提交前在同一个事务中调用 observe_source / observe_items，只用新到达的读数更新状态，不回扫历史数据。
+一批读数内按时间排序后用 pandas 的 ewm（以已保存的状态为初值）整列递推，不逐行循环。
+超出硬阈值的读数和早于 last_at 的迟到读数只做判断，不参与更新状态。
+被标记的读数写入 water_anomaly，按 (site_id, monitoring_at) 建有索引，见 /api/water_anomalies。
+
+已有数据可以运行 python water_anomalies.py 全量重建（按断面和时间顺序重新计算状态和异常）。
+"""
+import numpy as np
+import pandas as pd
+
+import config
+from water_rollups import INDICATORS
+
+STATE_COLUMNS = ("site_id", "indicator", "value_count", "ewma_mean", "ewma_variance", "last_at")
+ANOMALY_COLUMNS = ("site_id", "monitoring_at", "indicator", "value", "method", "score", "expected", "source_file")
+# observe 需要的列
+FRAME_COLUMNS = ("site_id", "monitoring_at", "source_file") + INDICATORS
+
+
+def _rows(cursor, columns):
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        rows = [[row[column] for column in columns] for row in rows]
+    return [tuple(row) for row in rows]
+
+
+def _load_states(cursor, site_ids):
+    cursor.execute(
+        f"SELECT {', '.join(STATE_COLUMNS)} FROM water_anomaly_state "
+        f"WHERE site_id IN ({', '.join(['%s'] * len(site_ids))})",
+        list(site_ids)
+    )
+    return {(row[0], row[1]): list(row[2:]) for row in _rows(cursor, STATE_COLUMNS)}
+
+
+def _save_states(cursor, site_ids, states):
+    cursor.execute(
+        f"DELETE FROM water_anomaly_state WHERE site_id IN ({', '.join(['%s'] * len(site_ids))})",
+        list(site_ids)
+    )
+    cursor.executemany(
+        f"INSERT INTO water_anomaly_state ({', '.join(STATE_COLUMNS)}) VALUES ({', '.join(['%s'] * len(STATE_COLUMNS))})",
+        [key + tuple(state) for key, state in states.items() if key[0] in site_ids]
+    )
+
+
+def _optional(value):
+    return None if value is None or np.isnan(value) else float(value)
+
+
+def _scan(values, times, state, limits, alpha, threshold, warmup):
+    """
+    按时间顺序扫描一个断面一个指标的新读数。state 为 [个数, 均值, 方差, last_at]，原地更新。
+    返回 [(下标, 方法, z 值, 滚动均值), ...]。
+    """
+    count, mean, variance, last_at = state
+    present = ~np.isnan(values)
+    low, high = limits if limits else (None, None)
+    out = np.zeros(len(values), dtype=bool)
+    if low is not None:
+        out |= present & (values < low)
+    if high is not None:
+        out |= present & (values > high)
+    late = times <= np.datetime64(last_at) if last_at is not None else np.zeros(len(values), dtype=bool)
+    usable = present & ~out & ~late
+
+    # 在序列前放上已保存的状态作为初值，ewm(adjust=False) 即为逐个读数的递推：
+    # mean_t = (1-a)·mean_{t-1} + a·x_t；var_t = (1-a)·var_{t-1} + a·(1-a)·(x_t - mean_{t-1})²
+    updates = np.where(usable, values, np.nan)
+    means = pd.Series(np.concatenate(([np.nan if mean is None else mean], updates)))
+    means = means.ewm(alpha=alpha, adjust=False, ignore_na=True).mean().to_numpy()
+    prev_mean = means[:-1]
+    deviations = np.where(usable, (1 - alpha) * (updates - prev_mean) ** 2, np.nan)
+    variances = pd.Series(np.concatenate(([np.nan if variance is None else variance], deviations)))
+    variances = variances.ewm(alpha=alpha, adjust=False, ignore_na=True).mean().to_numpy()
+    prev_variance = variances[:-1]
+    prev_count = (count or 0) + np.concatenate(([0], np.cumsum(usable)[:-1]))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = (values - prev_mean) / np.sqrt(prev_variance)
+    suspicious = present & ~out & (prev_count >= warmup) & (prev_variance > 0) & (np.abs(scores) > threshold)
+
+    if usable.any():
+        state[0] = int((count or 0) + usable.sum())
+        state[1] = _optional(means[-1])
+        state[2] = _optional(variances[-1])
+        state[3] = pd.Timestamp(times[usable].max()).to_pydatetime()
+    flagged = [(i, "limit", None, _optional(prev_mean[i])) for i in np.flatnonzero(out)]
+    flagged += [(i, "zscore", float(scores[i]), float(prev_mean[i])) for i in np.flatnonzero(suspicious)]
+    return flagged
+
+
+def observe(cursor, frame):
+    """
+    用新到达的读数更新滚动状态并写入被标记的读数，不提交事务，返回标记的个数。
+    frame 为包含 FRAME_COLUMNS 的 DataFrame；缺少断面 id 或监测时间的行跳过。
+    """
+    frame = frame[frame["site_id"].notna() & frame["monitoring_at"].notna()]
+    if frame.empty:
+        return 0
+    frame = frame.assign(
+        site_id=frame["site_id"].astype(int),
+        monitoring_at=pd.to_datetime(frame["monitoring_at"]),
+    ).sort_values(["site_id", "monitoring_at"], kind="stable")
+    site_ids = [int(site_id) for site_id in frame["site_id"].unique()]
+    states = _load_states(cursor, site_ids)
+    limits = getattr(config, "ANOMALY_LIMITS", {})
+    alpha = config.ANOMALY_EWMA_ALPHA
+    threshold = config.ANOMALY_Z_THRESHOLD
+    warmup = config.ANOMALY_WARMUP
+
+    anomalies = []
+    for site_id, group in frame.groupby("site_id", sort=False):
+        times = group["monitoring_at"].to_numpy("datetime64[us]")
+        moments = group["monitoring_at"].dt.to_pydatetime()
+        sources = group["source_file"].to_numpy(object)
+        for indicator in INDICATORS:
+            values = pd.to_numeric(group[indicator], errors="coerce").to_numpy(float)
+            state = states.setdefault((site_id, indicator), [0, None, None, None])
+            for i, method, score, expected in _scan(values, times, state, limits.get(indicator), alpha, threshold, warmup):
+                anomalies.append((site_id, moments[i], indicator, float(values[i]), method, score, expected, sources[i]))
+
+    _save_states(cursor, site_ids, states)
+    if anomalies:
+        cursor.executemany(
+            f"INSERT INTO water_anomaly ({', '.join(ANOMALY_COLUMNS)}) VALUES ({', '.join(['%s'] * len(ANOMALY_COLUMNS))})",
+            anomalies
+        )
+    return len(anomalies)
+
+
+def observe_source(cursor, source):
+    """
+    某个源文件（或一次上传）的数据插入之后、提交之前调用，读出这些读数参与检测。
+    并行导入时多个文件的事务同时打开，检测紧挨着提交执行，两个未提交的事务不会同时锁住同一断面的状态行。
+    """
+    cursor.execute(
+        f"SELECT {', '.join(FRAME_COLUMNS)} FROM water_quality_data "
+        "WHERE source_file = %s AND site_id IS NOT NULL AND monitoring_at IS NOT NULL",
+        (source,)
+    )
+    return observe(cursor, pd.DataFrame(_rows(cursor, FRAME_COLUMNS), columns=FRAME_COLUMNS))
+
+
+def observe_items(cursor, items):
+    """
+    observe 的按对象版本，items 为带 FRAME_COLUMNS 属性的对象（例如 WaterQualityData）。
+    """
+    return observe(cursor, pd.DataFrame(
+        [[getattr(item, column) for column in FRAME_COLUMNS] for item in items], columns=FRAME_COLUMNS
+    ))
+
+
+def forget_source(cursor, source):
+    """
+    删除某个源文件的读数被标记的记录（该文件的数据被删除或重新导入时调用）。
+    """
+    cursor.execute("DELETE FROM water_anomaly WHERE source_file = %s", (source,))
+
+
+def forget_reading(cursor, site_id, monitoring_at):
+    """
+    删除某条读数被标记的记录（按条删除或修改数据时调用）。
+    """
+    if site_id is None or monitoring_at is None:
+        return
+    cursor.execute("DELETE FROM water_anomaly WHERE site_id = %s AND monitoring_at = %s", (site_id, monitoring_at))
+
+
+def rebuild_anomalies(cursor):
+    """
+    清空状态和异常记录，逐个断面按时间顺序重新计算，返回标记的个数，不提交事务。
+    """
+    for table in ("water_anomaly", "water_anomaly_state"):
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.execute("SELECT DISTINCT site_id FROM water_quality_data WHERE site_id IS NOT NULL")
+    site_ids = [row[0] for row in _rows(cursor, ("site_id",))]
+    flagged = 0
+    for site_id in site_ids:
+        cursor.execute(
+            f"SELECT {', '.join(FRAME_COLUMNS)} FROM water_quality_data "
+            "WHERE site_id = %s AND monitoring_at IS NOT NULL ORDER BY monitoring_at, id",
+            (site_id,)
+        )
+        flagged += observe(cursor, pd.DataFrame(_rows(cursor, FRAME_COLUMNS), columns=FRAME_COLUMNS))
+    return flagged
+
+
+def ensure_anomalies(engine):
+    """
+    状态表为空而水质数据已有断面 id 时（刚升级到带异常检测的版本）全量计算一次。
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM water_anomaly_state LIMIT 1")
+        if cursor.fetchall():
+            return False
+        cursor.execute("SELECT 1 FROM water_quality_data WHERE site_id IS NOT NULL LIMIT 1")
+        if not cursor.fetchall():
+            return False
+        print("正在计算水质异常检测状态...")
+        flagged = rebuild_anomalies(cursor)
+        conn.commit()
+        print(f"已标记 {flagged} 个异常读数")
+        return True
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from models import db
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        conn = db.engine.raw_connection()
+        try:
+            flagged = rebuild_anomalies(conn.cursor())
+            conn.commit()
+            print(f"已标记 {flagged} 个异常读数")
+        finally:
+            conn.close()
@@ -0,0 +1,185 @@
+"""
+按《地表水环境质量标准》(GB3838-2002) 表1 评价水质类别（见 data/数据说明.md 和 data/水质评价指标.png）。
+
+国控水站的评价指标为 pH、溶解氧、高锰酸盐指数、氨氮、总磷 5 项，采用单因子评价：
+每项指标按限值表得到类别，一行的类别取各指标中最差的一项，该指标即为限制指标
+（并列时取 EVALUATED_INDICATORS 中靠前的一项；Ⅰ类没有限制指标）。
+总磷使用河流的限值（断面没有湖、库标记），溶解氧Ⅰ类使用 7.5 mg/L。没有任何评价指标的行不评价。
+
+所有函数都按整列（NumPy 数组）计算，不逐行循环。导入时用它补全 CSV 中缺失的类别，
+已有数据可以调用 reclassify 或运行 python water_classify.py [--all] 重新评价。
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from water_dims import dims, normalized_storage
+import water_rollups
+
+CATEGORY_LABELS = ("Ⅰ", "Ⅱ", "Ⅲ", "Ⅳ", "Ⅴ", "劣Ⅴ")
+WORST_CLASS = len(CATEGORY_LABELS) - 1
+
+# pH 在 6~9 之间为Ⅰ~Ⅴ类（不区分），超出为劣Ⅴ类
+PH_RANGE = (6.0, 9.0)
+# 指标 -> (方向, Ⅰ~Ⅴ类限值)；le 为不大于限值，ge 为不小于限值
+THRESHOLDS = {
+    "dissolved_oxygen": ("ge", (7.5, 6.0, 5.0, 3.0, 2.0)),
+    "permanganate_index": ("le", (2.0, 4.0, 6.0, 10.0, 15.0)),
+    "ammonia_nitrogen": ("le", (0.15, 0.5, 1.0, 1.5, 2.0)),
+    "total_phosphorus": ("le", (0.02, 0.1, 0.2, 0.3, 0.4)),
+}
+EVALUATED_INDICATORS = ("ph",) + tuple(THRESHOLDS)
+
+# 重新评价已有数据时每个事务处理的行数
+RECLASSIFY_BATCH_SIZE = 50000
+# UPDATE ... WHERE id IN (...) 每条语句的 id 个数
+UPDATE_CHUNK_SIZE = 1000
+
+# 类别下标 / 限制指标下标 -> 名称，下标 -1 对应末尾的 None
+_LABELS = np.array(CATEGORY_LABELS + (None,), dtype=object)
+_INDICATOR_NAMES = np.array(EVALUATED_INDICATORS + (None,), dtype=object)
+
+
+def indicator_classes(name, values):
+    """
+    一列指标值 -> 类别下标（0 为Ⅰ类，5 为劣Ⅴ类），空值为 -1。
+    """
+    values = np.asarray(values, dtype=float)
+    if name == "ph":
+        classes = np.where((values >= PH_RANGE[0]) & (values <= PH_RANGE[1]), 0, WORST_CLASS)
+    else:
+        direction, limits = THRESHOLDS[name]
+        limits = np.asarray(limits)
+        if direction == "ge":
+            classes = np.searchsorted(-limits, -values, side="left")
+        else:
+            classes = np.searchsorted(limits, values, side="left")
+    return np.where(np.isnan(values), -1, classes).astype(np.int8)
+
+
+def classify(columns):
+    """
+    columns 为 {指标列名: 数值序列}（也可以是 DataFrame），缺少的列视为未监测。
+    返回 (类别下标数组, 限制指标下标数组)，下标含义见 labels / limiting_names，-1 表示没有。
+    """
+    size = len(next(iter(columns.values()))) if isinstance(columns, dict) else len(columns)
+    matrix = np.stack([
+        indicator_classes(name, pd.to_numeric(pd.Series(columns[name]), errors="coerce").to_numpy(float))
+        if name in columns else np.full(size, -1, dtype=np.int8)
+        for name in EVALUATED_INDICATORS
+    ], axis=1)
+    limiting = np.argmax(matrix, axis=1)
+    classes = matrix[np.arange(size), limiting]
+    limiting = np.where(classes > 0, limiting, -1)
+    return classes, limiting
+
+
+def labels(classes):
+    return _LABELS[classes]
+
+
+def limiting_names(limiting):
+    return _INDICATOR_NAMES[limiting]
+
+
+def classify_frame(frame):
+    """
+    返回与 frame 行对应的 DataFrame：category（类别名称或 None）和 limiting_indicator（列名或 None）。
+    """
+    classes, limiting = classify(frame)
+    return pd.DataFrame({"category": labels(classes), "limiting_indicator": limiting_names(limiting)},
+                        index=frame.index)
+
+
+def _fetch(cursor, lo, hi, overwrite):
+    columns = ("id", "site_id", "monitoring_at", "category_id") + EVALUATED_INDICATORS
+    sql = (f"SELECT {', '.join(columns)} FROM water_quality_data WHERE id > %s AND id <= %s"
+           + ("" if overwrite else " AND category_id IS NULL"))
+    cursor.execute(sql, (lo, hi))
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        rows = [[row[column] for column in columns] for row in rows]
+    return pd.DataFrame(list(rows), columns=columns)
+
+
+def reclassify(connect, overwrite=False, batch_size=RECLASSIFY_BATCH_SIZE):
+    """
+    按主键区间分批重新评价 water_quality_data 的类别，每批单独提交。
+    overwrite=False 时只补全没有类别的行；为 True 时所有能评价的行都用计算结果覆盖
+    （没有评价指标的行保留原类别）。connect() 返回 DB-API 连接。
+    返回 (统计字典, 受影响的汇总键, 受影响的断面 id)，调用方用它们更新 Parquet 镜像、按日快照和查询缓存。
+    只改变类别列：日/月汇总和异常检测状态都只基于 water_rollups.INDICATORS 中的数值指标，
+    与类别无关，因此不需要重新计算。
+    """
+    stats = {"checked": 0, "updated": 0, "by_category": {label: 0 for label in CATEGORY_LABELS}}
+    keys = set()
+    site_ids = set()
+    category_ids = dims.category_ids(CATEGORY_LABELS, connect)
+    id_array = np.array([category_ids[label] for label in CATEGORY_LABELS] + [-1])
+    keep_names = not normalized_storage()
+
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM water_quality_data")
+        row = cursor.fetchone()
+        max_id = (tuple(row.values())[0] if isinstance(row, dict) else row[0]) or 0
+        for lo in range(0, max_id, batch_size):
+            frame = _fetch(cursor, lo, lo + batch_size, overwrite)
+            if frame.empty:
+                continue
+            stats["checked"] += len(frame)
+            classes, _ = classify(frame)
+            new_ids = id_array[classes]
+            old_ids = pd.to_numeric(frame["category_id"], errors="coerce").fillna(-1).to_numpy(np.int64)
+            changed = (classes >= 0) & (new_ids != old_ids)
+            if not changed.any():
+                continue
+            row_ids = frame["id"].to_numpy()
+            for index, label in enumerate(CATEGORY_LABELS):
+                selected = row_ids[changed & (classes == index)].tolist()
+                stats["by_category"][label] += len(selected)
+                for start in range(0, len(selected), UPDATE_CHUNK_SIZE):
+                    chunk = selected[start:start + UPDATE_CHUNK_SIZE]
+                    cursor.execute(
+                        "UPDATE water_quality_data SET category_id = %s, water_quality_category = %s "
+                        f"WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                        [category_ids[label], label if keep_names else None] + chunk
+                    )
+            conn.commit()
+            stats["updated"] += int(changed.sum())
+            pairs = [
+                (None if pd.isna(site_id) else int(site_id), moment)
+                for site_id, moment in zip(frame["site_id"][changed], frame["monitoring_at"][changed])
+            ]
+            keys |= water_rollups.rollup_keys(pairs)
+            site_ids |= {site_id for site_id, _ in pairs}
+    finally:
+        conn.close()
+    return stats, keys, site_ids
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    import config
+    from models import db
+    import query_cache
+    import water_parquet
+    import water_snapshots
+
+    parser = argparse.ArgumentParser(description="按 GB3838-2002 重新评价水质类别")
+    parser.add_argument("--all", action="store_true", help="覆盖已有的类别（默认只补全没有类别的行）")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    with app.app_context():
+        stats, keys, site_ids = reclassify(db.engine.raw_connection, overwrite=args.all)
+        # 汇总和异常状态不包含类别（见 reclassify），只同步带类别列的 Parquet 镜像和快照
+        water_parquet.sync_partitions(db.engine.raw_connection, keys)
+        water_snapshots.sync_snapshots(db.engine.raw_connection, keys)
+        if stats["updated"]:
+            query_cache.invalidate_sites(site_ids)
+        print(f"检查 {stats['checked']} 行，更新 {stats['updated']} 行: {stats['by_category']}")
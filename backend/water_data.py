@@ -1,41 +1,368 @@
-from flask import Blueprint, request, jsonify,send_from_directory
-import os, json, csv
+from flask import Blueprint, request, jsonify,send_from_directory, Response, current_app, stream_with_context
+import os, json, csv, base64
 import pymysql
+import static_assets
+import geo_tiers
 water_bp = Blueprint("water", __name__)
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data', 'WaterQualitybyDate')
 BASE_DIR = os.path.join(DATA_DIR, 'water_quality_by_name')
 @water_bp.route('/data/<path:filename>')
 def serve_data(filename):
-    return send_from_directory('data', filename)
+    # 预压缩、带强 ETag 和长期缓存头（见 static_assets.py）；GeoJSON 可用 detail 参数取简化版本（见 geo_tiers.py）
+    detail = request.args.get('detail')
+    if not detail:
+        return static_assets.send_data_file(filename)
+    if detail != geo_tiers.DETAIL_FULL and detail not in geo_tiers.tiers():
+        return jsonify({"error": f"Unknown detail: {detail}, use one of {[geo_tiers.DETAIL_FULL, *geo_tiers.tiers()]}"}), 400
+    try:
+        return geo_tiers.send_tier(filename, detail)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 
 
 
 import config 
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from urllib.parse import quote
+import warnings
+import numpy as np
+import pandas as pd
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+import db_pool
+from water_dims import dims
+import water_rollups
+import query_cache
+import water_downsample
+import water_snapshots
+import water_export
+from water_sites import site_index, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+
+# 流式查询每次从服务端游标读取的行数
+STREAM_FETCH_SIZE = 1000
+# 流式响应累积到该字节数后发送一块
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+# /api/waterdata_stats 返回的分位数
+STATS_PERCENTILES = (5, 50, 95)
+
+
+# format 参数：默认每行是以中文表头为键的字典；rows 为按 thead 顺序的数组；columnar 为每列一个数组
+RESPONSE_FORMATS = ("rows", "columnar")
+
+
+def _error_response(e):
+    """
+    查询接口的统一错误响应：连接池借不到连接时返回 503，数据库错误和其他异常返回 500。
+    """
+    if isinstance(e, PoolTimeoutError):
+        print(f"数据库连接池已满: {e}")
+        return jsonify({"error": "Database busy, please retry", "details": str(e)}), 503
+    if isinstance(e, pymysql.Error):
+        print(f"数据库查询错误: {e}")
+        return jsonify({"error": "Database query failed", "details": str(e)}), 500
+    print(f"发生未知错误: {e}")
+    return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
+
+
+def _compact_dumps(obj):
+    """
+    紧凑格式的 JSON 序列化：不转义中文、不加空格。
+    """
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _compact_row(row, columns):
+    """
+    按 columns 顺序取出一行的值，Decimal 转为数字（默认格式中 Decimal 会被序列化为字符串）。
+    """
+    return [float(row[c]) if isinstance(row[c], Decimal) else row[c] for c in columns]
+
+
+def _compact_body(fmt, values):
+    if fmt == "columnar":
+        return {"columns": [list(column) for column in zip(*values)]} if values else {"columns": []}
+    return {"rows": values}
+
+
+def _parse_time_bound(value, is_end=False):
+    """
+    解析 start/end 参数（YYYY-MM-DD 或 YYYY-MM-DD HH:MM[:SS]），返回 (时间, 比较运算符)。
+    只有日期的 end 包含当天整天。
+    """
+    moment = datetime.fromisoformat(value)
+    if not is_end:
+        return moment, ">="
+    if len(value.strip()) <= 10:
+        return moment + timedelta(days=1), "<"
+    return moment, "<="
+
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def _encode_cursor(site_id, monitoring_at, row_id):
+    """
+    分页游标：最后一行的 (断面 id, monitoring_at, id)，编码为 URL 安全的字符串。
+    """
+    raw = json.dumps([site_id, _as_datetime(monitoring_at).isoformat(sep=" "), row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(value):
+    site_id, moment, row_id = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+    return int(site_id), datetime.fromisoformat(moment), int(row_id)
+
+
+def _page_options(args):
+    """
+    从请求参数中读取时间范围和分页设置，参数无效时抛出 ValueError。
+    filtered 为 True 时（给出了 start/end/limit/cursor）只返回 monitoring_at 有效的行。
+    """
+    page = {"start": None, "end": None, "end_op": "<", "limit": None, "after": None}
+    if args.get('start'):
+        page["start"], _ = _parse_time_bound(args['start'])
+    if args.get('end'):
+        page["end"], page["end_op"] = _parse_time_bound(args['end'], is_end=True)
+    if args.get('cursor'):
+        try:
+            page["after"] = _decode_cursor(args['cursor'])
+        except Exception:
+            raise ValueError("Invalid cursor")
+    limit = args.get('limit', type=int)
+    if limit is None and page["after"]:
+        limit = config.WATER_PAGE_DEFAULT_LIMIT
+    if limit is not None:
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+        page["limit"] = min(limit, config.WATER_PAGE_MAX_LIMIT)
+    page["filtered"] = any(page[key] for key in ("start", "end", "limit", "after"))
+    return page
+
+
+def _range_sql(page, after=None):
+    """
+    时间范围和键集分页条件，返回 (以 AND 开头的 SQL 片段, 参数列表)。
+    after 为 (断面 id, monitoring_at, id) 时只返回排在它之后的行，排序为 (monitoring_at, id)。
+    """
+    if not page["filtered"]:
+        return "", []
+    conditions = ["monitoring_at IS NOT NULL"]
+    params = []
+    if page["start"]:
+        conditions.append("monitoring_at >= %s")
+        params.append(page["start"])
+    if page["end"]:
+        conditions.append(f"monitoring_at {page['end_op']} %s")
+        params.append(page["end"])
+    if after:
+        conditions.append("(monitoring_at > %s OR (monitoring_at = %s AND id > %s))")
+        params += [after[1], after[1], after[2]]
+    return "".join(" AND " + condition for condition in conditions), params
+
+
+def _any_rows(cursor, site_ids, page):
+    if not site_ids:
+        return False
+    range_sql, params = _range_sql(page)
+    cursor.execute(
+        f"SELECT 1 FROM water_quality_data WHERE site_id IN ({', '.join(['%s'] * len(site_ids))}){range_sql} LIMIT 1",
+        list(site_ids) + params
+    )
+    return bool(cursor.fetchall())
+
+
+def _downsampled_series(cursor, site_ids, page, max_points, method):
+    """
+    按 (流域, 断面) 分组，每个断面的每个指标单独降采样到不超过 max_points 个点。
+    返回 [{"river_basin", "section_name", "total", "indicators": {列名: [[监测时间, 数值], ...]}}, ...]，
+    total 为降采样前的行数；只使用 monitoring_at 有效的行，没有数据的断面不出现在结果中。
+    """
+    columns = ("monitoring_at", "monitoring_time") + water_rollups.INDICATORS
+    range_sql, params = _range_sql(page)
+    sites = sorted(((dims.site_name(cursor, site_id), site_id) for site_id in site_ids),
+                   key=lambda item: (item[0][1] or "", item[0][2] or ""))
+    series = []
+    for (_, river_basin, section_name), site_id in sites:
+        cursor.execute(
+            f"SELECT {', '.join(columns)} FROM water_quality_data "
+            f"WHERE site_id = %s AND monitoring_at IS NOT NULL{range_sql} ORDER BY monitoring_at, id",
+            [site_id] + params
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            continue
+        frame = pd.DataFrame(list(rows), columns=columns)
+        series.append({
+            "river_basin": river_basin,
+            "section_name": section_name,
+            "total": len(frame),
+            "indicators": water_downsample.downsample_frame(
+                frame, "monitoring_at", "monitoring_time", water_rollups.INDICATORS, max_points, method
+            ),
+        })
+    return series
+
+
+def _stream_province_files(conn, province, sites, select_columns, column_map, csv_header_order, fmt, page):
+    """
+    逐个断面用服务端游标（SSDictCursor，不缓存结果集）读取数据，边读边写出
+    {"result": 1, "files": [...]} 文档。每个断面对应一个 "文件"，tbody 之后再写 total。
+    内存中只保留当前这批行和待发送的缓冲区，与省份数据量无关。生成器结束时归还连接。
+    fmt 为 rows 时逐行写出数组；为 columnar 时需要按列输出，每个断面的数据读完后再写出，
+    内存占用以单个断面的数据量为上限。
+    page 见 _page_options；分页时按 (断面顺序, monitoring_at, id) 取 limit 行，末尾写出 next_cursor。
+    """
+    limit = page["limit"]
+    remaining = limit
+    next_cursor = None
+    dumps = _compact_dumps if fmt else current_app.json.dumps
+    item_key = "rows" if fmt == "rows" else "tbody"
+    buffer = ['{"result": 1, ' + (f'"format": "{fmt}", ' if fmt else '') + '"files": [']
+    first_file = True
+    cursor = None
+    try:
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        for index, ((_, river_basin, section_name), site_id) in enumerate(sites):
+            after = page["after"] if page["after"] and page["after"][0] == site_id else None
+            range_sql, params = _range_sql(page, after)
+            sql = f"SELECT {select_columns} FROM water_quality_data WHERE site_id = %s{range_sql} ORDER BY monitoring_at, id"
+            if limit:
+                # 多取一行用来判断是否还有下一页
+                sql += " LIMIT %s"
+                params.append(remaining + 1)
+            cursor.execute(sql, [site_id] + params)
+            total = 0
+            values = []
+            has_more = False
+            while True:
+                rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if limit and total == remaining:
+                        has_more = True
+                        continue
+                    # 连接上还有未读完的结果，维度缓存缺失时不能重新加载
+                    row = dims.decode_row(cursor, row, reload=False)
+                    last_key = (row.pop("monitoring_at"), row.pop("id"))
+                    if fmt == "columnar":
+                        values.append(_compact_row(row, column_map))
+                        total += 1
+                        continue
+                    if total == 0:
+                        head = {
+                            "file": f"{section_name}.csv", # 模拟文件名
+                            "path": f"/{province}/{river_basin}/{section_name}/", # 模拟路径
+                            "thead": csv_header_order
+                        }
+                        buffer.append(("" if first_file else ", ") + dumps(head)[:-1] + f', "{item_key}": [')
+                        first_file = False
+                    else:
+                        buffer.append(", ")
+                    if fmt == "rows":
+                        buffer.append(dumps(_compact_row(row, column_map)))
+                    else:
+                        buffer.append(dumps({column_map[k]: v for k, v in row.items()}))
+                    total += 1
+                if sum(len(part) for part in buffer) >= STREAM_CHUNK_SIZE:
+                    yield "".join(buffer)
+                    buffer = []
+            if total and fmt == "columnar":
+                site_file = {
+                    "file": f"{section_name}.csv",
+                    "path": f"/{province}/{river_basin}/{section_name}/",
+                    "thead": csv_header_order,
+                    "total": total,
+                    **_compact_body(fmt, values)
+                }
+                buffer.append(("" if first_file else ", ") + dumps(site_file))
+                first_file = False
+            elif total:
+                buffer.append(f'], "total": {total}}}')
+
+            if limit:
+                remaining -= total
+                if remaining == 0:
+                    if not has_more:
+                        has_more = _any_rows(cursor, [later_id for _, later_id in sites[index + 1:]], page)
+                    if has_more:
+                        next_cursor = _encode_cursor(site_id, *last_key)
+                    break
+        buffer.append("]" + (f', "next_cursor": {dumps(next_cursor)}' if limit else "") + "}")
+        yield "".join(buffer)
+    finally:
+        # 客户端提前断开时关闭游标会读完剩余结果，连接才能安全地归还连接池
+        if cursor:
+            cursor.close()
+        conn.close()
+
+
+def _cache_tags(args):
+    """
+    按断面查询的结果只依赖该断面，只给 province（或 province/basin）时依赖整个省份。
+    """
+    province = args.get('province')
+    if not province:
+        return None
+    if args.get('basin') and args.get('site'):
+        return [query_cache.site_tag(province, args['basin'], args['site'])]
+    return [query_cache.province_tag(province)]
 
-# 数据库连接配置 (请替换为您的实际数据库信息)
-DB_CONFIG = {
-    'host': config.HOSTNAME,
-    'user': config.USERNAME,
-    'password': config.PASSWORD,
-    'db': config.DATABASE,
-    'charset': 'utf8mb4',
-    'cursorclass': pymysql.cursors.DictCursor
-}
 
 @water_bp.route('/api/waterdata_by_name', methods=['GET'])
+@query_cache.cached(_cache_tags)
 def get_water_data_by_name():
+    """
+    参数: province（必填）、basin、site、format（见 RESPONSE_FORMATS）、
+    start/end（按 monitoring_at 过滤）、limit/cursor（按 (monitoring_at, id) 键集分页，
+    响应中的 next_cursor 为 null 表示没有下一页）。
+    给出 max_points 时改为返回每个断面各指标降采样后的图表序列（见 _downsampled_series），
+    downsample 选择降采样方法（见 water_downsample.METHODS，默认 lttb），可以与 start/end 一起使用。
+    """
     province = request.args.get('province')
     basin = request.args.get('basin')
     site = request.args.get('site')
 
     if not province:
         return jsonify({"error": "Missing query parameter: province"}), 400
+    fmt = request.args.get('format') or None
+    if fmt and fmt not in RESPONSE_FORMATS:
+        return jsonify({"error": "format must be one of: " + ", ".join(RESPONSE_FORMATS)}), 400
+    try:
+        page = _page_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    max_points = request.args.get('max_points', type=int)
+    method = request.args.get('downsample') or "lttb"
+    if 'max_points' in request.args:
+        if max_points is None or max_points < water_downsample.MIN_POINTS:
+            return jsonify({"error": f"max_points must be an integer >= {water_downsample.MIN_POINTS}"}), 400
+        if method not in water_downsample.METHODS:
+            return jsonify({"error": "downsample must be one of: " + ", ".join(water_downsample.METHODS)}), 400
+        if page["limit"] or page["after"]:
+            return jsonify({"error": "max_points cannot be combined with limit/cursor"}), 400
 
     conn = None
     try:
-        conn = pymysql.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+        # 从共享连接池借出连接，close() 时归还
+        conn = db_pool.raw_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+
+        if max_points is not None:
+            site_ids = dims.site_ids(cursor, province, basin, site) if basin and site else dims.site_ids(cursor, province)
+            series = _downsampled_series(cursor, site_ids, page, max_points, method)
+            if not series:
+                return jsonify({"error": f"No data found for {province}, {basin}, {site}"}), 404
+            return Response(_compact_dumps({
+                "result": 1,
+                "max_points": max_points,
+                "downsample": method,
+                "series": series
+            }), mimetype="application/json")
 
         # 定义数据库列名到前端期望的中文键的映射
         # 这是为了确保 tbody 内部的字典键名是中文，与前端 CSV DictReader 的输出一致
@@ -69,66 +396,87 @@ def get_water_data_by_name():
         ]
 
 
-        if not basin or not site:
-            # 场景1: 只提供了 province，返回该省份下所有相关数据（模拟遍历所有文件）
-            sql = """
-            SELECT
-                province, river_basin, section_name, monitoring_time, water_quality_category,
+        # 名称列可能没有存储（规范化存储），按断面 id 查询，再通过维度缓存还原名称
+        # id 和 monitoring_at 只用于排序和分页游标，不出现在返回的行中
+        select_columns = """
+                id, monitoring_at, site_id, monitoring_time, category_id,
                 temperature, ph, dissolved_oxygen, conductivity, turbidity,
                 permanganate_index, ammonia_nitrogen, total_phosphorus, total_nitrogen,
-                chlorophyll_a, algae_density, site_status
-            FROM water_quality_data
-            WHERE province = %s
-            """
-            cursor.execute(sql, (province,))
-            results = cursor.fetchall() # 此时 results 是字典列表，键是数据库列名
+                chlorophyll_a, algae_density, status_id
+        """
 
-            if not results:
+        if not basin or not site:
+            # 场景1: 只提供了 province，返回该省份下所有断面的数据（模拟遍历所有文件）
+            # 按 (流域, 断面) 排序后逐个断面流式输出，不把整个省份的数据读入内存
+            site_ids = dims.site_ids(cursor, province)
+            if not site_ids:
                 return jsonify({"error": f"No data found for province {province}"}), 404
-
-            # 模拟原始文件的返回结构，聚合数据
-            # 聚合时，将数据库的英文列名转换为前端期望的中文列名
-            aggregated_data = {}
-            for row in results:
-                # 构造一个唯一的键来代表一个“文件”或“站点+流域”的组合
-                key = (row['river_basin'], row['section_name'])
-                
-                # 将数据库列名转换为中文键名
-                transformed_row = {column_map[k]: v for k, v in row.items()}
-
-                if key not in aggregated_data:
-                    aggregated_data[key] = {
-                        "file": f"{row['section_name']}.csv", # 模拟文件名
-                        "path": f"/{province}/{row['river_basin']}/{row['section_name']}/", # 模拟路径
-                        "total": 0,
-                        "thead": csv_header_order, # 使用手动定义的 CSV 表头顺序
-                        "tbody": []
-                    }
-                aggregated_data[key]["tbody"].append(transformed_row)
-                aggregated_data[key]["total"] += 1
-
-            # 核心修改：直接返回包含 "result" 和 "files" 的字典，而不是包裹在列表中
-            return jsonify({
-                "result": 1,
-                "files": list(aggregated_data.values())
-            }), 200
+            placeholders = ", ".join(["%s"] * len(site_ids))
+            cursor.execute(f"SELECT 1 FROM water_quality_data WHERE site_id IN ({placeholders}) LIMIT 1", site_ids)
+            if not cursor.fetchall():
+                return jsonify({"error": f"No data found for province {province}"}), 404
+            # 先加载最新的维度缓存，流式读取过程中不再查询维度表
+            dims.reload(cursor)
+            sites = sorted(
+                ((dims.site_name(cursor, site_id), site_id) for site_id in site_ids),
+                key=lambda item: (item[0][1] or "", item[0][2] or "")
+            )
+            cursor.close()
+            if page["after"]:
+                # 从游标所在的断面继续
+                positions = [site_id for _, site_id in sites]
+                if page["after"][0] not in positions:
+                    return jsonify({"error": "Invalid cursor"}), 400
+                sites = sites[positions.index(page["after"][0]):]
+
+            body = _stream_province_files(conn, province, sites, select_columns, column_map, csv_header_order, fmt, page)
+            conn = None  # 连接交给生成器，响应发送完毕后归还
+            return Response(stream_with_context(body), mimetype="application/json")
 
         else:
             # 场景2: 提供了 province, basin, 和 site，返回特定站点的数据
-            sql = """
-            SELECT
-                province, river_basin, section_name, monitoring_time, water_quality_category,
-                temperature, ph, dissolved_oxygen, conductivity, turbidity,
-                permanganate_index, ammonia_nitrogen, total_phosphorus, total_nitrogen,
-                chlorophyll_a, algae_density, site_status
+            site_ids = dims.site_ids(cursor, province, basin, site)
+            if not site_ids:
+                return jsonify({"error": f"No data found for {province}, {basin}, {site}"}), 404
+            if page["after"] and page["after"][0] != site_ids[0]:
+                return jsonify({"error": "Invalid cursor"}), 400
+            range_sql, params = _range_sql(page, page["after"])
+            sql = f"""
+            SELECT {select_columns}
             FROM water_quality_data
-            WHERE province = %s AND river_basin = %s AND section_name = %s
+            WHERE site_id = %s{range_sql}
+            ORDER BY monitoring_at, id
             """
-            cursor.execute(sql, (province, basin, site))
-            results = cursor.fetchall()
+            params = [site_ids[0]] + params
+            if page["limit"]:
+                # 多取一行用来判断是否还有下一页
+                sql += " LIMIT %s"
+                params.append(page["limit"] + 1)
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            has_more = bool(page["limit"]) and len(rows) > page["limit"]
+            results = []
+            for row in rows[:page["limit"]] if page["limit"] else rows:
+                row = dims.decode_row(cursor, row)
+                last_key = (row.pop("monitoring_at"), row.pop("id"))
+                results.append(row)
 
-            if not results:
+            # 翻页到末尾时返回空页，而不是 404
+            if not results and not page["after"]:
                 return jsonify({"error": f"No data found for {province}, {basin}, {site}"}), 404
+            paging = {"next_cursor": _encode_cursor(site_ids[0], *last_key) if has_more else None} if page["limit"] else {}
+
+            if fmt:
+                # 紧凑格式：thead 只发送一次，值按 thead 顺序排列
+                payload = {
+                    "result": 1,
+                    "format": fmt,
+                    "total": len(results),
+                    "thead": csv_header_order,
+                    **_compact_body(fmt, [_compact_row(row, column_map) for row in results]),
+                    **paging
+                }
+                return Response(_compact_dumps(payload), mimetype="application/json")
             
             # 将数据库列名转换为前端期望的中文键名
             transformed_results = []
@@ -140,25 +488,388 @@ def get_water_data_by_name():
                 "result": 1,
                 "total": len(transformed_results),
                 "thead": csv_header_order, # 使用手动定义的 CSV 表头顺序
-                "tbody": transformed_results
+                "tbody": transformed_results,
+                **paging
             }), 200
 
-    except pymysql.Error as e:
-        print(f"数据库查询错误: {e}")
-        return jsonify({"error": "Database query failed", "details": str(e)}), 500
     except Exception as e:
-        print(f"发生未知错误: {e}")
-        return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
+        return _error_response(e)
+    finally:
+        if conn:
+            conn.close()
+
+
+
+
+
+
+
+
+
+@water_bp.route('/api/waterdata_rollup', methods=['GET'])
+@query_cache.cached(_cache_tags)
+def get_water_data_rollup():
+    """
+    返回断面（只给 province/basin 时为其下所有断面合并）各指标的日/月汇总趋势，供图表使用。
+    参数: province（必填）、basin、site、indicators（逗号分隔的列名，默认全部）、
+    start/end（YYYY-MM-DD）、granularity（day/month，不传时按 max_points 自动选择）、max_points。
+    自动选择时使用点数不超过 max_points 的最细粒度，长时间范围自动落到月汇总。
+    """
+    province = request.args.get('province')
+    basin = request.args.get('basin')
+    site = request.args.get('site')
+    if not province:
+        return jsonify({"error": "Missing query parameter: province"}), 400
+
+    indicators = [name for name in request.args.get('indicators', '').split(',') if name]
+    indicators = indicators or list(water_rollups.INDICATORS)
+    unknown = [name for name in indicators if name not in water_rollups.INDICATORS]
+    if unknown:
+        return jsonify({"error": f"Unknown indicators: {', '.join(unknown)}"}), 400
+
+    granularity = request.args.get('granularity')
+    if granularity and granularity not in water_rollups.ROLLUP_TABLES:
+        return jsonify({"error": "granularity must be one of: " + ", ".join(water_rollups.ROLLUP_TABLES)}), 400
+    max_points = request.args.get('max_points', config.ROLLUP_MAX_POINTS, type=int)
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({"error": "start/end must be YYYY-MM-DD"}), 400
+
+    conn = None
+    try:
+        conn = db_pool.raw_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        site_ids = dims.site_ids(cursor, province, basin or None, site or None)
+        if not site_ids:
+            return jsonify({"error": f"No data found for {province}, {basin}, {site}"}), 404
+
+        if not granularity:
+            # 未指定范围时用这些断面日汇总的实际起止日期估算点数
+            first, last = start, end
+            if first is None or last is None:
+                placeholders = ", ".join(["%s"] * len(site_ids))
+                cursor.execute(
+                    f"SELECT MIN(period_start) AS min_period, MAX(period_start) AS max_period FROM water_rollup_daily "
+                    f"WHERE site_id IN ({placeholders})", site_ids
+                )
+                bounds = cursor.fetchone()
+                first = first or water_rollups.to_date(bounds["min_period"])
+                last = last or water_rollups.to_date(bounds["max_period"])
+            granularity = water_rollups.choose_granularity(first, last, max_points) if first and last else "day"
+
+        series = water_rollups.query_rollups(cursor, site_ids, granularity, indicators, start, end)
+        return jsonify({
+            "result": 1,
+            "granularity": granularity,
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+            "series": series
+        }), 200
+
+    except Exception as e:
+        return _error_response(e)
+    finally:
+        if conn:
+            conn.close()
+
+
+def _read_indicator_array(conn, site_ids, page):
+    """
+    用服务端游标分块读取这些断面在时间范围内的数值指标，返回 (行数, 指标数) 的 float 数组，空值为 NaN。
+    """
+    range_sql, params = _range_sql(page)
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(
+            f"SELECT {', '.join(water_rollups.INDICATORS)} FROM water_quality_data "
+            f"WHERE site_id IN ({', '.join(['%s'] * len(site_ids))}){range_sql}",
+            list(site_ids) + params
+        )
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=float))
+    finally:
+        cursor.close()
+    if not chunks:
+        return np.empty((0, len(water_rollups.INDICATORS)))
+    return np.concatenate(chunks)
+
+
+def _indicator_stats(values):
+    """
+    按列计算 count/min/max/mean/stddev（样本标准差）和 STATS_PERCENTILES 分位数（线性插值），忽略 NaN。
+    返回 {指标: {统计量: 值}}，没有数据的指标除 count 外都为 None。
+    """
+    counts = np.count_nonzero(~np.isnan(values), axis=0)
+    if not len(values):
+        # 空数组无法做归约，用一行 NaN 代替
+        values = np.full((1, values.shape[1]), np.nan)
+    with warnings.catch_warnings():
+        # 整列都是 NaN（或只有一个值时的标准差）会产生警告，结果为 NaN，下面统一转换为 None
+        warnings.simplefilter("ignore", RuntimeWarning)
+        columns = {
+            "min": np.nanmin(values, axis=0),
+            "max": np.nanmax(values, axis=0),
+            "mean": np.nanmean(values, axis=0),
+            "stddev": np.nanstd(values, axis=0, ddof=1),
+        }
+        for q, row in zip(STATS_PERCENTILES, np.nanpercentile(values, STATS_PERCENTILES, axis=0)):
+            columns[f"p{q}"] = row
+    stats = {}
+    for i, indicator in enumerate(water_rollups.INDICATORS):
+        stats[indicator] = {"count": int(counts[i])}
+        for name, column in columns.items():
+            stats[indicator][name] = None if np.isnan(column[i]) else float(column[i])
+    return stats
+
+
+@water_bp.route('/api/waterdata_stats', methods=['GET'])
+@query_cache.cached(_cache_tags)
+def get_water_data_stats():
+    """
+    各数值指标的 count/min/max/mean/stddev 和 p5/p50/p95。
+    参数: province（必填）、basin、site（范围与 /api/waterdata_rollup 相同，只给 province/basin 时合并其下所有断面）、
+    start/end（按 monitoring_at 过滤，格式同 /api/waterdata_by_name）。
+    """
+    province = request.args.get('province')
+    basin = request.args.get('basin')
+    site = request.args.get('site')
+    if not province:
+        return jsonify({"error": "Missing query parameter: province"}), 400
+    try:
+        page = _page_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page["limit"] or page["after"]:
+        return jsonify({"error": "limit/cursor are not supported here"}), 400
+
+    conn = None
+    try:
+        conn = db_pool.raw_connection()
+        site_ids = dims.site_ids(conn.cursor(), province, basin or None, site or None)
+        if not site_ids:
+            return jsonify({"error": f"No data found for {province}, {basin}, {site}"}), 404
+        values = _read_indicator_array(conn, site_ids, page)
+        return jsonify({
+            "result": 1,
+            "sites": len(site_ids),
+            "rows": len(values),
+            "start": request.args.get('start'),
+            "end": request.args.get('end'),
+            "indicators": _indicator_stats(values)
+        }), 200
+
+    except Exception as e:
+        return _error_response(e)
+    finally:
+        if conn:
+            conn.close()
+
+
+@water_bp.route('/api/water_anomalies', methods=['GET'])
+@query_cache.cached(_cache_tags)
+def get_water_anomalies():
+    """
+    异常检测标记的读数（见 water_anomalies.py），按监测时间倒序。
+    参数: province（必填）、basin、site（范围与 /api/waterdata_rollup 相同）、start/end、
+    indicator（列名）、method（limit/zscore）、limit（默认 WATER_PAGE_DEFAULT_LIMIT，不超过 WATER_PAGE_MAX_LIMIT）。
+    """
+    province = request.args.get('province')
+    basin = request.args.get('basin')
+    site = request.args.get('site')
+    if not province:
+        return jsonify({"error": "Missing query parameter: province"}), 400
+    indicator = request.args.get('indicator')
+    if indicator and indicator not in water_rollups.INDICATORS:
+        return jsonify({"error": f"Unknown indicator: {indicator}"}), 400
+    method = request.args.get('method')
+    try:
+        page = _page_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page["after"]:
+        return jsonify({"error": "cursor is not supported here"}), 400
+    limit = page["limit"] or config.WATER_PAGE_DEFAULT_LIMIT
+
+    conn = None
+    try:
+        conn = db_pool.raw_connection()
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+        site_ids = dims.site_ids(cursor, province, basin or None, site or None)
+        if not site_ids:
+            return jsonify({"error": f"No data found for {province}, {basin}, {site}"}), 404
+
+        range_sql, params = _range_sql(page)
+        sql = (
+            "SELECT site_id, monitoring_at, indicator, value, method, score, expected FROM water_anomaly "
+            f"WHERE site_id IN ({', '.join(['%s'] * len(site_ids))}){range_sql}"
+        )
+        params = list(site_ids) + params
+        if indicator:
+            sql += " AND indicator = %s"
+            params.append(indicator)
+        if method:
+            sql += " AND method = %s"
+            params.append(method)
+        cursor.execute(sql + " ORDER BY monitoring_at DESC, id DESC LIMIT %s", params + [limit])
+        rows = []
+        for row in cursor.fetchall():
+            province_name, river_basin, section_name = dims.site_name(cursor, row.pop("site_id"))
+            row["monitoring_at"] = _as_datetime(row["monitoring_at"]).isoformat(sep=" ")
+            rows.append({"province": province_name, "river_basin": river_basin, "section_name": section_name, **row})
+        return jsonify({"result": 1, "total": len(rows), "limit": limit, "anomalies": rows}), 200
+
+    except Exception as e:
+        return _error_response(e)
     finally:
         if conn:
             conn.close()
 
 
+@water_bp.route('/api/waterdata_export', methods=['GET'])
+def export_water_data():
+    """
+    导出水质数据为附件（见 water_export.py），服务端游标逐批读取、边编码边发送，不写临时文件。
+    参数: format（csv/parquet，默认 csv）、province、basin、site（范围与 /api/waterdata_rollup 相同，
+    不给 province 时导出全部断面）、start/end（按 monitoring_at 过滤）。
+    """
+    province = request.args.get('province')
+    basin = request.args.get('basin')
+    site = request.args.get('site')
+    if (basin or site) and not province:
+        return jsonify({"error": "Missing query parameter: province"}), 400
+    fmt = request.args.get('format') or "csv"
+    if fmt not in water_export.EXPORT_FORMATS:
+        return jsonify({"error": "format must be one of: " + ", ".join(water_export.EXPORT_FORMATS)}), 400
+    try:
+        page = _page_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if page["limit"] or page["after"]:
+        return jsonify({"error": "limit/cursor are not supported here"}), 400
 
+    conn = None
+    try:
+        conn = db_pool.raw_connection()
+        cursor = conn.cursor()
+        if province:
+            site_ids = dims.site_ids(cursor, province, basin or None, site or None)
+        else:
+            dims.reload(cursor)
+            site_ids = list(dims.sites.by_id)
+        if not site_ids:
+            return jsonify({"error": f"No data found for {province}, {basin}, {site}"}), 404
+        sites = sorted(((dims.site_name(cursor, site_id), site_id) for site_id in site_ids),
+                       key=lambda item: tuple(name or "" for name in item[0]))
+        cursor.close()
+
+        range_sql, params = _range_sql(page)
+        batches = water_export.iter_batches(conn, sites, range_sql, params, STREAM_FETCH_SIZE)
+        if fmt == "parquet":
+            chunks = water_export.parquet_chunks(batches)
+        else:
+            chunks = water_export.csv_chunks(batches, STREAM_CHUNK_SIZE)
+
+        def body(conn=conn):
+            try:
+                yield from chunks
+            finally:
+                # 先关闭生成器（关闭服务端游标），再归还连接
+                chunks.close()
+                batches.close()
+                conn.close()
+
+        conn = None  # 连接交给生成器，响应发送完毕后归还
+        filename = "_".join(["water_quality"] + [part for part in (province, basin, site) if part]) + f".{fmt}"
+        return Response(stream_with_context(body()), mimetype=water_export.MIMETYPES[fmt], headers={
+            "Content-Disposition": f"attachment; filename=water_quality.{fmt}; filename*=UTF-8''{quote(filename)}",
+            # 反向代理不缓冲，数据边生成边发送给客户端
+            "X-Accel-Buffering": "no",
+        })
 
+    except Exception as e:
+        return _error_response(e)
+    finally:
+        if conn:
+            conn.close()
 
 
+@water_bp.route('/api/TimeWaterData', methods=['GET'])
+@query_cache.cached(lambda args: [query_cache.TABLE_TAG] if args.get('date') else None)
+def get_time_water_data():
+    """
+    全国所有断面某一天的监测数据（见 water_snapshots.py），参数 date=YYYY-MM-DD。
+    返回 {"result", "date", "total"（断面数）, "rows", "columns", "sites": [{province, river_basin, section_name,
+    readings: [[按 columns 顺序的值], ...]}]}，过去的日期直接读取预先生成的快照。
+    """
+    value = request.args.get('date')
+    if not value:
+        return jsonify({"error": "Missing 'date' query parameter"}), 400
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    try:
+        snapshot = water_snapshots.get_snapshot(db_pool.raw_connection, day)
+        if not snapshot["site_count"]:
+            return jsonify({"error": f"No data found for {value}"}), 404
+        response = Response(snapshot["body"], mimetype="application/json")
+        response.set_etag(snapshot["etag"])
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
 
+    except Exception as e:
+        return _error_response(e)
+
+
+@water_bp.route('/api/water_sites', methods=['GET'])
+def get_water_sites():
+    """
+    断面层级（省份 → 流域 → 断面），由进程内索引返回（见 water_sites.py）。
+    参数: province、basin（可选，只返回该分支）。
+    """
+    province = request.args.get('province')
+    basin = request.args.get('basin')
+    try:
+        site_index.ensure_loaded(db_pool.raw_connection)
+        provinces = site_index.hierarchy(province or None, basin or None)
+        if province and not provinces:
+            return jsonify({"error": f"No data found for {province}"}), 404
+        return jsonify({"result": 1, "total": len(provinces), "provinces": provinces}), 200
+
+    except Exception as e:
+        return _error_response(e)
+
+
+@water_bp.route('/api/water_sites/search', methods=['GET'])
+def search_water_sites():
+    """
+    断面名称输入提示：q 按前缀匹配断面名称的汉字、全拼或拼音首字母（例如 长江 / changjiang / cj）。
+    参数: q（必填）、province（可选）、limit（默认 SEARCH_DEFAULT_LIMIT，不超过 SEARCH_MAX_LIMIT）。
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing query parameter: q"}), 400
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit <= 0:
+        return jsonify({"error": "limit must be positive"}), 400
+    limit = min(limit, SEARCH_MAX_LIMIT)
+    try:
+        site_index.ensure_loaded(db_pool.raw_connection)
+        sites = site_index.search(query, limit, request.args.get('province') or None)
+        return jsonify({"result": 1, "total": len(sites), "sites": sites}), 200
+
+    except Exception as e:
+        return _error_response(e)
 
 
 @water_bp.route('/api/old_waterdata_by_name', methods=['GET'])
@@ -0,0 +1,212 @@
+"""
+水质数据的维度表：断面层级（省份/流域/断面名称）、水质类别和站点情况。
+
+water_quality_data 通过 site_id / category_id / status_id 引用这三张小表，
+读写时用进程内缓存完成 id 与名称之间的转换，查询不需要 JOIN。
+config.WATER_NORMALIZED_STORAGE 为 True 时事实表只保存 id，名称列留空；
+为 False 时名称和 id 都写入，兼容直接查询名称列的旧脚本。
+
+所有函数都使用 DB-API 游标（%s 占位符），可以用于 pymysql 连接、导入脚本的连接以及
+SQLAlchemy 的 raw_connection。新增维度值使用单独的连接立即提交，
+避免维度行随某个文件的事务一起回滚后缓存里留下不存在的 id。
+"""
+import threading
+
+import config
+
+# 导入行（见 import_data.INSERT_SQL）中各名称字段的位置
+SITE_FIELDS = (0, 1, 2)
+CATEGORY_FIELD = 4
+STATUS_FIELD = 16
+
+
+def normalized_storage():
+    return getattr(config, "WATER_NORMALIZED_STORAGE", False)
+
+
+def _values(row):
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+
+
+class _Dimension:
+    """
+    一张维度表的 id <-> 名称 映射，名称用元组表示（断面为三元组，类别和站点情况为一元组）。
+    """
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self.by_id = {}
+        self.by_key = {}
+
+    def load(self, cursor):
+        cursor.execute(f"SELECT id, {', '.join(self.columns)} FROM {self.table}")
+        by_id = {}
+        for row in cursor.fetchall():
+            values = _values(row)
+            by_id[values[0]] = values[1:]
+        self.by_id = by_id
+        self.by_key = {key: dim_id for dim_id, key in by_id.items()}
+
+    def insert(self, cursor, key):
+        placeholders = ", ".join(["%s"] * len(self.columns))
+        cursor.execute(f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({placeholders})", key)
+        return cursor.lastrowid
+
+
+class DimensionCache:
+    def __init__(self):
+        self.sites = _Dimension("water_site", ("province", "river_basin", "section_name"))
+        self.categories = _Dimension("water_category", ("name",))
+        self.statuses = _Dimension("water_site_status", ("name",))
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def reload(self, cursor):
+        with self._lock:
+            for dim in (self.sites, self.categories, self.statuses):
+                dim.load(cursor)
+            self.loaded = True
+
+    def ensure_loaded(self, cursor):
+        if not self.loaded:
+            self.reload(cursor)
+
+    def _ensure_keys(self, wanted, connect):
+        """
+        wanted 为 [(维度, 名称元组), ...]，缺失的维度值用 connect() 得到的新连接插入并提交。
+        并发插入同一个值时唯一约束会报错，此时重新加载缓存即可拿到对方插入的 id。
+        """
+        missing = [(dim, key) for dim, key in wanted if key not in dim.by_key]
+        if not missing and self.loaded:
+            return
+        conn = connect()
+        try:
+            cursor = conn.cursor()
+            self.reload(cursor)
+            for dim, key in missing:
+                if key in dim.by_key:
+                    continue
+                try:
+                    dim_id = dim.insert(cursor, key)
+                    conn.commit()
+                    with self._lock:
+                        dim.by_id[dim_id] = key
+                        dim.by_key[key] = dim_id
+                except Exception:
+                    conn.rollback()
+                    self.reload(cursor)
+                    if key not in dim.by_key:
+                        raise
+        finally:
+            conn.close()
+
+    def encode_rows(self, rows, connect):
+        """
+        为导入行追加 site_id、category_id、status_id 三列；存储模式为规范化时把名称列置空。
+        """
+        wanted = set()
+        for row in rows:
+            site = tuple(row[i] for i in SITE_FIELDS)
+            if any(site):
+                wanted.add((self.sites, site))
+            if row[CATEGORY_FIELD]:
+                wanted.add((self.categories, (row[CATEGORY_FIELD],)))
+            if row[STATUS_FIELD]:
+                wanted.add((self.statuses, (row[STATUS_FIELD],)))
+        self._ensure_keys(wanted, connect)
+
+        sites = self.sites.by_key
+        categories = self.categories.by_key
+        statuses = self.statuses.by_key
+        blank = normalized_storage()
+        encoded = []
+        for row in rows:
+            ids = (
+                sites.get(tuple(row[i] for i in SITE_FIELDS)),
+                categories.get((row[CATEGORY_FIELD],)),
+                statuses.get((row[STATUS_FIELD],)),
+            )
+            if blank:
+                row = list(row)
+                for i in SITE_FIELDS + (CATEGORY_FIELD, STATUS_FIELD):
+                    row[i] = None
+            encoded.append(tuple(row) + ids)
+        return encoded
+
+    def category_ids(self, names, connect):
+        """
+        返回 {类别名称: category_id}，缺失的类别用 connect() 打开的连接插入。
+        """
+        self._ensure_keys([(self.categories, (name,)) for name in names], connect)
+        return {name: self.categories.by_key[(name,)] for name in names}
+
+    def encode_values(self, connect, province, river_basin, section_name, category, status):
+        """
+        单条数据的版本，返回 (site_id, category_id, status_id)。
+        """
+        row = [None] * (STATUS_FIELD + 1)
+        row[0], row[1], row[2] = province, river_basin, section_name
+        row[CATEGORY_FIELD] = category
+        row[STATUS_FIELD] = status
+        return self.encode_rows([tuple(row)], connect)[0][-3:]
+
+    def site_ids(self, cursor, province, river_basin=None, section_name=None):
+        """
+        返回符合条件的断面 id 列表；缓存中没有时重新加载一次，以便看到其他进程新增的断面。
+        """
+        self.ensure_loaded(cursor)
+        for attempt in range(2):
+            ids = [
+                site_id for site_id, (p, b, s) in self.sites.by_id.items()
+                if p == province
+                and (river_basin is None or b == river_basin)
+                and (section_name is None or s == section_name)
+            ]
+            if ids or attempt:
+                return ids
+            self.reload(cursor)
+
+    def site_name(self, cursor, site_id, reload=True):
+        if site_id is None:
+            return (None, None, None)
+        if site_id not in self.sites.by_id and reload:
+            self.reload(cursor)
+        return self.sites.by_id.get(site_id, (None, None, None))
+
+    def _label(self, cursor, dim, dim_id, reload=True):
+        if dim_id is None:
+            return None
+        if dim_id not in dim.by_id and reload:
+            self.reload(cursor)
+        key = dim.by_id.get(dim_id)
+        return key[0] if key else None
+
+    def decode(self, cursor, site_id, category_id, status_id, reload=True):
+        """
+        把三个 id 转换为名称字典，键与 water_quality_data 的名称列相同。
+        缓存中没有的 id 默认重新加载缓存；reload=False 时直接返回 None
+        （游标所在连接上还有未读完的流式结果、不能执行新查询时使用）。
+        """
+        if reload:
+            self.ensure_loaded(cursor)
+        province, river_basin, section_name = self.site_name(cursor, site_id, reload)
+        return {
+            "province": province,
+            "river_basin": river_basin,
+            "section_name": section_name,
+            "water_quality_category": self._label(cursor, self.categories, category_id, reload),
+            "site_status": self._label(cursor, self.statuses, status_id, reload),
+        }
+
+    def decode_row(self, cursor, row, reload=True):
+        """
+        把查询结果中的 site_id/category_id/status_id 替换为名称列，返回新字典。
+        """
+        row = dict(row)
+        names = self.decode(cursor, row.pop("site_id"), row.pop("category_id"), row.pop("status_id"), reload)
+        names.update(row)
+        return names
+
+
+dims = DimensionCache()
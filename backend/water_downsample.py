@@ -0,0 +1,90 @@
+"""
+图表序列的降采样（/api/waterdata_by_name 的 max_points 参数），在保留曲线形状的前提下把点数降到屏幕能显示的数量。
+
+lttb:   Largest-Triangle-Three-Buckets。首尾两点固定，中间的点均分到 max_points-2 个桶，
+        每个桶选出与上一个选中点、下一个桶的平均点构成的三角形面积最大的点，峰谷和趋势都能保留，适合折线图。
+minmax: 每个桶保留最小值和最大值两个点（按时间顺序），极值一定不会丢失，适合面积图和柱状图。
+
+两种方法都返回选中点的下标（升序）。点数不超过 max_points 时原样返回全部下标。
+"""
+import numpy as np
+import pandas as pd
+
+METHODS = ("lttb", "minmax")
+
+# max_points 的下限：首尾两点加上 minmax 的一个桶（最小值和最大值两个点）
+MIN_POINTS = 4
+
+
+def _bucket_edges(n, buckets):
+    """
+    把中间的点（下标 1..n-2）均分为 buckets 个桶，返回 buckets+1 个边界；桶数小于点数时每个桶至少有一个点。
+    """
+    return np.linspace(1, n - 1, buckets + 1).astype(np.int64)
+
+
+def lttb(x, y, max_points):
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    edges = _bucket_edges(n, max_points - 2)
+    starts, ends = edges[:-1], edges[1:]
+
+    # 用前缀和一次算出所有桶的平均点；最后一个桶的“下一个桶”是末尾的点
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    next_x = np.append(((sum_x[ends] - sum_x[starts]) / counts)[1:], x[-1])
+    next_y = np.append(((sum_y[ends] - sum_y[starts]) / counts)[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    # 每个桶依赖上一个桶选中的点，只能逐桶进行；桶内所有点的面积一次向量化计算
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        area = np.abs(
+            (x[anchor] - next_x[i]) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (next_y[i] - y[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        selected[i + 1] = anchor
+    return selected
+
+
+def minmax(x, y, max_points):
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(1, (max_points - 2) // 2)
+    interior = np.arange(1, n - 1)
+    bucket = np.searchsorted(_bucket_edges(n, buckets), interior, side="right") - 1
+    # 按 (桶, 值) 排序后，每个桶的第一个和最后一个就是最小值和最大值
+    order = np.lexsort((y[1:-1], bucket))
+    sorted_bucket = bucket[order]
+    boundary = sorted_bucket[1:] != sorted_bucket[:-1]
+    first = np.concatenate(([True], boundary))
+    last = np.concatenate((boundary, [True]))
+    picks = interior[order[first | last]]
+    return np.unique(np.concatenate(([0], picks, [n - 1])))
+
+
+_PICKERS = {"lttb": lttb, "minmax": minmax}
+
+
+def downsample_frame(frame, time_column, label_column, value_columns, max_points, method="lttb"):
+    """
+    frame 按 time_column 升序排列。每个 value_column 去掉空值后单独降采样，
+    返回 {列名: [[label, 数值], ...]}，label 取自 label_column（例如原始的监测时间字符串）。
+    """
+    pick = _PICKERS[method]
+    if frame.empty:
+        return {column: [] for column in value_columns}
+    x = pd.to_datetime(frame[time_column]).to_numpy("datetime64[s]").astype(np.int64).astype(float)
+    labels = frame[label_column].to_numpy(object)
+    series = {}
+    for column in value_columns:
+        y = pd.to_numeric(frame[column], errors="coerce").to_numpy(float)
+        valid = np.flatnonzero(~np.isnan(y))
+        index = valid[pick(x[valid], y[valid], max_points)]
+        series[column] = [list(point) for point in zip(labels[index].tolist(), y[index].tolist())]
+    return series
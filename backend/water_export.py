@@ -0,0 +1,145 @@
+"""
+水质数据导出（/api/waterdata_export）：按 省份/流域/断面/时间范围 过滤，以 CSV 或 Parquet 流式发送。
+
+逐个断面用服务端游标（SSCursor，不缓存结果集）按 (monitoring_at, id) 顺序读取（走 ix_water_site_id_time 索引），
+每次 fetchmany 一批，编码后累积到 STREAM_CHUNK_SIZE 字节就发送一块，不写临时文件。
+CSV 内存中只有当前一批行和一个发送缓冲区；Parquet 以 EXPORT_ROW_GROUP_SIZE 行为一个行组，
+每写完一个行组就把输出缓冲区中的字节发送出去，内存以一个行组为上限。与导出的总行数无关。
+
+列与 Parquet 镜像（见 water_parquet.SCHEMA）相同，另加 province；维度 id 展开为名称。
+"""
+import csv
+import io
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pymysql
+
+import water_parquet
+from water_dims import dims
+from water_rollups import INDICATORS
+
+EXPORT_FORMATS = ("csv", "parquet")
+MIMETYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+SCHEMA = pa.schema([("province", pa.string())] + list(water_parquet.SCHEMA))
+COLUMNS = tuple(SCHEMA.names)
+SELECT_COLUMNS = ("monitoring_time", "monitoring_at", "category_id", "status_id") + INDICATORS
+
+# Parquet 每个行组的行数（也是 Parquet 导出时内存中最多保留的行数）
+EXPORT_ROW_GROUP_SIZE = 100000
+
+
+def iter_batches(conn, sites, range_sql, params, fetch_size):
+    """
+    按 sites（[((省份, 流域, 断面名称), site_id), ...]）的顺序逐个断面读取，
+    每次产出一批按 COLUMNS 顺序排列的行（元组列表）。range_sql/params 为附加的时间范围条件。
+    """
+    # 开始读取之前加载一次维度缓存，读取过程中连接上有未读完的结果，不能再查询
+    dims.reload(conn.cursor())
+    categories = {dim_id: key[0] for dim_id, key in dims.categories.by_id.items()}
+    statuses = {dim_id: key[0] for dim_id, key in dims.statuses.by_id.items()}
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    try:
+        for (province, river_basin, section_name), site_id in sites:
+            cursor.execute(
+                f"SELECT {', '.join(SELECT_COLUMNS)} FROM water_quality_data "
+                f"WHERE site_id = %s{range_sql} ORDER BY monitoring_at, id",
+                [site_id] + list(params)
+            )
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield [
+                    (province, site_id, river_basin, section_name, row[0], row[1], categories.get(row[2]))
+                    + tuple(row[4:]) + (statuses.get(row[3]),)
+                    for row in rows
+                ]
+    finally:
+        # 客户端提前断开时关闭游标会读完剩余结果，连接才能安全地归还连接池
+        cursor.close()
+
+
+def csv_chunks(batches, chunk_size):
+    """
+    CSV 编码（UTF-8 带 BOM，Excel 打开中文不乱码），每累积 chunk_size 字节产出一块 bytes。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("﻿")
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        writer.writerows(batch)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+class _Sink:
+    """
+    ParquetWriter 的输出目标：只追加写入，已写入的字节由 drain 取走，不需要可定位的文件。
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def _to_table(rows):
+    """
+    按 COLUMNS 排列的行 -> Arrow 表，数值列（Decimal 或 None）统一为 float64，None 写为空值。
+    """
+    arrays = []
+    for field, values in zip(SCHEMA, zip(*rows)):
+        if pa.types.is_floating(field.type):
+            arrays.append(pa.array(np.array(values, dtype=float), type=field.type, from_pandas=True))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+
+def parquet_chunks(batches, row_group_size=EXPORT_ROW_GROUP_SIZE):
+    """
+    Parquet 编码（zstd 压缩），每写完一个行组产出该行组的字节。
+    """
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, SCHEMA, compression="zstd")
+    pending, count = [], 0
+    try:
+        for batch in batches:
+            pending.extend(batch)
+            count += len(batch)
+            if count >= row_group_size:
+                writer.write_table(_to_table(pending), row_group_size=row_group_size)
+                pending, count = [], 0
+                yield sink.drain()
+        if pending:
+            writer.write_table(_to_table(pending), row_group_size=row_group_size)
+    finally:
+        writer.close()
+    yield sink.drain()
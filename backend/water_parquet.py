@@ -0,0 +1,220 @@
+"""
+water_quality_data 的 Parquet 列式镜像，供分析查询使用（见 water_analytics.py）。
+
+镜像按 省份/月份 分区，目录结构为 <WATER_PARQUET_DIR>/province=<省份>/month=<YYYY-MM>/part.parquet，
+每个分区只有一个文件，更新时整文件重写（先写临时文件再替换），读者不会看到写了一半的文件。
+只镜像有 monitoring_at 的数据；名称列总是展开存储（Parquet 的字典编码使重复字符串几乎不占空间）。
+
+导入、上传和增删改提交之后，用受影响的汇总键 (site_id, 日期)（见 water_rollups.rollup_keys）
+调用 sync_partitions，只重写涉及的 (省份, 月份) 分区。镜像更新失败不影响 MySQL 中已提交的数据，
+可以运行 python water_parquet.py 全量重建。config.WATER_PARQUET_DIR 为 None 时不维护镜像。
+"""
+import os
+import shutil
+from datetime import date, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import config
+from water_dims import dims
+from water_rollups import INDICATORS, to_date
+
+PART_FILE = "part.parquet"
+
+# 分区文件中的列（province 和 month 是分区目录，不重复存储在文件中）
+SCHEMA = pa.schema(
+    [
+        ("site_id", pa.int32()),
+        ("river_basin", pa.string()),
+        ("section_name", pa.string()),
+        ("monitoring_time", pa.string()),
+        ("monitoring_at", pa.timestamp("s")),
+        ("water_quality_category", pa.string()),
+    ]
+    + [(name, pa.float64()) for name in INDICATORS]
+    + [("site_status", pa.string())]
+)
+
+# 读取时的分区字段
+PARTITION_SCHEMA = pa.schema([("province", pa.string()), ("month", pa.string())])
+
+SELECT_COLUMNS = ("site_id", "monitoring_time", "monitoring_at", "category_id", "status_id") + INDICATORS
+
+
+def mirror_dir():
+    return getattr(config, "WATER_PARQUET_DIR", None)
+
+
+def partition_path(root, province, month):
+    return os.path.join(root, f"province={province}", f"month={month}")
+
+
+def _month_bounds(month):
+    first = date.fromisoformat(f"{month}-01")
+    return first, (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partitions_for_keys(cursor, keys):
+    """
+    汇总键 (site_id, 日期) -> 受影响的 (省份, YYYY-MM) 分区集合。
+    """
+    partitions = set()
+    for site_id, day in keys:
+        province = dims.site_name(cursor, site_id)[0]
+        if province:
+            partitions.add((province, day.strftime("%Y-%m")))
+    return partitions
+
+
+def _fetch_partition(cursor, province, month):
+    site_ids = dims.site_ids(cursor, province)
+    if not site_ids:
+        return pd.DataFrame(columns=SELECT_COLUMNS)
+    first, end = _month_bounds(month)
+    cursor.execute(
+        f"SELECT {', '.join(SELECT_COLUMNS)} FROM water_quality_data "
+        f"WHERE site_id IN ({', '.join(['%s'] * len(site_ids))}) AND monitoring_at >= %s AND monitoring_at < %s "
+        "ORDER BY site_id, monitoring_at, id",
+        list(site_ids) + [first, end]
+    )
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        rows = [[row[column] for column in SELECT_COLUMNS] for row in rows]
+    return pd.DataFrame(list(rows), columns=SELECT_COLUMNS)
+
+
+def _ids(series):
+    return [None if pd.isna(value) else int(value) for value in series]
+
+
+def _to_table(cursor, frame):
+    """
+    数据库行 -> 分区文件的 Arrow 表：维度 id 按缓存展开为名称，数值统一为 float64。
+    """
+    site_ids = _ids(frame["site_id"])
+    sites = {site_id: dims.site_name(cursor, site_id) for site_id in set(site_ids)}
+    pairs = list(zip(_ids(frame["category_id"]), _ids(frame["status_id"])))
+    labels = {pair: dims.decode(cursor, None, *pair) for pair in set(pairs)}
+    columns = {
+        "site_id": pd.array(site_ids, dtype="Int32"),
+        "river_basin": [sites[site_id][1] for site_id in site_ids],
+        "section_name": [sites[site_id][2] for site_id in site_ids],
+        "monitoring_time": frame["monitoring_time"],
+        "monitoring_at": pd.to_datetime(frame["monitoring_at"], errors="coerce").astype("datetime64[s]"),
+        "water_quality_category": [labels[pair]["water_quality_category"] for pair in pairs],
+    }
+    for name in INDICATORS:
+        columns[name] = pd.to_numeric(frame[name], errors="coerce").astype(float)
+    columns["site_status"] = [labels[pair]["site_status"] for pair in pairs]
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=SCHEMA, preserve_index=False)
+
+
+def write_partition(cursor, province, month, root=None):
+    """
+    从数据库重新生成一个分区，分区已没有数据时删除分区目录。返回写入的行数。
+    """
+    root = root or mirror_dir()
+    path = partition_path(root, province, month)
+    frame = _fetch_partition(cursor, province, month)
+    if frame.empty:
+        shutil.rmtree(path, ignore_errors=True)
+        return 0
+    table = _to_table(cursor, frame)
+    os.makedirs(path, exist_ok=True)
+    tmp_file = os.path.join(path, f".{PART_FILE}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp_file, compression="zstd")
+    os.replace(tmp_file, os.path.join(path, PART_FILE))
+    return table.num_rows
+
+
+def refresh_partitions(cursor, keys, root=None):
+    """
+    重写 keys 涉及的所有分区，返回重写的分区数。
+    """
+    partitions = partitions_for_keys(cursor, keys)
+    for province, month in sorted(partitions):
+        write_partition(cursor, province, month, root)
+    return len(partitions)
+
+
+def sync_partitions(connect, keys):
+    """
+    写入提交后调用：用 connect() 打开的连接读取已提交的数据并更新镜像。
+    未配置镜像目录或没有受影响的数据时什么也不做；失败时只打印错误，不影响调用方。
+    """
+    if not keys or not mirror_dir():
+        return 0
+    conn = None
+    try:
+        conn = connect()
+        return refresh_partitions(conn.cursor(), keys)
+    except Exception as e:
+        print(f"更新 Parquet 镜像失败，可运行 python water_parquet.py 重建: {e}")
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+
+def rebuild_mirror(cursor, root=None):
+    """
+    按每个断面的时间范围重新生成所有分区，并删除已不存在的分区。返回分区数。
+    """
+    root = root or mirror_dir()
+    cursor.execute(
+        "SELECT site_id, MIN(monitoring_at), MAX(monitoring_at) FROM water_quality_data "
+        "WHERE site_id IS NOT NULL AND monitoring_at IS NOT NULL GROUP BY site_id"
+    )
+    partitions = set()
+    for row in cursor.fetchall():
+        site_id, first, last = tuple(row.values()) if isinstance(row, dict) else tuple(row)
+        province = dims.site_name(cursor, site_id)[0]
+        month = pd.Period(to_date(first), freq="M")
+        while province and month <= pd.Period(to_date(last), freq="M"):
+            partitions.add((province, month.strftime("%Y-%m")))
+            month += 1
+
+    os.makedirs(root, exist_ok=True)
+    for province_dir in os.listdir(root):
+        if os.path.isdir(os.path.join(root, province_dir)):
+            for month_dir in os.listdir(os.path.join(root, province_dir)):
+                key = (province_dir.partition("=")[2], month_dir.partition("=")[2])
+                if key not in partitions:
+                    shutil.rmtree(os.path.join(root, province_dir, month_dir), ignore_errors=True)
+    for province, month in sorted(partitions):
+        write_partition(cursor, province, month, root)
+    return len(partitions)
+
+
+def ensure_mirror(engine):
+    """
+    镜像目录不存在时（首次启用）由数据库全量生成一次。
+    """
+    root = mirror_dir()
+    if not root or os.path.isdir(root):
+        return False
+    conn = engine.raw_connection()
+    try:
+        print("正在生成水质数据 Parquet 镜像...")
+        count = rebuild_mirror(conn.cursor(), root)
+        print(f"已生成 {count} 个分区")
+        return True
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from models import db
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    with app.app_context():
+        conn = db.engine.raw_connection()
+        try:
+            print(f"已生成 {rebuild_mirror(conn.cursor())} 个分区")
+        finally:
+            conn.close()
@@ -1,3 +1,21 @@
+CREATE TABLE water_site (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    province VARCHAR(255),
+    river_basin VARCHAR(255),
+    section_name VARCHAR(255),
+    UNIQUE KEY uq_water_site (province, river_basin, section_name)
+);
+
+CREATE TABLE water_category (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE water_site_status (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE
+);
+
 CREATE TABLE water_quality_data (
     id INT AUTO_INCREMENT PRIMARY KEY,
     province VARCHAR(255),
@@ -16,5 +34,79 @@ CREATE TABLE water_quality_data (
     total_nitrogen DECIMAL(10, 2),
     chlorophyll_a DECIMAL(10, 3),
     algae_density BIGINT,
-    site_status VARCHAR(255)
-);
\ No newline at end of file
+    site_status VARCHAR(255),
+    source_file VARCHAR(512),
+    monitoring_at DATETIME,
+    site_id INT,
+    category_id INT,
+    status_id INT,
+    INDEX ix_water_quality_data_source_file (source_file),
+    INDEX ix_water_site_time (province, river_basin, section_name, monitoring_at),
+    INDEX ix_water_site_id_time (site_id, monitoring_at),
+    INDEX ix_water_time (monitoring_at),
+    FOREIGN KEY (site_id) REFERENCES water_site (id),
+    FOREIGN KEY (category_id) REFERENCES water_category (id),
+    FOREIGN KEY (status_id) REFERENCES water_site_status (id)
+);
+
+CREATE TABLE water_rollup_daily (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    site_id INT NOT NULL,
+    period_start DATE NOT NULL,
+    indicator VARCHAR(32) NOT NULL,
+    min_value DOUBLE,
+    max_value DOUBLE,
+    sum_value DOUBLE,
+    value_count INT NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_water_rollup_daily (site_id, period_start, indicator),
+    FOREIGN KEY (site_id) REFERENCES water_site (id)
+);
+
+CREATE TABLE water_rollup_monthly (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    site_id INT NOT NULL,
+    period_start DATE NOT NULL,
+    indicator VARCHAR(32) NOT NULL,
+    min_value DOUBLE,
+    max_value DOUBLE,
+    sum_value DOUBLE,
+    value_count INT NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_water_rollup_monthly (site_id, period_start, indicator),
+    FOREIGN KEY (site_id) REFERENCES water_site (id)
+);
+
+CREATE TABLE water_anomaly_state (
+    site_id INT NOT NULL,
+    indicator VARCHAR(32) NOT NULL,
+    value_count INT NOT NULL DEFAULT 0,
+    ewma_mean DOUBLE,
+    ewma_variance DOUBLE,
+    last_at DATETIME,
+    PRIMARY KEY (site_id, indicator),
+    FOREIGN KEY (site_id) REFERENCES water_site (id)
+);
+
+CREATE TABLE water_anomaly (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    site_id INT NOT NULL,
+    monitoring_at DATETIME NOT NULL,
+    indicator VARCHAR(32) NOT NULL,
+    value DOUBLE NOT NULL,
+    method VARCHAR(16) NOT NULL,
+    score DOUBLE,
+    expected DOUBLE,
+    source_file VARCHAR(512),
+    INDEX ix_water_anomaly_site_time (site_id, monitoring_at),
+    INDEX ix_water_anomaly_time (monitoring_at),
+    INDEX ix_water_anomaly_source_file (source_file),
+    FOREIGN KEY (site_id) REFERENCES water_site (id)
+);
+
+CREATE TABLE water_snapshot (
+    snapshot_date DATE PRIMARY KEY,
+    body LONGBLOB NOT NULL,
+    etag VARCHAR(64) NOT NULL,
+    site_count INT NOT NULL DEFAULT 0,
+    row_count INT NOT NULL DEFAULT 0,
+    built_at DATETIME
+);
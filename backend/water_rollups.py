@@ -0,0 +1,276 @@
+"""
+水质指标的日/月汇总表（water_rollup_daily / water_rollup_monthly）。
+
+每行是一个 (断面 id, 周期起始日期, 指标) 的 min/max/sum/count，均值在查询时用 sum/count 计算，
+这样月汇总可以直接由日汇总合并得到，多个断面的汇总也可以继续合并。
+
+汇总是增量维护的：导入、上传以及增删改水质数据之后，在同一个事务中调用 refresh_rollups，
+只重新计算受影响的 (断面, 日期) 范围，再由日汇总重新合并出所在月份的月汇总。
+所有函数都使用 DB-API 游标（%s 占位符）。已有数据可以运行 python water_rollups.py 全量重建。
+"""
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+# 参与汇总的数值指标（water_quality_data 的列名）
+INDICATORS = (
+    "temperature", "ph", "dissolved_oxygen", "conductivity", "turbidity",
+    "permanganate_index", "ammonia_nitrogen", "total_phosphorus", "total_nitrogen",
+    "chlorophyll_a", "algae_density",
+)
+
+# 汇总粒度 -> 表名，按从细到粗排列
+ROLLUP_TABLES = {
+    "day": "water_rollup_daily",
+    "month": "water_rollup_monthly",
+}
+
+ROLLUP_COLUMNS = ("period_start", "indicator", "min_value", "max_value", "sum_value", "value_count")
+
+
+def to_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        return None
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def rollup_keys(pairs):
+    """
+    把 (site_id, 监测时间) 序列转换为受影响的 (site_id, 日期) 集合，跳过缺少断面或时间的行。
+    pairs 中的元素可以是元组或字典游标返回的行。
+    """
+    keys = set()
+    for pair in pairs:
+        if isinstance(pair, dict):
+            pair = (pair["site_id"], pair["monitoring_at"])
+        site_id, moment = pair
+        day = to_date(moment)
+        if site_id is not None and day is not None:
+            keys.add((site_id, day))
+    return keys
+
+
+def keys_for_source(cursor, source):
+    """
+    某个源文件导入的数据涉及的汇总键，在删除这些数据之前调用。
+    """
+    cursor.execute(
+        "SELECT DISTINCT site_id, monitoring_at FROM water_quality_data WHERE source_file = %s", (source,)
+    )
+    return rollup_keys(cursor.fetchall())
+
+
+def _fetch_frame(cursor, sql, params, columns):
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        rows = [[row[column] for column in columns] for row in rows]
+    return pd.DataFrame(list(rows), columns=columns)
+
+
+def _aggregate_readings(frame):
+    """
+    原始监测数据 -> 每天每个指标的 min/max/sum/count（长表）。
+    """
+    frame = frame.assign(period_start=pd.to_datetime(frame["monitoring_at"], errors="coerce").dt.normalize())
+    long = frame.melt(id_vars="period_start", value_vars=list(INDICATORS), var_name="indicator")
+    long = long.dropna(subset=["period_start", "value"])
+    long["value"] = long["value"].astype(float)
+    grouped = long.groupby(["period_start", "indicator"])["value"]
+    return grouped.agg(min_value="min", max_value="max", sum_value="sum", value_count="count").reset_index()
+
+
+def _merge_rollups(frame, by):
+    """
+    合并已有的汇总行（例如把日汇总合并为月汇总，或合并多个断面）。
+    """
+    grouped = frame.groupby(by)
+    return grouped.agg(
+        min_value=("min_value", "min"),
+        max_value=("max_value", "max"),
+        sum_value=("sum_value", "sum"),
+        value_count=("value_count", "sum"),
+    ).reset_index()
+
+
+def _replace_rollups(cursor, granularity, site_id, first, end, frame):
+    """
+    用 frame 替换某个断面在 [first, end) 范围内的汇总行。
+    """
+    table = ROLLUP_TABLES[granularity]
+    cursor.execute(
+        f"DELETE FROM {table} WHERE site_id = %s AND period_start >= %s AND period_start < %s",
+        (site_id, first, end)
+    )
+    if frame.empty:
+        return
+    rows = [
+        (site_id, period.date(), indicator, float(low), float(high), float(total), int(count))
+        for period, indicator, low, high, total, count in zip(
+            pd.to_datetime(frame["period_start"]), frame["indicator"], frame["min_value"],
+            frame["max_value"], frame["sum_value"], frame["value_count"]
+        )
+    ]
+    cursor.executemany(
+        f"INSERT INTO {table} (site_id, {', '.join(ROLLUP_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        rows
+    )
+
+
+def refresh_rollups(cursor, keys):
+    """
+    重新计算 keys（(site_id, 日期) 集合）涉及的日汇总和月汇总，不提交事务。
+    每个断面按受影响日期的最小值到最大值整段重算，再重算这些日期所在月份的月汇总。
+    """
+    by_site = {}
+    for site_id, day in keys:
+        by_site.setdefault(site_id, []).append(day)
+
+    for site_id, days in by_site.items():
+        first, last = min(days), max(days)
+        end = last + timedelta(days=1)
+        readings = _fetch_frame(
+            cursor,
+            f"SELECT monitoring_at, {', '.join(INDICATORS)} FROM water_quality_data "
+            "WHERE site_id = %s AND monitoring_at >= %s AND monitoring_at < %s",
+            (site_id, first, end),
+            ("monitoring_at",) + INDICATORS,
+        )
+        _replace_rollups(cursor, "day", site_id, first, end, _aggregate_readings(readings))
+
+        month_first, month_end = _month_start(first), _next_month(last)
+        daily = _fetch_frame(
+            cursor,
+            f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM water_rollup_daily "
+            "WHERE site_id = %s AND period_start >= %s AND period_start < %s",
+            (site_id, month_first, month_end),
+            ROLLUP_COLUMNS,
+        )
+        if not daily.empty:
+            daily["period_start"] = pd.to_datetime(daily["period_start"]).dt.to_period("M").dt.to_timestamp()
+            daily = _merge_rollups(daily, ["period_start", "indicator"])
+        _replace_rollups(cursor, "month", site_id, month_first, month_end, daily)
+
+
+def rebuild_rollups(cursor):
+    """
+    按每个断面的完整时间范围重建所有汇总，返回处理的断面数，不提交事务。
+    """
+    cursor.execute(
+        "SELECT site_id, MIN(monitoring_at), MAX(monitoring_at) FROM water_quality_data "
+        "WHERE site_id IS NOT NULL AND monitoring_at IS NOT NULL GROUP BY site_id"
+    )
+    ranges = [tuple(row.values()) if isinstance(row, dict) else tuple(row) for row in cursor.fetchall()]
+    for table in ROLLUP_TABLES.values():
+        cursor.execute(f"DELETE FROM {table}")
+    for site_id, first, last in ranges:
+        refresh_rollups(cursor, rollup_keys([(site_id, first), (site_id, last)]))
+    return len(ranges)
+
+
+def ensure_rollups(engine):
+    """
+    汇总表为空而水质数据已有断面 id 时（刚升级到带汇总表的版本）全量重建一次。
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM water_rollup_daily LIMIT 1")
+        if cursor.fetchall():
+            return False
+        cursor.execute("SELECT 1 FROM water_quality_data WHERE site_id IS NOT NULL LIMIT 1")
+        if not cursor.fetchall():
+            return False
+        print("正在重建水质指标日/月汇总...")
+        sites = rebuild_rollups(cursor)
+        conn.commit()
+        print(f"已重建 {sites} 个断面的汇总")
+        return True
+    finally:
+        conn.close()
+
+
+def choose_granularity(first, last, max_points):
+    """
+    在 [first, last] 范围内选择点数不超过 max_points 的最细粒度；都超过时使用最粗的月汇总。
+    """
+    days = (last - first).days + 1
+    if days <= max_points:
+        return "day"
+    return "month"
+
+
+def query_rollups(cursor, site_ids, granularity, indicators, first=None, last=None):
+    """
+    查询若干断面的汇总，多个断面按周期和指标合并。
+    返回 {指标: [{"period", "min", "max", "mean", "count"}, ...]}，按周期升序。
+    """
+    table = ROLLUP_TABLES[granularity]
+    conditions = [
+        f"site_id IN ({', '.join(['%s'] * len(site_ids))})",
+        f"indicator IN ({', '.join(['%s'] * len(indicators))})",
+    ]
+    params = list(site_ids) + list(indicators)
+    if first is not None:
+        conditions.append("period_start >= %s")
+        params.append(_month_start(first) if granularity == "month" else first)
+    if last is not None:
+        conditions.append("period_start <= %s")
+        params.append(last)
+    frame = _fetch_frame(
+        cursor,
+        f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM {table} WHERE {' AND '.join(conditions)}",
+        params,
+        ROLLUP_COLUMNS,
+    )
+    series = {indicator: [] for indicator in indicators}
+    if frame.empty:
+        return series
+    frame["period_start"] = pd.to_datetime(frame["period_start"])
+    frame = _merge_rollups(frame, ["indicator", "period_start"]).sort_values(["indicator", "period_start"])
+    for indicator, period, low, high, total, count in zip(
+        frame["indicator"], frame["period_start"], frame["min_value"],
+        frame["max_value"], frame["sum_value"], frame["value_count"]
+    ):
+        series[indicator].append({
+            "period": period.strftime("%Y-%m-%d" if granularity == "day" else "%Y-%m"),
+            "min": float(low),
+            "max": float(high),
+            "mean": float(total) / int(count) if count else None,
+            "count": int(count),
+        })
+    return series
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    import config
+    from models import db
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        conn = db.engine.raw_connection()
+        try:
+            sites = rebuild_rollups(conn.cursor())
+            conn.commit()
+            print(f"已重建 {sites} 个断面的汇总")
+        finally:
+            conn.close()
@@ -0,0 +1,198 @@
+"""
+断面层级和断面名称搜索的进程内索引（/api/water_sites、/api/water_sites/search），供省份 → 流域 → 断面选择器和输入提示使用。
+
+索引在启动时由 water_quality_data 中出现过的断面（DISTINCT site_id，走 ix_water_site_id_time 索引）建立，
+名称取自维度缓存（见 water_dims.py）。导入和新增数据提交后调用 add_sites 把新断面加入索引，不重建；
+多进程部署时其他进程新增的断面在 config.SITE_INDEX_RELOAD_SECONDS 秒后的下一次请求重新加载时出现
+（数据被全部删除的断面也在重新加载时移除）。
+
+搜索使用前缀树：每个断面名称以 原文、全拼、拼音首字母 三个键插入（统一转为小写并去掉空白），
+输入汉字、拼音或首字母都能按前缀匹配，例如 “长江”、“changjiang”、“cj”。查询只访问内存，不查询 MySQL。
+"""
+import heapq
+import itertools
+import threading
+import time
+import unicodedata
+
+from pypinyin import Style, lazy_pinyin, pinyin
+
+import config
+from water_dims import dims
+
+# 搜索结果的默认个数和上限
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 200
+# 查询中的多音字展开出的拼音组合个数上限
+QUERY_VARIANTS = 16
+
+
+def normalize(text):
+    """
+    全角转半角、转小写并去掉空白，索引键和查询使用同一种规范化。
+    """
+    return "".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def search_keys(name):
+    """
+    一个断面名称的索引键：原文、全拼（多音字按词语取最常用的读音）和拼音首字母，非汉字部分原样保留。
+    """
+    keys = {normalize(name)}
+    keys.add(normalize("".join(lazy_pinyin(name))))
+    keys.add(normalize("".join(lazy_pinyin(name, style=Style.FIRST_LETTER))))
+    keys.discard("")
+    return keys
+
+
+def query_prefixes(query):
+    """
+    查询的前缀：规范化后的原文，以及把其中的汉字按所有读音转为拼音的组合（查询没有词语上下文，
+    单独的 “长” 可能是 zhang 也可能是 chang），最多 QUERY_VARIANTS 个。
+    """
+    prefixes = {normalize(query)}
+    readings = pinyin(query, style=Style.NORMAL, heteronym=True)
+    for combination in itertools.islice(itertools.product(*readings), QUERY_VARIANTS):
+        prefixes.add(normalize("".join(combination)))
+    prefixes.discard("")
+    return prefixes
+
+
+class _TrieNode:
+    __slots__ = ("children", "site_ids")
+
+    def __init__(self):
+        self.children = {}
+        # 经过该节点的所有键所属的断面，前缀查询到达该节点后直接取这个集合
+        self.site_ids = set()
+
+
+class SiteIndex:
+    def __init__(self):
+        self.names = {}  # site_id -> (省份, 流域, 断面名称)
+        self.tree = {}  # 省份 -> 流域 -> set(断面名称)
+        self.root = _TrieNode()
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def _insert(self, site_id, names):
+        province, river_basin, section_name = names
+        self.names[site_id] = names
+        self.tree.setdefault(province, {}).setdefault(river_basin, set()).add(section_name)
+        for key in search_keys(section_name):
+            node = self.root
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+                node.site_ids.add(site_id)
+
+    def load(self, cursor):
+        """
+        由 water_quality_data 中出现过的断面重新建立整个索引。
+        """
+        cursor.execute("SELECT DISTINCT site_id FROM water_quality_data WHERE site_id IS NOT NULL")
+        site_ids = [tuple(row.values())[0] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+        dims.ensure_loaded(cursor)
+        if any(site_id not in dims.sites.by_id for site_id in site_ids):
+            dims.reload(cursor)
+        fresh = SiteIndex()
+        for site_id in site_ids:
+            names = dims.sites.by_id.get(site_id)
+            if names and all(names):
+                fresh._insert(site_id, names)
+        with self._lock:
+            self.names, self.tree, self.root = fresh.names, fresh.tree, fresh.root
+            self.loaded_at = time.monotonic()
+        return len(self.names)
+
+    def ensure_loaded(self, connect):
+        """
+        未加载或超过 SITE_INDEX_RELOAD_SECONDS 时用 connect() 打开的连接重新加载，否则不访问数据库。
+        """
+        reload_seconds = getattr(config, "SITE_INDEX_RELOAD_SECONDS", None)
+        if self.loaded_at is not None and (
+                not reload_seconds or time.monotonic() - self.loaded_at < reload_seconds):
+            return
+        conn = connect()
+        try:
+            self.load(conn.cursor())
+        finally:
+            conn.close()
+
+    def add_sites(self, site_ids):
+        """
+        写入提交后调用：把索引中还没有的断面加入索引（名称取自维度缓存，新断面在写入时已加入缓存）。
+        索引尚未加载时什么也不做，第一次请求时会完整加载。失败时只打印错误，不影响调用方。
+        """
+        if self.loaded_at is None:
+            return 0
+        added = 0
+        try:
+            with self._lock:
+                for site_id in site_ids:
+                    if site_id is None or site_id in self.names:
+                        continue
+                    names = dims.sites.by_id.get(site_id)
+                    if names and all(names):
+                        self._insert(site_id, names)
+                        added += 1
+        except Exception as e:
+            print(f"更新断面索引失败: {e}")
+        return added
+
+    def hierarchy(self, province=None, river_basin=None):
+        """
+        返回按名称排序的层级 [{"province", "basins": [{"river_basin", "sections": [...]}]}]，
+        给出 province / river_basin 时只返回该分支。
+        """
+        result = []
+        with self._lock:
+            for province_name in sorted(self.tree):
+                if province and province_name != province:
+                    continue
+                basins = self.tree[province_name]
+                result.append({
+                    "province": province_name,
+                    "basins": [
+                        {"river_basin": basin, "sections": sorted(basins[basin])}
+                        for basin in sorted(basins) if not river_basin or basin == river_basin
+                    ],
+                })
+        return result
+
+    def search(self, query, limit=SEARCH_DEFAULT_LIMIT, province=None):
+        """
+        断面名称前缀匹配（汉字、全拼或首字母），结果按 省份/流域/断面 排序，最多 limit 个。
+        查询中的汉字也会转为拼音再匹配一次，例如 “长jiang”。
+        """
+        prefixes = query_prefixes(query)
+        matched = set()
+        with self._lock:
+            for prefix in prefixes:
+                node = self.root
+                for char in prefix:
+                    node = node.children.get(char)
+                    if node is None:
+                        break
+                else:
+                    matched |= node.site_ids
+            names = heapq.nsmallest(limit, (
+                self.names[site_id] for site_id in matched
+                if not province or self.names[site_id][0] == province
+            ))
+        return [{"province": p, "river_basin": b, "section_name": s} for p, b, s in names]
+
+
+site_index = SiteIndex()
+
+
+def ensure_site_index(engine):
+    """
+    启动时（导入完成后）建立断面索引。
+    """
+    conn = engine.raw_connection()
+    try:
+        count = site_index.load(conn.cursor())
+        print(f"断面索引已建立: {count} 个断面")
+        return count
+    finally:
+        conn.close()
@@ -0,0 +1,217 @@
+"""
+全国按日快照：某一天所有断面的监测数据（/api/TimeWaterData?date=YYYY-MM-DD，取代旧版按天读取 JSON 文件的接口）。
+
+快照由 water_quality_data 按 monitoring_at 的索引（ix_water_time）取出当天的数据生成，
+按 省份/流域/断面 分组，每个断面的读数按时间排序，以 columns 中的列顺序保存为数组。
+生成的响应体是紧凑 JSON，连同 ETag 一起保存在 water_snapshot 表中，之后的请求只需按主键读取一行。
+
+只保存今天之前的日期（今天的数据还在陆续到达，每次请求实时查询）。过去的日期也可能补导入或修改数据，
+导入、上传和增删改提交之后，用受影响的汇总键 (site_id, 日期)（见 water_rollups.rollup_keys）
+调用 sync_snapshots 重新生成这些日期的快照；失败时只打印错误，可以运行 python water_snapshots.py 重建。
+config.WATER_SNAPSHOT_STORE 为 False 时不保存快照。
+"""
+import argparse
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pandas as pd
+
+import config
+from query_cache import etag_for
+from water_dims import dims
+from water_rollups import INDICATORS, to_date
+
+SELECT_COLUMNS = (
+    "site_id", "province", "river_basin", "section_name", "monitoring_time",
+    "category_id", "water_quality_category", "status_id", "site_status",
+) + INDICATORS
+# 每条读数数组中的列
+READING_COLUMNS = ("monitoring_time", "water_quality_category", "site_status") + INDICATORS
+SITE_COLUMNS = ("province", "river_basin", "section_name")
+
+
+def store_enabled():
+    return getattr(config, "WATER_SNAPSHOT_STORE", True)
+
+
+def storable(day):
+    return store_enabled() and day < date.today()
+
+
+def _fetch_day(cursor, day):
+    cursor.execute(
+        f"SELECT {', '.join(SELECT_COLUMNS)} FROM water_quality_data "
+        "WHERE monitoring_at >= %s AND monitoring_at < %s ORDER BY monitoring_at, id",
+        (day, day + timedelta(days=1))
+    )
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        rows = [[row[column] for column in SELECT_COLUMNS] for row in rows]
+    # object 类型保留 None 和整数，不转换为 NaN/浮点数
+    return pd.DataFrame(list(rows), columns=SELECT_COLUMNS, dtype=object)
+
+
+def _names(frame, cursor):
+    """
+    有维度 id 的行用维度缓存中的名称，否则保留名称列（非规范化存储的旧数据）。
+    """
+    dims.ensure_loaded(cursor)
+    missing = {
+        "site_id": set(frame["site_id"].dropna()) - set(dims.sites.by_id),
+        "category_id": set(frame["category_id"].dropna()) - set(dims.categories.by_id),
+        "status_id": set(frame["status_id"].dropna()) - set(dims.statuses.by_id),
+    }
+    if any(missing.values()):
+        dims.reload(cursor)
+    for i, column in enumerate(SITE_COLUMNS):
+        names = frame["site_id"].map(lambda site_id: dims.sites.by_id.get(site_id, (None,) * 3)[i])
+        frame[column] = names.where(names.notna(), frame[column])
+    for id_column, column, dim in (("category_id", "water_quality_category", dims.categories),
+                                   ("status_id", "site_status", dims.statuses)):
+        names = frame[id_column].map(lambda dim_id: dim.by_id.get(dim_id, (None,))[0])
+        frame[column] = names.where(names.notna(), frame[column])
+    return frame
+
+
+def build_snapshot(cursor, day):
+    """
+    查询某一天的数据并生成快照，返回 {"body", "etag", "site_count", "row_count"}。
+    """
+    frame = _names(_fetch_day(cursor, day), cursor)
+    for column in INDICATORS:
+        frame[column] = frame[column].map(lambda value: float(value) if isinstance(value, Decimal) else value)
+    # 稳定排序：同一断面的读数保持按时间的顺序
+    frame = frame.sort_values(list(SITE_COLUMNS), kind="stable", na_position="last")
+
+    sites = {}
+    readings = frame[list(READING_COLUMNS)].to_numpy(object).tolist()
+    for key, reading in zip(zip(*(frame[column] for column in SITE_COLUMNS)), readings):
+        site = sites.get(key)
+        if site is None:
+            site = sites[key] = dict(zip(SITE_COLUMNS, key), readings=[])
+        site["readings"].append(reading)
+
+    body = json.dumps({
+        "result": 1,
+        "date": day.isoformat(),
+        "total": len(sites),
+        "rows": len(frame),
+        "columns": list(READING_COLUMNS),
+        "sites": list(sites.values()),
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {"body": body, "etag": etag_for(body), "site_count": len(sites), "row_count": len(frame)}
+
+
+def _insert(cursor, day, snapshot):
+    cursor.execute(
+        "INSERT INTO water_snapshot (snapshot_date, body, etag, site_count, row_count, built_at) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        (day, snapshot["body"], snapshot["etag"], snapshot["site_count"], snapshot["row_count"], datetime.now())
+    )
+
+
+def _load(cursor, day):
+    cursor.execute("SELECT body, etag, site_count, row_count FROM water_snapshot WHERE snapshot_date = %s", (day,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    body, etag, site_count, row_count = tuple(row.values()) if isinstance(row, dict) else tuple(row)
+    return {"body": bytes(body), "etag": etag, "site_count": site_count, "row_count": row_count}
+
+
+def get_snapshot(connect, day):
+    """
+    返回某一天的快照。已保存时直接读取；否则实时生成，今天之前的日期生成后保存。
+    其他请求同时保存了同一天时插入会因主键冲突失败，忽略即可（不会覆盖写入后 sync_snapshots 生成的新快照）。
+    """
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        if storable(day):
+            snapshot = _load(cursor, day)
+            if snapshot is not None:
+                return snapshot
+        snapshot = build_snapshot(cursor, day)
+        if storable(day):
+            try:
+                _insert(cursor, day, snapshot)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"保存 {day} 的按日快照失败: {e}")
+        return snapshot
+    finally:
+        conn.close()
+
+
+def refresh_snapshots(conn, days):
+    """
+    重新生成这些日期的快照（今天及以后的日期只删除），每个日期单独提交。返回重新生成的个数。
+    """
+    cursor = conn.cursor()
+    built = 0
+    for day in sorted(days):
+        cursor.execute("DELETE FROM water_snapshot WHERE snapshot_date = %s", (day,))
+        if storable(day):
+            _insert(cursor, day, build_snapshot(cursor, day))
+            built += 1
+        conn.commit()
+    return built
+
+
+def sync_snapshots(connect, keys):
+    """
+    写入提交后调用：用 connect() 打开的连接重新生成受影响日期的快照。
+    没有受影响的数据或不保存快照时什么也不做；失败时只打印错误，不影响调用方。
+    """
+    if not keys or not store_enabled():
+        return 0
+    conn = None
+    try:
+        conn = connect()
+        return refresh_snapshots(conn, {day for _, day in keys})
+    except Exception as e:
+        print(f"更新按日快照失败，可运行 python water_snapshots.py 重建: {e}")
+        if conn:
+            conn.rollback()
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+
+def build_snapshots(conn, rebuild=False):
+    """
+    为所有有数据的过去日期预先生成快照。rebuild=False 时跳过已保存的日期；
+    为 True 时清空快照表后全部重新生成。返回生成的个数。
+    """
+    cursor = conn.cursor()
+    if rebuild:
+        cursor.execute("DELETE FROM water_snapshot")
+        conn.commit()
+    cursor.execute("SELECT DISTINCT DATE(monitoring_at) FROM water_quality_data WHERE monitoring_at IS NOT NULL")
+    days = {to_date(tuple(row.values())[0] if isinstance(row, dict) else row[0]) for row in cursor.fetchall()}
+    cursor.execute("SELECT snapshot_date FROM water_snapshot")
+    existing = {to_date(tuple(row.values())[0] if isinstance(row, dict) else row[0]) for row in cursor.fetchall()}
+    return refresh_snapshots(conn, {day for day in days - existing if day is not None and storable(day)})
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from models import db
+
+    parser = argparse.ArgumentParser(description="预先生成全国按日快照")
+    parser.add_argument("--rebuild", action="store_true", help="清空后重新生成所有日期（默认只生成缺少的日期）")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        conn = db.engine.raw_connection()
+        try:
+            print(f"已生成 {build_snapshots(conn, rebuild=args.rebuild)} 天的快照")
+        finally:
+            conn.close()
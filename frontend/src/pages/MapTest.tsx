@@ -202,7 +202,8 @@ const MapTest: React.FC = () => {
     const fetchData = async () => {
       try {
         // 使用封装的服务获取地图数据
-        const usaGeoJson = await getJsonData('china');
+        // 全国视图使用简化后的地图（见 backend/geo_tiers.py）
+        const usaGeoJson = await getJsonData('china', 'low');
 
         echarts.registerMap('china', usaGeoJson);
         // const projection = d3.geoAlbersUsa(); // 未用到可移除
@@ -25,6 +25,48 @@ export const getWaterDataByName = async (
   }
 };
 
+/**
+ * 获取断面层级（省份 → 流域 → 断面），可只取某个省份或流域
+ */
+export const getWaterSites = async (province?: string, basin?: string) => {
+  try {
+    const response = await axiosInstance.get('/api/water_sites', {
+      params: { province, basin },
+    });
+    return response.data.provinces;
+  } catch (error) {
+    console.error('Failed to fetch water sites:', error);
+    throw error;
+  }
+};
+
+/**
+ * 断面名称输入提示，q 可以是汉字、全拼或拼音首字母
+ */
+export const searchWaterSites = async (q: string, province?: string, limit = 20) => {
+  try {
+    const response = await axiosInstance.get('/api/water_sites/search', {
+      params: { q, province, limit },
+    });
+    return response.data.sites;
+  } catch (error) {
+    console.error('Failed to search water sites:', error);
+    throw error;
+  }
+};
+
+/**
+ * 水质数据导出的下载地址（CSV 或 Parquet），交给浏览器直接下载，数据量大时不经过 axios 缓存在内存中
+ */
+export const getWaterExportUrl = (params: {
+  format?: 'csv' | 'parquet';
+  province?: string;
+  basin?: string;
+  site?: string;
+  start?: string;
+  end?: string;
+}) => axiosInstance.getUri({ url: '/api/waterdata_export', params });
+
 /**
  * 获取指定日期的视频数据
  * @param date - 日期 (YYYY-MM-DD)
@@ -42,9 +84,14 @@ export const getVideosByDate = async (date: string) => {
 };
 
 
-export const getJsonData = async (mapName: string) => {
+/**
+ * 获取 data 目录下的 JSON 文件；地图 GeoJSON 可以用 detail（low/medium/high/full）取简化版本
+ */
+export const getJsonData = async (mapName: string, detail?: 'low' | 'medium' | 'high' | 'full') => {
   try {
-    const response = await axiosInstance.get(`/data/${mapName}.json`);
+    const response = await axiosInstance.get(`/data/${mapName}.json`, {
+      params: detail ? { detail } : undefined,
+    });
     return response.data;
   } catch (error) {
     console.error(`Failed to fetch map data for ${mapName}:`, error);